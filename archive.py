@@ -0,0 +1,267 @@
+"""
+Архивирование старых данных и резервное копирование bot.db.
+
+Строки старше горизонта (ARCHIVE_AFTER_DAYS) переносятся небольшими пачками
+в помесячные архивные базы (archive/bot-ГГГГ-ММ.db), подключаемые через ATTACH,
+после чего освободившиеся страницы возвращаются инкрементальным VACUUM.
+Снимок базы делается через VACUUM INTO из одной читающей транзакции, поэтому
+запись в основную базу во время копирования его не перезапускает.
+
+Инкрементальный VACUUM работает только в режиме auto_vacuum = INCREMENTAL.
+Переход в него требует полного VACUUM, который блокирует базу на все время
+перезаписи, поэтому выполняется отдельно, при остановленном боте:
+
+    python archive.py enable-incremental-vacuum
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sqlite3
+from typing import Dict, List, Tuple
+
+from config import (
+    DATABASE_PATH, ARCHIVE_DIR, ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, BACKUP_PATH
+)
+
+logger = logging.getLogger(__name__)
+
+# Архивируемые таблицы: (таблица, колонка времени, дополнительное условие,
+# зависимые таблицы [(таблица, колонка ссылки)]). Завершенные платежи тоже уходят
+# в архив: признак оплаты для приоритета хранится в users.has_paid
+ARCHIVED_TABLES = [
+    ('support_messages', 'created_at', '', []),
+    ('payments', 'created_at', '', []),
+    ('analyses', 'created_at', '', [('analysis_blobs', 'analysis_id')]),
+    ('analysis_jobs', 'updated_at', "status IN ('delivered', 'failed')", []),
+]
+
+# Страниц, возвращаемых инкрементальным VACUUM за один запуск
+INCREMENTAL_VACUUM_PAGES = 10000
+
+# SQLite: auto_vacuum = INCREMENTAL
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+class Archiver:
+    """Перенос старых строк в помесячные архивы, обслуживание и резервная копия базы"""
+
+    def __init__(self, db_path: str = DATABASE_PATH, archive_dir: str = ARCHIVE_DIR,
+                 after_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE,
+                 backup_path: str = BACKUP_PATH):
+        self.db_path = db_path
+        self.archive_dir = archive_dir
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self.backup_path = backup_path
+
+    def archive_path(self, month: str) -> str:
+        return os.path.join(self.archive_dir, f"bot-{month}.db")
+
+    def _columns(self, conn: sqlite3.Connection, schema: str, table: str) -> List[str]:
+        return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+    def _prepare_archive_table(self, conn: sqlite3.Connection, table: str) -> List[str]:
+        """Создать таблицу в подключенном архиве и дополнить ее колонками, добавленными миграциями"""
+        columns = self._columns(conn, 'main', table)
+        archived = self._columns(conn, 'archive', table)
+        if not archived:
+            conn.execute(f"CREATE TABLE archive.{table} AS SELECT * FROM main.{table} WHERE 0")
+            conn.execute(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS archive.idx_{table}_{columns[0]} ON {table} ({columns[0]})"
+            )
+        else:
+            for column in columns:
+                if column not in archived:
+                    conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {column}")
+        return columns
+
+    def _move_rows(self, conn: sqlite3.Connection, table: str, key: str, ids: List[int]):
+        """Скопировать строки в архив и удалить из основной базы"""
+        columns = ", ".join(self._prepare_archive_table(conn, table))
+        placeholders = ", ".join("?" * len(ids))
+        conn.execute(
+            f"INSERT OR IGNORE INTO archive.{table} ({columns}) "
+            f"SELECT {columns} FROM main.{table} WHERE {key} IN ({placeholders})",
+            ids
+        )
+        conn.execute(f"DELETE FROM main.{table} WHERE {key} IN ({placeholders})", ids)
+
+    def _next_batch(self, conn: sqlite3.Connection, table: str, time_column: str,
+                    condition: str) -> List[Tuple[int, str]]:
+        # Строки добавляются по времени, поэтому старые лежат в начале первичного ключа
+        where = f"{time_column} < datetime('now', ?)"
+        if condition:
+            where += f" AND {condition}"
+        return conn.execute(
+            f"SELECT id, strftime('%Y-%m', {time_column}) FROM {table} "
+            f"WHERE {where} ORDER BY id LIMIT ?",
+            (f'-{self.after_days} days', self.batch_size)
+        ).fetchall()
+
+    def archive_old_rows(self) -> Dict[str, int]:
+        """
+        Перенести строки старше горизонта в помесячные архивы
+
+        Каждая пачка переносится отдельной транзакцией, чтобы не держать
+        блокировку записи основной базы дольше, чем нужно на одну пачку.
+
+        Returns:
+            Dict[str, int]: количество перенесенных строк по таблицам
+        """
+        os.makedirs(self.archive_dir, exist_ok=True)
+        moved = {}
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            for table, time_column, condition, children in ARCHIVED_TABLES:
+                moved[table] = 0
+                while True:
+                    batch = self._next_batch(conn, table, time_column, condition)
+                    if not batch:
+                        break
+
+                    by_month: Dict[str, List[int]] = {}
+                    for row_id, month in batch:
+                        by_month.setdefault(month or 'unknown', []).append(row_id)
+
+                    for month, ids in by_month.items():
+                        conn.execute("ATTACH DATABASE ? AS archive", (self.archive_path(month),))
+                        try:
+                            conn.execute("BEGIN IMMEDIATE")
+                            try:
+                                for child, reference in children:
+                                    self._move_rows(conn, child, reference, ids)
+                                self._move_rows(conn, table, 'id', ids)
+                                conn.execute("COMMIT")
+                            except Exception:
+                                conn.execute("ROLLBACK")
+                                raise
+                        finally:
+                            conn.execute("DETACH DATABASE archive")
+
+                    moved[table] += len(batch)
+                    if len(batch) < self.batch_size:
+                        break
+
+                if moved[table]:
+                    logger.info(f"Перенесено в архив из {table}: {moved[table]} строк")
+        finally:
+            conn.close()
+        return moved
+
+    def enable_incremental_vacuum(self) -> bool:
+        """
+        Перевести базу в режим auto_vacuum = INCREMENTAL
+
+        Режим меняется только полным VACUUM, который блокирует базу на все время
+        перезаписи файла: запускается вручную при остановленном боте.
+
+        Returns:
+            bool: True, если режим пришлось менять
+        """
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+                return False
+            logger.info("Перевод базы в режим auto_vacuum = INCREMENTAL (полный VACUUM)")
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            return True
+        finally:
+            conn.close()
+
+    def vacuum(self):
+        """Вернуть свободные страницы файлу и обновить статистику планировщика"""
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+                freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                if freelist:
+                    conn.execute(f"PRAGMA incremental_vacuum({INCREMENTAL_VACUUM_PAGES})")
+                    logger.info(f"Инкрементальный VACUUM: свободных страниц было {freelist}")
+            else:
+                # Полный VACUUM в фоне заблокировал бы бота: только напоминаем о ручном шаге
+                logger.info(
+                    "Инкрементальный VACUUM выключен: выполните "
+                    "python archive.py enable-incremental-vacuum при остановленном боте"
+                )
+            conn.execute("PRAGMA optimize")
+        finally:
+            conn.close()
+
+    def backup(self) -> bool:
+        """
+        Снимок базы через VACUUM INTO
+
+        Копия собирается из одной читающей транзакции: запись из других
+        соединений не перезапускает копирование, как у пошагового backup API.
+        Снимок пишется во временный файл и заменяет предыдущий только после
+        успешного завершения.
+        """
+        if not self.backup_path:
+            return False
+
+        directory = os.path.dirname(self.backup_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = self.backup_path + ".tmp"
+        try:
+            # VACUUM INTO не перезаписывает существующий файл
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            source = sqlite3.connect(self.db_path, isolation_level=None)
+            try:
+                source.execute("VACUUM INTO ?", (temporary,))
+            finally:
+                source.close()
+            os.replace(temporary, self.backup_path)
+            logger.info(f"Резервная копия базы сохранена: {self.backup_path}")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка резервного копирования базы: {e}")
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+            return False
+
+    def run(self) -> Dict[str, int]:
+        """Полный цикл обслуживания: архив, VACUUM, резервная копия"""
+        moved = {}
+        try:
+            moved = self.archive_old_rows()
+        except Exception as e:
+            logger.error(f"Ошибка архивирования: {e}")
+        try:
+            self.vacuum()
+        except Exception as e:
+            logger.error(f"Ошибка обслуживания базы: {e}")
+        self.backup()
+        return moved
+
+    async def run_periodically(self, interval: float):
+        """Запускать обслуживание в отдельном потоке, не блокируя event loop"""
+        while True:
+            await asyncio.to_thread(self.run)
+            await asyncio.sleep(interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Обслуживание базы AiRidder Bot")
+    parser.add_argument("command", choices=["enable-incremental-vacuum", "run"],
+                        help="enable-incremental-vacuum - однократный полный VACUUM (бот должен быть остановлен); "
+                             "run - архив, инкрементальный VACUUM и резервная копия")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    archiver = Archiver()
+    if args.command == "enable-incremental-vacuum":
+        if not archiver.enable_incremental_vacuum():
+            logger.info("База уже в режиме auto_vacuum = INCREMENTAL")
+    else:
+        archiver.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,33 @@
 import logging
 import asyncio
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 from telegram import Update, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
-from database import Database
-from config import TELEGRAM_BOT_TOKEN, ADMIN_USER_ID, MESSAGES, TARIFFS, MAX_TEXT_LENGTH, YOOMONEY_TOKEN, YOOMONEY_WALLET
-from roles import ROLES
+from database import (
+    Database, PAYMENT_COMPLETED, PAYMENT_ALREADY_COMPLETED, PRIORITY_ADMIN, PRIORITY_PAID, PRIORITY_FREE
+)
+from config import TELEGRAM_BOT_TOKEN, ADMIN_USER_ID, MAX_TEXT_LENGTH, YOOMONEY_TOKEN, YOOMONEY_WALLET, DIAGNOSTICS_ENABLED, MAX_DOCUMENT_SIZE, DOCUMENT_WORKERS, DATABASE_PATH, HISTORY_PAGE_SIZE, HISTORY_PRUNE_INTERVAL, ARCHIVE_ENABLED, ARCHIVE_INTERVAL, TEXTSTATS_SHOW_USER, TELEGRAM_POOL_SIZE
+from catalog import catalog, credits_text, ALL_ROLES_BUTTON, BACK_BUTTON
 from deepseek_api import deepseek_api
 from payment import PaymentManager
+import diagnostics
+import http_pool
+from extractors import extract_text, SUPPORTED_EXTENSIONS
+from text_buffer import TextAccumulator, TextBuffer
+from jobs import AnalysisWorker
+from archive import Archiver
+from revisions import RevisionAnalyzer
+from router import (
+    Router, encode_callback, OP_BUY, OP_CHECK, OP_CANCEL, OP_HISTORY_PAGE, OP_HISTORY_OPEN,
+    OP_HISTORY_TEXT, OP_REANALYZE
+)
+from similarity import signature as text_signature
+import proofcheck
+import textstats
 import tiktoken
 
 # Настройка логирования
@@ -17,26 +38,51 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Инициализация базы данных
-db = Database()
+db = Database(DATABASE_PATH)
 
 # Инициализация менеджера платежей
-payment_manager = PaymentManager(YOOMONEY_TOKEN, YOOMONEY_WALLET)
+payment_manager = PaymentManager(YOOMONEY_TOKEN, YOOMONEY_WALLET, db=db)
 
 # Состояния пользователей
 user_states = {}
 
+# Пул процессов для извлечения текста из документов (создается при первой загрузке)
+document_executor = None
+
+# Кнопки главного меню
+BUTTON_ROLES = '👤 Роли'
+BUTTON_PURCHASE = '💳 Купить анализы'
+BUTTON_BALANCE = '💰 Мой баланс'
+BUTTON_SUPPORT = '🆘 Поддержка'
+BUTTON_ABOUT = 'ℹ️ О сервисе'
+BUTTON_HISTORY = '📜 История'
+
+# Кнопки ожидания текста
+BUTTON_DONE = '✅ Готово'
+BUTTON_MAIN_MENU = '🔙 Назад в меню'
+
 # Главное меню
 MAIN_MENU = [
-    ['👤 Роли', '💳 Купить анализы'],
-    ['💰 Мой баланс', '🆘 Поддержка'],
-    ['ℹ️ О сервисе']
+    [BUTTON_ROLES, BUTTON_PURCHASE],
+    [BUTTON_BALANCE, BUTTON_SUPPORT],
+    [BUTTON_ABOUT, BUTTON_HISTORY]
 ]
 
-# Меню ролей
-ROLES_MENU = [
-    ['📖 Бета-ридер', '✏️ Корректор'],
-    ['📝 Редактор', '🔙 Назад']
-]
+# Псевдо-роль для анализа текста всеми ролями сразу
+ALL_ROLES_KEY = 'all'
+
+# Клавиатура ожидания текста
+TEXT_INPUT_MENU = [[BUTTON_DONE, BUTTON_MAIN_MENU]]
+
+# Клавиатуры создаются один раз и переиспользуются (меню ролей и тарифов - в снимке каталога)
+MAIN_MENU_MARKUP = ReplyKeyboardMarkup(MAIN_MENU, resize_keyboard=True)
+TEXT_INPUT_MARKUP = ReplyKeyboardMarkup(TEXT_INPUT_MENU, resize_keyboard=True)
+
+# Сообщения длиннее этого порога, скорее всего, часть текста, разбитого Telegram
+SPLIT_MESSAGE_THRESHOLD = 4000
+
+# Подписи классов приоритета в /cache_stats
+PRIORITY_LABELS = {PRIORITY_ADMIN: "Администратор", PRIORITY_PAID: "Оплатившие", PRIORITY_FREE: "Пробные"}
 
 class BotStates:
     MAIN_MENU = "main_menu"
@@ -44,6 +90,9 @@ class BotStates:
     WAITING_FOR_TEXT = "waiting_for_text"
     WAITING_FOR_SUPPORT_MESSAGE = "waiting_for_support_message"
 
+# Таблицы обработчиков кнопок по состояниям и callback-запросов
+router = Router()
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
     user = update.effective_user
@@ -68,119 +117,151 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_states[user_id] = BotStates.MAIN_MENU
     
     # Отправляем приветствие с главным меню
-    reply_markup = ReplyKeyboardMarkup(MAIN_MENU, resize_keyboard=True)
+    reply_markup = MAIN_MENU_MARKUP
     await update.message.reply_text(
-        MESSAGES['welcome'],
+        catalog.text('welcome'),
         reply_markup=reply_markup
     )
 
-async def handle_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработчик главного меню"""
-    user_id = update.effective_user.id
-    text = update.message.text
-    
-    db.update_user_activity(user_id)
-    
-    if text == '👤 Роли':
-        # Переходим к выбору роли
-        user_states[user_id] = BotStates.ROLE_SELECTION
-        reply_markup = ReplyKeyboardMarkup(ROLES_MENU, resize_keyboard=True)
-        await update.message.reply_text(
-            MESSAGES['choose_role'],
-            reply_markup=reply_markup
-        )
-    
-    elif text == '💳 Купить анализы':
-        await show_purchase_menu(update, context)
-    
-    elif text == '💰 Мой баланс':
-        credits = db.get_user_credits(user_id)
-        purchase_suggestion = MESSAGES['purchase_suggestion'] if credits < 3 else ""
-        await update.message.reply_text(
-            MESSAGES['balance'].format(
-                credits=credits,
-                purchase_suggestion=purchase_suggestion
-            )
+@router.button(BotStates.MAIN_MENU, BUTTON_ROLES)
+async def show_roles_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Переход к выбору роли"""
+    user_states[update.effective_user.id] = BotStates.ROLE_SELECTION
+    reply_markup = catalog.current().roles_menu_markup
+    await update.message.reply_text(
+        catalog.text('choose_role'),
+        reply_markup=reply_markup
+    )
+
+@router.button(BotStates.MAIN_MENU, BUTTON_BALANCE)
+async def show_balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показать баланс пользователя"""
+    credits = db.get_user_credits(update.effective_user.id)
+    purchase_suggestion = catalog.text('purchase_suggestion') if credits < 3 else ""
+    await update.message.reply_text(
+        catalog.text(
+            'balance',
+            credits=credits,
+            purchase_suggestion=purchase_suggestion
         )
-    
-    elif text == '🆘 Поддержка':
-        user_states[user_id] = BotStates.WAITING_FOR_SUPPORT_MESSAGE
-        await update.message.reply_text(MESSAGES['support_request'])
-    
-    elif text == 'ℹ️ О сервисе':
-        await update.message.reply_text(MESSAGES['about'])
+    )
+
+@router.button(BotStates.MAIN_MENU, BUTTON_SUPPORT)
+async def request_support_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Переход к вводу сообщения в поддержку"""
+    user_states[update.effective_user.id] = BotStates.WAITING_FOR_SUPPORT_MESSAGE
+    await update.message.reply_text(catalog.text('support_request'))
+
+@router.button(BotStates.MAIN_MENU, BUTTON_ABOUT)
+async def show_about(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Информация о сервисе"""
+    await update.message.reply_text(catalog.text('about'))
 
+@router.button(BotStates.ROLE_SELECTION, BACK_BUTTON)
+async def back_to_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Возврат в главное меню"""
+    user_states[update.effective_user.id] = BotStates.MAIN_MENU
+    reply_markup = MAIN_MENU_MARKUP
+    await update.message.reply_text(
+        "Главное меню:",
+        reply_markup=reply_markup
+    )
+
+@router.button(BotStates.ROLE_SELECTION, ALL_ROLES_BUTTON)
+async def select_all_roles(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Выбор анализа всеми ролями"""
+    context.user_data['selected_role'] = ALL_ROLES_KEY
+    user_states[update.effective_user.id] = BotStates.WAITING_FOR_TEXT
+    snapshot = catalog.current()
+    cost = len(snapshot.roles)
+    await update.message.reply_text(
+        snapshot.text(
+            'multi_role_selected',
+            roles=snapshot.role_names, cost=cost, cost_text=credits_text(cost),
+            max_length=MAX_TEXT_LENGTH
+        ),
+        reply_markup=TEXT_INPUT_MARKUP
+    )
+
+@router.fallback(BotStates.ROLE_SELECTION)
 async def handle_role_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик выбора роли"""
-    user_id = update.effective_user.id
-    text = update.message.text
-    
-    db.update_user_activity(user_id)
-    
-    if text == '🔙 Назад':
-        # Возвращаемся в главное меню
-        user_states[user_id] = BotStates.MAIN_MENU
-        reply_markup = ReplyKeyboardMarkup(MAIN_MENU, resize_keyboard=True)
-        await update.message.reply_text(
-            "Главное меню:",
-            reply_markup=reply_markup
-        )
-        return
-    
-    # Определяем выбранную роль
-    role_key = None
-    if text == '📖 Бета-ридер':
-        role_key = 'beta_reader'
-    elif text == '✏️ Корректор':
-        role_key = 'proofreader'
-    elif text == '📝 Редактор':
-        role_key = 'editor'
+    # Кнопки ролей задаются каталогом, роль определяется поиском в его словаре
+    snapshot = catalog.current()
+    role_key = snapshot.role_by_button.get(update.message.text)
     
     if role_key:
         # Сохраняем выбранную роль в контексте пользователя
         context.user_data['selected_role'] = role_key
-        user_states[user_id] = BotStates.WAITING_FOR_TEXT
+        user_states[update.effective_user.id] = BotStates.WAITING_FOR_TEXT
         
         # Убираем клавиатуру и просим отправить текст
         await update.message.reply_text(
-            MESSAGES['role_selected'].format(
-                role=ROLES[role_key]['name'],
+            catalog.text(
+                'role_selected',
+                role=snapshot.role_name(role_key),
                 max_length=MAX_TEXT_LENGTH
             ),
-            reply_markup=ReplyKeyboardMarkup([['🔙 Назад в меню']], resize_keyboard=True)
+            reply_markup=TEXT_INPUT_MARKUP
         )
 
+@router.button(BotStates.WAITING_FOR_TEXT, BUTTON_MAIN_MENU)
+async def leave_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Возврат в главное меню, накопленный текст отбрасывается"""
+    user_id = update.effective_user.id
+    text_accumulator.discard(user_id)
+    user_states[user_id] = BotStates.MAIN_MENU
+    reply_markup = MAIN_MENU_MARKUP
+    await update.message.reply_text(
+        "Главное меню:",
+        reply_markup=reply_markup
+    )
+
+@router.button(BotStates.WAITING_FOR_TEXT, BUTTON_DONE)
+async def finish_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Немедленная отправка накопленного текста на анализ"""
+    if not await text_accumulator.flush(update.effective_user.id):
+        await update.message.reply_text(catalog.text('text_buffer_empty'))
+
+@router.fallback(BotStates.WAITING_FOR_TEXT)
 async def handle_text_analysis(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик анализа текста"""
     user_id = update.effective_user.id
     text = update.message.text
     
-    db.update_user_activity(user_id)
-    
-    if text == '🔙 Назад в меню':
-        # Возвращаемся в главное меню
-        user_states[user_id] = BotStates.MAIN_MENU
-        reply_markup = ReplyKeyboardMarkup(MAIN_MENU, resize_keyboard=True)
+    # Длинный текст Telegram присылает несколькими сообщениями: копим их
+    # и отправляем на анализ одним заданием после паузы или по кнопке «Готово»
+    first_part = not text_accumulator.has_pending(user_id)
+    text_accumulator.add(user_id, text, update, context)
+    if first_part and len(text) >= SPLIT_MESSAGE_THRESHOLD:
         await update.message.reply_text(
-            "Главное меню:",
-            reply_markup=reply_markup
+            catalog.text('text_buffering'),
+            reply_markup=TEXT_INPUT_MARKUP
         )
+
+async def process_buffered_text(update: Update, context: ContextTypes.DEFAULT_TYPE, buffer: TextBuffer):
+    """Анализ текста, накопленного из нескольких сообщений"""
+    if buffer.overflow:
+        await update.message.reply_text(catalog.text('text_too_long', length=buffer.length))
         return
     
-    # Проверяем длину текста и токены
-    is_valid, error_message = deepseek_api.validate_text_length(text)
+    if buffer.parts > 1:
+        logger.info(f"Текст пользователя {update.effective_user.id} собран из {buffer.parts} сообщений")
+    await process_text(update, context, buffer.text())
+
+# Буфер сообщений пользователей, ожидающих анализа
+text_accumulator = TextAccumulator(process_buffered_text)
+
+async def process_text(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    """Проверка текста, резервирование кредитов и постановка анализа в очередь"""
+    user_id = update.effective_user.id
+    
+    # Проверяем длину текста и токены (токенизация выполняется один раз)
+    is_valid, error_message, text_tokens = deepseek_api.measure_text(text)
     if not is_valid:
         await update.message.reply_text(f"❌ {error_message}")
         return
     
-    # Проверяем баланс пользователя
-    credits = db.get_user_credits(user_id)
-    if credits < 1:
-        await update.message.reply_text(
-            MESSAGES['no_credits'].format(credits=credits)
-        )
-        return
-    
     # Получаем выбранную роль
     selected_role = context.user_data.get('selected_role')
     if not selected_role:
@@ -188,96 +269,542 @@ async def handle_text_analysis(update: Update, context: ContextTypes.DEFAULT_TYP
             "Ошибка: роль не выбрана. Пожалуйста, выберите роль заново."
         )
         user_states[user_id] = BotStates.ROLE_SELECTION
-        reply_markup = ReplyKeyboardMarkup(ROLES_MENU, resize_keyboard=True)
+        reply_markup = catalog.current().roles_menu_markup
         await update.message.reply_text(
-            MESSAGES['choose_role'],
+            catalog.text('choose_role'),
             reply_markup=reply_markup
         )
         return
     
-    # Отправляем сообщение о начале анализа
-    await update.message.reply_text(
-        MESSAGES['analyzing'].format(
-            role=ROLES[selected_role]['name'],
-            length=len(text)
-        )
-    )
-    
-    # Выполняем анализ через DeepSeek API
-    try:
-        analysis_result, tokens_used = await deepseek_api.analyze_text(selected_role, text)
-        
-        if analysis_result is None:
+    # Сигнатура текста для поиска похожих прошлых отправок (считается вне event loop)
+    signature = await asyncio.to_thread(text_signature, text)
+    if signature and selected_role != ALL_ROLES_KEY:
+        similar = db.find_similar_analysis(user_id, selected_role, signature)
+        if similar:
+            # Текст почти совпадает с уже проверенным: предлагаем прошлый отчет без списания кредита
+            context.user_data['pending_analysis'] = (selected_role, text, text_tokens, signature)
+            keyboard = [
+                [InlineKeyboardButton(
+                    "📜 Прошлый отчет (бесплатно)",
+                    callback_data=encode_callback(OP_HISTORY_OPEN, similar['analysis_id'])
+                )],
+                [InlineKeyboardButton("🔄 Новый анализ", callback_data=encode_callback(OP_REANALYZE))],
+            ]
             await update.message.reply_text(
-                "❌ Не удалось выполнить анализ. Возможно, текст слишком длинный или произошла ошибка API."
+                catalog.text(
+                    'similar_found',
+                    similarity=similar['similarity'],
+                    date=format_history_date(similar['created_at']),
+                    role=catalog.role_name(selected_role)
+                ),
+                reply_markup=InlineKeyboardMarkup(keyboard)
             )
             return
-        
-        # Списываем кредит только при успешном анализе
-        if db.spend_credit(user_id):
-            # Сохраняем информацию об анализе
-            db.save_analysis(user_id, selected_role, len(text), tokens_used)
-            
-            # Отправляем результат анализа
-            # Разбиваем длинный результат на части, если необходимо
-            max_message_length = 4096
-            if len(analysis_result) <= max_message_length:
-                await update.message.reply_text(analysis_result)
-            else:
-                # Разбиваем на части
-                parts = []
-                current_part = ""
-                lines = analysis_result.split('\n')
-                
-                for line in lines:
-                    if len(current_part + line + '\n') <= max_message_length:
-                        current_part += line + '\n'
-                    else:
-                        if current_part:
-                            parts.append(current_part.strip())
-                        current_part = line + '\n'
-                
-                if current_part:
-                    parts.append(current_part.strip())
-                
-                # Отправляем части
-                for i, part in enumerate(parts):
-                    if i == 0:
-                        await update.message.reply_text(f"📝 Анализ (часть {i+1}/{len(parts)}):\n\n{part}")
-                    else:
-                        await update.message.reply_text(f"📝 Продолжение (часть {i+1}/{len(parts)}):\n\n{part}")
-            
-            # Отправляем информацию о завершении
-            remaining_credits = db.get_user_credits(user_id)
-            await update.message.reply_text(
-                MESSAGES['analysis_complete'].format(credits=remaining_credits)
-            )
-            
-            # Возвращаемся в главное меню
-            user_states[user_id] = BotStates.MAIN_MENU
-            reply_markup = ReplyKeyboardMarkup(MAIN_MENU, resize_keyboard=True)
-            await update.message.reply_text(
-                "Главное меню:",
-                reply_markup=reply_markup
+    
+    await start_analysis(update.message, context, user_id, selected_role, text, text_tokens, signature)
+
+@router.callback(OP_REANALYZE)
+async def handle_reanalyze(update: Update, context: ContextTypes.DEFAULT_TYPE, argument: str):
+    """Новый анализ текста, похожего на прошлую отправку"""
+    query = update.callback_query
+    pending = context.user_data.pop('pending_analysis', None)
+    if not pending:
+        await query.message.reply_text(catalog.text('similar_expired'))
+        return
+    await query.edit_message_reply_markup(reply_markup=None)
+    await start_analysis(query.message, context, query.from_user.id, *pending)
+
+async def start_analysis(message, context: ContextTypes.DEFAULT_TYPE, user_id: int, selected_role: str,
+                         text: str, text_tokens: int, signature: bytes = None):
+    """Резервирование кредитов и постановка анализа в очередь"""
+    multi_role = selected_role == ALL_ROLES_KEY
+    roles = list(catalog.current().roles) if multi_role else [selected_role]
+    group_id = uuid.uuid4().hex if multi_role else None
+    
+    # Кредиты резервируются вместе с созданием заданий одной транзакцией,
+    # за неудавшиеся анализы они возвращаются
+    # Оплатившие пользователи и администратор обслуживаются раньше пробных анализов
+    priority = db.get_priority_class(user_id)
+    job_ids = db.enqueue_analysis_jobs(
+        user_id, message.chat_id, roles, text, text_tokens, group_id=group_id, signature=signature,
+        priority=priority
+    )
+    if job_ids is None:
+        credits = db.get_user_credits(user_id)
+        if multi_role:
+            await message.reply_text(
+                catalog.text(
+                    'multi_no_credits', cost=len(roles), cost_text=credits_text(len(roles)), credits=credits
+                )
             )
         else:
-            await update.message.reply_text(
-                "Ошибка при списании кредита. Попробуйте позже."
+            await message.reply_text(
+                catalog.text('no_credits', credits=credits)
             )
-            
-    except Exception as e:
-        logger.error(f"Ошибка при анализе текста: {e}")
+        return
+    
+    analysis_worker.submit(job_ids, priority)
+    
+    # Анализ выполняется в фоне, пользователь возвращается в главное меню
+    user_states[user_id] = BotStates.MAIN_MENU
+    reply_markup = MAIN_MENU_MARKUP
+    if multi_role:
+        await message.reply_text(
+            catalog.text('multi_analyzing', length=len(text)),
+            reply_markup=reply_markup
+        )
+    else:
+        await message.reply_text(
+            catalog.text(
+                'analyzing',
+                role=catalog.role_name(selected_role),
+                length=len(text)
+            ),
+            reply_markup=reply_markup
+        )
+    
+    # Итоги локальных проверок показываются сразу, не дожидаясь ответа модели
+    if any(proofcheck.enabled_for(role) for role in roles):
+        findings = await asyncio.to_thread(proofcheck.check, text)
+        await send_analysis_result(context.bot, message.chat_id, proofcheck.format_report(findings))
+    if TEXTSTATS_SHOW_USER and any(textstats.enabled_for(role, text) for role in roles):
+        stats = await asyncio.to_thread(textstats.compute, text)
+        await send_analysis_result(context.bot, message.chat_id, textstats.format_report(stats))
+
+async def run_analysis_job(job: dict):
+    """Выполнение задания на анализ воркером"""
+    # Локальные подсчеты детерминированы: повторяем их вместо хранения результата
+    findings = None
+    notes = []
+    # Класс приоритета задания действует и в очереди лимита запросов к DeepSeek
+    options = {'priority': job.get('priority')}
+    if proofcheck.enabled_for(job['role']):
+        findings = await asyncio.to_thread(proofcheck.check, job['text'])
+        notes.append(proofcheck.model_note(findings))
+    if textstats.enabled_for(job['role'], job['text']):
+        stats = await asyncio.to_thread(textstats.compute, job['text'])
+        notes.append(textstats.model_note(stats))
+    if notes:
+        options['notes'] = "".join(notes)
+    
+    if revision_analyzer.supports(job['role']):
+        # Повторно присланный текст: проверяются только измененные абзацы
+        result, tokens_used, cache_usage = await revision_analyzer.analyze(
+            job['user_id'], job['role'], job['text'], **options
+        )
+    else:
+        result, tokens_used, cache_usage = await deepseek_api.analyze_text(
+            job['role'], job['text'], text_tokens=job['text_tokens'], **options
+        )
+    
+    if findings is not None and result is not None and (tokens_used > 0 or cache_usage.get('reused')):
+        # Отчет в истории содержит и замечания локальной проверки
+        result = f"{proofcheck.format_report(findings)}\n\n{result}"
+    return result, tokens_used, cache_usage
+
+async def deliver_analysis_job(job: dict):
+    """Доставка результата задания пользователю"""
+    bot = telegram_bot
+    role_name = catalog.role_name(job['role'])
+    
+    # Итог группы проверяется до первой отправки. Ноль незавершенных заданий могут увидеть
+    # несколько заданий (одновременное завершение, повторная доставка после перезапуска),
+    # поэтому итог отправляет только то, которое атомарно заняло уведомление группы
+    group_finished = False
+    group_summary = {}
+    if job['group_id']:
+        group_summary = db.get_job_group_summary(job['group_id'])
+        group_finished = not (group_summary.get('queued', 0) or group_summary.get('running', 0))
+    
+    if job['status'] == 'failed':
+        await bot.send_message(chat_id=job['chat_id'], text=catalog.text('analysis_failed', role=role_name))
+    else:
+        await send_analysis_result(
+            bot, job['chat_id'], job['result'], title=role_name if job['group_id'] else None
+        )
+        if not job['group_id']:
+            await bot.send_message(
+                chat_id=job['chat_id'],
+                text=catalog.text('analysis_complete', credits=db.get_user_credits(job['user_id']))
+            )
+    
+    if group_finished and db.claim_group_notification(job['group_id']):
+        spent = group_summary.get('done', 0) + group_summary.get('delivered', 0)
+        await bot.send_message(
+            chat_id=job['chat_id'],
+            text=catalog.text(
+                'multi_analysis_complete',
+                spent=spent, credits=db.get_user_credits(job['user_id'])
+            )
+        )
+
+async def send_analysis_result(bot, chat_id: int, analysis_result: str, title: str = None):
+    """Отправка результата анализа с разбиением на части по лимиту Telegram"""
+    if title:
+        analysis_result = f"📌 {title}\n\n{analysis_result}"
+    
+    # Разбиваем длинный результат на части, если необходимо
+    max_message_length = 4096
+    if len(analysis_result) <= max_message_length:
+        await bot.send_message(chat_id=chat_id, text=analysis_result)
+        return
+    
+    # Разбиваем на части
+    parts = []
+    current_part = ""
+    lines = analysis_result.split('\n')
+    
+    for line in lines:
+        if len(current_part + line + '\n') <= max_message_length:
+            current_part += line + '\n'
+        else:
+            if current_part:
+                parts.append(current_part.strip())
+            current_part = line + '\n'
+    
+    if current_part:
+        parts.append(current_part.strip())
+    
+    # Отправляем части
+    for i, part in enumerate(parts):
+        if i == 0:
+            await bot.send_message(chat_id=chat_id, text=f"📝 Анализ (часть {i+1}/{len(parts)}):\n\n{part}")
+        else:
+            await bot.send_message(chat_id=chat_id, text=f"📝 Продолжение (часть {i+1}/{len(parts)}):\n\n{part}")
+
+# Фоновые воркеры анализа (запускаются в post_init)
+analysis_worker = AnalysisWorker(db, run_analysis_job, deliver_analysis_job)
+
+# Замечания к неизмененным абзацам берутся из прошлых проверок
+revision_analyzer = RevisionAnalyzer(db, deepseek_api)
+
+# Бот для доставки результатов, задается при запуске воркеров
+telegram_bot = None
+
+# Фоновая задача очистки истории
+history_pruner = None
+
+# Архивирование старых строк, VACUUM и резервная копия базы
+archiver = Archiver(DATABASE_PATH)
+archive_task = None
+
+# Прогрев соединений с DeepSeek и YooMoney при старте
+prewarm_task = None
+
+async def download_document(url: str, destination: str):
+    """Потоковое скачивание файла на диск без загрузки целиком в память"""
+    # Общий клиент: соединение с сервером файлов Telegram переиспользуется между загрузками
+    async with http_pool.client.stream("GET", url, timeout=60) as response:
+        response.raise_for_status()
+        with open(destination, "wb") as output:
+            async for chunk in response.aiter_bytes(64 * 1024):
+                output.write(chunk)
+
+async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик загруженных документов (.txt, .docx, .fb2, .epub)"""
+    global document_executor
+    
+    user_id = update.effective_user.id
+    document = update.message.document
+    
+    db.update_user_activity(user_id)
+    
+    if user_states.get(user_id) != BotStates.WAITING_FOR_TEXT:
+        await update.message.reply_text(catalog.text('document_wrong_state'))
+        return
+    
+    extension = os.path.splitext(document.file_name or '')[1].lower()
+    if extension not in SUPPORTED_EXTENSIONS:
+        await update.message.reply_text(catalog.text('document_unsupported'))
+        return
+    
+    if document.file_size and document.file_size > MAX_DOCUMENT_SIZE:
         await update.message.reply_text(
-            "❌ Произошла ошибка при анализе текста. Попробуйте позже."
+            catalog.text('document_too_large', max_size=MAX_DOCUMENT_SIZE // (1024 * 1024))
+        )
+        return
+    
+    await update.message.reply_text(catalog.text('document_received', name=document.file_name))
+    
+    fd, path = tempfile.mkstemp(suffix=extension, prefix="airidder_")
+    os.close(fd)
+    try:
+        telegram_file = await context.bot.get_file(document.file_id)
+        await download_document(telegram_file.file_path, path)
+        
+        # Разбор документа выполняется в отдельном процессе, чтобы не блокировать event loop
+        if document_executor is None:
+            document_executor = ProcessPoolExecutor(max_workers=DOCUMENT_WORKERS)
+        loop = asyncio.get_running_loop()
+        text, truncated = await loop.run_in_executor(document_executor, extract_text, path, extension)
+    except Exception as e:
+        logger.error(f"Ошибка обработки документа {document.file_name}: {e}")
+        await update.message.reply_text(catalog.text('document_error'))
+        return
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    
+    if truncated:
+        await update.message.reply_text(catalog.text('document_too_long'))
+        return
+    
+    if not text:
+        await update.message.reply_text(catalog.text('document_error'))
+        return
+    
+    await process_text(update, context, text)
+
+def format_history_date(created_at: str) -> str:
+    """Дата анализа для кнопок истории: 2024-05-01 12:30:00 -> 01.05.2024 12:30"""
+    date, _, clock = created_at.partition(' ')
+    year, month, day = date.split('-')
+    return f"{day}.{month}.{year} {clock[:5]}"
+
+def build_history_page(user_id: int, before_id: int = None):
+    """Страница истории анализов: список отчетов и кнопка следующей страницы"""
+    # Берем на одну запись больше, чтобы узнать, есть ли следующая страница
+    rows = db.get_analysis_history(user_id, limit=HISTORY_PAGE_SIZE + 1, before_id=before_id)
+    has_more = len(rows) > HISTORY_PAGE_SIZE
+    rows = rows[:HISTORY_PAGE_SIZE]
+    
+    keyboard = []
+    for row in rows:
+        role_name = catalog.role_name(row['role'])
+        keyboard.append([InlineKeyboardButton(
+            f"{format_history_date(row['created_at'])} · {role_name} · {row['text_length']:,} симв.",
+            callback_data=encode_callback(OP_HISTORY_OPEN, row['id'])
+        )])
+    navigation = []
+    if before_id is not None:
+        navigation.append(InlineKeyboardButton("⏮ В начало", callback_data=encode_callback(OP_HISTORY_PAGE, 0)))
+    if has_more:
+        navigation.append(InlineKeyboardButton(
+            "Далее ▶️", callback_data=encode_callback(OP_HISTORY_PAGE, rows[-1]['id'])
+        ))
+    if navigation:
+        keyboard.append(navigation)
+    return rows, InlineKeyboardMarkup(keyboard)
+
+@router.button(BotStates.MAIN_MENU, BUTTON_HISTORY)
+async def show_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показать первую страницу истории анализов"""
+    rows, reply_markup = build_history_page(update.effective_user.id)
+    if not rows:
+        await update.message.reply_text(catalog.text('history_empty'))
+        return
+    await update.message.reply_text(catalog.text('history_header'), reply_markup=reply_markup)
+
+@router.callback(OP_HISTORY_PAGE)
+async def handle_history_page(update: Update, context: ContextTypes.DEFAULT_TYPE, argument: str):
+    """Листание истории; аргумент - ID последнего показанного анализа, 0 - первая страница"""
+    if not argument.isdigit():
+        return
+    query = update.callback_query
+    rows, reply_markup = build_history_page(query.from_user.id, before_id=int(argument) or None)
+    if rows:
+        await query.edit_message_reply_markup(reply_markup=reply_markup)
+
+async def load_history_report(update: Update, argument: str, with_input: bool = False):
+    """Отчет из истории по аргументу callback'а; отчет читается из базы, запрос к API не нужен"""
+    if not argument.isdigit():
+        return None
+    query = update.callback_query
+    report = db.get_analysis_report(query.from_user.id, int(argument), with_input=with_input)
+    if not report:
+        await query.message.reply_text(catalog.text('history_not_found'))
+        return None
+    report['title'] = f"{catalog.role_name(report['role'])}, {format_history_date(report['created_at'])}"
+    return report
+
+@router.callback(OP_HISTORY_OPEN)
+async def handle_history_open(update: Update, context: ContextTypes.DEFAULT_TYPE, argument: str):
+    """Повторная выдача отчета из истории"""
+    report = await load_history_report(update, argument)
+    if not report:
+        return
+    
+    query = update.callback_query
+    await send_analysis_result(context.bot, query.message.chat_id, report['result'], title=report['title'])
+    if not report['has_input']:
+        return
+    await query.message.reply_text(
+        f"📄 Исходный текст: {report['text_length']:,} символов",
+        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton(
+            "📄 Получить текст файлом", callback_data=encode_callback(OP_HISTORY_TEXT, report['id'])
+        )]])
+    )
+
+@router.callback(OP_HISTORY_TEXT)
+async def handle_history_text(update: Update, context: ContextTypes.DEFAULT_TYPE, argument: str):
+    """Исходный текст анализа из истории в виде файла"""
+    report = await load_history_report(update, argument, with_input=True)
+    if not report or report['input'] is None:
+        return
+    await update.callback_query.message.reply_document(
+        document=report['input'].encode('utf-8'),
+        filename=f"analysis_{report['id']}.txt",
+        caption=report['title']
+    )
+
+async def prune_history_periodically():
+    """Периодическая очистка истории по сроку хранения и лимиту на пользователя"""
+    while True:
+        # Удаление может затронуть много строк: выполняется в отдельном потоке, не блокируя event loop
+        await asyncio.to_thread(db.prune_history)
+        await asyncio.sleep(HISTORY_PRUNE_INTERVAL)
+
+def is_admin(user_id: int) -> bool:
+    """Проверка, является ли пользователь администратором"""
+    return str(user_id) == str(ADMIN_USER_ID)
+
+async def cache_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /cache_stats - доля попаданий в кэш контекста DeepSeek по ролям"""
+    if not is_admin(update.effective_user.id):
+        return
+    
+    stats = await asyncio.to_thread(db.get_cache_stats)
+    if not stats:
+        await update.message.reply_text("📊 Анализов пока нет.")
+        return
+    
+    lines = ["📊 Кэш контекста DeepSeek по ролям:\n"]
+    for item in stats:
+        role_name = catalog.role_name(item['role'])
+        lines.append(
+            f"{role_name}: {item['hit_ratio']:.1%} "
+            f"(из кэша {item['hit_tokens']:,}, без кэша {item['miss_tokens']:,} токенов, "
+            f"анализов: {item['analyses']})"
         )
+    
+    users = db.get_user_cache_stats()
+    lines.append(
+        f"\n👤 Кэш пользователей: {users['hit_ratio']:.1%} попаданий, "
+        f"записей: {users['size']:,}"
+    )
+    inflight = deepseek_api.inflight.get_stats()
+    lines.append(
+        f"🔁 Одинаковых запросов объединено: {inflight['joined']:,} "
+        f"(запущено {inflight['started']:,}, выполняется {inflight['in_flight']})"
+    )
+    limiter = deepseek_api.limiter.get_stats()
+    lines.append(
+        f"🎚 Лимит запросов к DeepSeek: {limiter['limit']:.1f}, выполняется {limiter['in_flight']}, "
+        f"в очереди {limiter['queue']} (снижений {limiter['decreases']:,})"
+    )
+    lines.append("\n⏳ Ожидание по классам (очередь заданий / очередь к DeepSeek), p50 и p95:")
+    jobs_queue = analysis_worker.queue.get_stats() if analysis_worker.running else {}
+    for cls, label in PRIORITY_LABELS.items():
+        parts = []
+        for stats in (jobs_queue.get(cls), limiter['classes'].get(cls)):
+            if stats:
+                parts.append(
+                    f"{stats['wait_p50']:.1f}/{stats['wait_p95']:.1f} с, ждут {stats['queued']}, "
+                    f"выдано {stats['served']:,}"
+                )
+            else:
+                parts.append("-")
+        lines.append(f"{label}: {' / '.join(parts)}")
+    if analysis_worker.running and analysis_worker.queue.aged:
+        lines.append(f"Выдано вне очереди после долгого ожидания: {analysis_worker.queue.aged:,}")
+    lines.append("\n🔑 Точки DeepSeek:")
+    for endpoint in deepseek_api.pool.get_stats():
+        line = (
+            f"{endpoint['name']}: запросов {endpoint['requests']:,}, ошибок {endpoint['failures']:,}, "
+            f"выполняется {endpoint['outstanding']}"
+        )
+        if endpoint['ejected_for']:
+            line += f", исключена еще на {endpoint['ejected_for']:.0f} с"
+        lines.append(line)
+    connections = http_pool.get_stats()
+    lines.append(
+        f"\n🌐 Исходящие соединения ({'HTTP/2' if connections['http2'] else 'HTTP/1.1'}, "
+        f"кэш DNS: {connections['dns_hits']:,} попаданий, {connections['dns_lookups']:,} запросов):"
+    )
+    for host in connections['hosts']:
+        lines.append(
+            f"{host['host']}: запросов {host['requests']:,}, новых соединений {host['connections']:,}, "
+            f"переиспользование {host['reuse']:.0%}"
+        )
+    await update.message.reply_text("\n".join(lines))
 
+async def catalog_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /catalog - версия каталога; /catalog reload перечитывает файл"""
+    if not is_admin(update.effective_user.id):
+        return
+    
+    if context.args and context.args[0] == 'reload':
+        catalog.refresh(force=True)
+    
+    snapshot = catalog.current()
+    lines = [
+        f"📚 Каталог: {snapshot.source}",
+        f"Версия: {snapshot.version}",
+        f"Тарифов: {len(snapshot.tariffs)}, сообщений: {len(snapshot.templates)}",
+        "",
+        "Версии промптов:",
+    ]
+    for role_key, version in snapshot.prompt_versions.items():
+        lines.append(f"{snapshot.role_name(role_key)}: {version}")
+    lines.append("")
+    lines.append("Модели и лимиты ответа (по токенам текста):")
+    for role_key in snapshot.roles:
+        lines.append(f"{snapshot.role_name(role_key)}: {snapshot.routing.describe(role_key)}")
+    await update.message.reply_text("\n".join(lines))
+
+def format_periods(values, suffix: str = "") -> str:
+    """Значения за периоды /stats через косую черту"""
+    return " / ".join(f"{value:,.0f}{suffix}" for value in values)
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик команды /stats - сводная статистика по дневным сводкам"""
+    if not is_admin(update.effective_user.id):
+        return
+    
+    # Запросы к сводкам выполняются в отдельном потоке, не блокируя event loop
+    started = time.perf_counter()
+    stats = await asyncio.to_thread(db.get_stats)
+    elapsed = (time.perf_counter() - started) * 1000
+    
+    period_count = len(stats['periods'])
+    lines = [
+        "📊 Статистика (сегодня / 7 дней / 30 дней)\n",
+        f"👥 Пользователей всего: {stats['users']:,}",
+        f"Новые: {format_periods(stats['new_users'])}",
+        f"Активные: {format_periods(stats['unique_active_users'])}",
+        "",
+        "📝 Анализы:",
+    ]
+    totals = [0] * period_count
+    tokens = [0] * period_count
+    for role, item in stats['analyses'].items():
+        role_name = catalog.role_name(role)
+        lines.append(f"{role_name}: {format_periods(item['analyses'])}")
+        totals = [a + b for a, b in zip(totals, item['analyses'])]
+        tokens = [a + b for a, b in zip(tokens, item['tokens_used'])]
+    lines.append(f"Всего: {format_periods(totals)}")
+    lines.append(f"Токенов: {format_periods(tokens)}")
+    
+    lines += ["", "💰 Выручка:"]
+    revenue = [0] * period_count
+    snapshot = catalog.current()
+    for tariff_key, item in stats['revenue'].items():
+        label = snapshot.tariff_label(tariff_key)
+        lines.append(f"{label}: {format_periods(item['payments'])} платежей")
+        revenue = [a + b for a, b in zip(revenue, item['amount'])]
+    lines.append(f"Итого: {format_periods(revenue, '₽')}")
+    
+    lines += ["", f"⏱ Запрос выполнен за {elapsed:.1f} мс"]
+    await update.message.reply_text("\n".join(lines))
+
+@router.fallback(BotStates.WAITING_FOR_SUPPORT_MESSAGE)
 async def handle_support_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик сообщений поддержки"""
     user_id = update.effective_user.id
     message = update.message.text
     
-    db.update_user_activity(user_id)
-    
     # Сохраняем сообщение в базу данных
     if db.save_support_message(user_id, message):
         # Пересылаем сообщение администратору
@@ -296,7 +823,7 @@ async def handle_support_message(update: Update, context: ContextTypes.DEFAULT_T
         except Exception as e:
             logger.error(f"Ошибка отправки сообщения администратору: {e}")
         
-        await update.message.reply_text(MESSAGES['support_sent'])
+        await update.message.reply_text(catalog.text('support_sent'))
     else:
         await update.message.reply_text(
             "Ошибка при отправке сообщения. Попробуйте позже."
@@ -304,53 +831,44 @@ async def handle_support_message(update: Update, context: ContextTypes.DEFAULT_T
     
     # Возвращаемся в главное меню
     user_states[user_id] = BotStates.MAIN_MENU
-    reply_markup = ReplyKeyboardMarkup(MAIN_MENU, resize_keyboard=True)
+    reply_markup = MAIN_MENU_MARKUP
     await update.message.reply_text(
         "Главное меню:",
         reply_markup=reply_markup
     )
 
+@router.button(BotStates.MAIN_MENU, BUTTON_PURCHASE)
 async def show_purchase_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать меню покупки анализов"""
-    keyboard = []
-    for key, tariff in TARIFFS.items():
-        keyboard.append([InlineKeyboardButton(
-            tariff['label'], 
-            callback_data=f"buy_{key}"
-        )])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = catalog.current().purchase_markup
     await update.message.reply_text(
-        MESSAGES['purchase_menu'],
+        catalog.text('purchase_menu'),
         reply_markup=reply_markup
     )
 
-async def handle_purchase_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработчик callback'ов покупки"""
+@router.callback(OP_BUY)
+async def handle_purchase_buy(update: Update, context: ContextTypes.DEFAULT_TYPE, tariff_key: str):
+    """Создание платежа по выбранному тарифу"""
     query = update.callback_query
-    await query.answer()
-    
     user_id = query.from_user.id
-    callback_data = query.data
     
-    if callback_data.startswith('buy_'):
-        tariff_key = callback_data.replace('buy_', '')
-        if tariff_key in TARIFFS:
-            tariff = TARIFFS[tariff_key]
-            
-            # Создаем ссылку на оплату
-            payment_info = payment_manager.create_payment_link(user_id, tariff_key)
+    tariffs = catalog.current().tariffs
+    if tariff_key in tariffs:
+        tariff = tariffs[tariff_key]
+        
+        # Создаем ссылку на оплату
+        payment_info = payment_manager.create_payment_link(user_id, tariff_key)
+        
+        if payment_info:
+            # Создаем клавиатуру с кнопками
+            keyboard = [
+                [InlineKeyboardButton("💳 Оплатить", url=payment_info['payment_url'])],
+                [InlineKeyboardButton("✅ Проверить оплату", callback_data=encode_callback(OP_CHECK, payment_info['payment_id']))],
+                [InlineKeyboardButton("❌ Отмена", callback_data=encode_callback(OP_CANCEL))]
+            ]
+            reply_markup = InlineKeyboardMarkup(keyboard)
             
-            if payment_info:
-                # Создаем клавиатуру с кнопками
-                keyboard = [
-                    [InlineKeyboardButton("💳 Оплатить", url=payment_info['payment_url'])],
-                    [InlineKeyboardButton("✅ Проверить оплату", callback_data=f"check_{payment_info['payment_id']}")],
-                    [InlineKeyboardButton("❌ Отмена", callback_data="cancel_payment")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                message_text = f"""💳 Оплата тарифа: {tariff['label']}
+            message_text = f"""💳 Оплата тарифа: {tariff['label']}
 
 💰 Сумма: {tariff['price']}₽
 🎯 Кредитов: {tariff['credits']}
@@ -358,78 +876,87 @@ async def handle_purchase_callback(update: Update, context: ContextTypes.DEFAULT
 Нажмите "Оплатить" для перехода к оплате, затем "Проверить оплату" для подтверждения.
 
 ⚠️ Внимание: после оплаты обязательно нажмите "Проверить оплату" для начисления кредитов!"""
-                
-                await query.edit_message_text(
-                    message_text,
-                    reply_markup=reply_markup
-                )
-            else:
-                await query.edit_message_text(
-                    "❌ Ошибка создания платежа. Попробуйте позже или обратитесь в поддержку."
-                )
+            
+            await query.edit_message_text(
+                message_text,
+                reply_markup=reply_markup
+            )
+        else:
+            await query.edit_message_text(
+                "❌ Ошибка создания платежа. Попробуйте позже или обратитесь в поддержку."
+            )
+
+@router.callback(OP_CHECK)
+async def handle_purchase_check(update: Update, context: ContextTypes.DEFAULT_TYPE, payment_id: str):
+    """Проверка статуса платежа"""
+    query = update.callback_query
+    user_id = query.from_user.id
     
-    elif callback_data.startswith('check_'):
-        # Проверка статуса платежа
-        payment_id = callback_data.replace('check_', '')
-        
-        await query.edit_message_text("🔄 Проверяю статус платежа...")
-        
-        # Проверяем статус платежа
-        is_paid, operation_info = payment_manager.check_payment_status(payment_id)
-        
-        if is_paid:
-            # Обрабатываем успешный платеж
-            if payment_manager.process_successful_payment(payment_id):
-                # Получаем информацию о платеже из метки
-                payment_info = payment_manager.get_payment_info_from_label(payment_id)
-                if payment_info and payment_info['tariff_key'] in TARIFFS:
-                    tariff = TARIFFS[payment_info['tariff_key']]
-                    credits_added = tariff['credits']
-                    
-                    current_credits = db.get_user_credits(user_id)
-                    
-                    success_message = f"""✅ Платеж успешно обработан!
+    await query.edit_message_text("🔄 Проверяю статус платежа...")
+    
+    # Проверяем статус платежа
+    is_paid, operation_info = payment_manager.check_payment_status(payment_id)
+    
+    if is_paid:
+        # Обрабатываем успешный платеж
+        outcome = payment_manager.process_successful_payment(
+            payment_id, operation_info['operation_id'] if operation_info else None
+        )
+        if outcome and outcome['status'] == PAYMENT_COMPLETED:
+            payment = outcome['payment']
+            credits_added = payment['credits']
+            tariff_label = catalog.current().tariff_label(payment['tariff_key'])
+            
+            current_credits = db.get_user_credits(user_id)
+            
+            success_message = f"""✅ Платеж успешно обработан!
 
 💰 Начислено кредитов: {credits_added}
 🎯 Текущий баланс: {current_credits} кредитов
 
 Спасибо за покупку! Теперь вы можете использовать анализы."""
-                    
-                    await query.edit_message_text(success_message)
-                    
-                    # Отправляем уведомление администратору
-                    try:
-                        admin_message = f"💰 Новый платеж!\n\n"
-                        admin_message += f"Пользователь: {user_id}\n"
-                        admin_message += f"Тариф: {tariff['label']}\n"
-                        admin_message += f"Сумма: {tariff['price']}₽\n"
-                        admin_message += f"Кредитов: {credits_added}"
-                        
-                        await context.bot.send_message(
-                            chat_id=ADMIN_USER_ID,
-                            text=admin_message
-                        )
-                    except Exception as e:
-                        logger.error(f"Ошибка отправки уведомления администратору: {e}")
-                else:
-                    await query.edit_message_text("✅ Платеж обработан, но возникла ошибка при начислении кредитов. Обратитесь в поддержку.")
-            else:
-                await query.edit_message_text("❌ Ошибка обработки платежа. Обратитесь в поддержку.")
-        else:
-            # Платеж еще не прошел
-            keyboard = [
-                [InlineKeyboardButton("🔄 Проверить еще раз", callback_data=f"check_{payment_id}")],
-                [InlineKeyboardButton("❌ Отмена", callback_data="cancel_payment")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
             
+            await query.edit_message_text(success_message)
+            
+            # Отправляем уведомление администратору
+            try:
+                admin_message = f"💰 Новый платеж!\n\n"
+                admin_message += f"Пользователь: {user_id}\n"
+                admin_message += f"Тариф: {tariff_label}\n"
+                admin_message += f"Сумма: {payment['amount']:g}₽\n"
+                admin_message += f"Кредитов: {credits_added}"
+                
+                await context.bot.send_message(
+                    chat_id=ADMIN_USER_ID,
+                    text=admin_message
+                )
+            except Exception as e:
+                logger.error(f"Ошибка отправки уведомления администратору: {e}")
+        elif outcome and outcome['status'] == PAYMENT_ALREADY_COMPLETED:
+            # Повторное нажатие или платеж уже зачтен фоновой сверкой
+            current_credits = db.get_user_credits(user_id)
             await query.edit_message_text(
-                "⏳ Платеж еще не поступил.\n\nПожалуйста, завершите оплату и нажмите 'Проверить еще раз'.",
-                reply_markup=reply_markup
+                f"✅ Этот платеж уже зачислен.\n\n🎯 Текущий баланс: {current_credits} кредитов"
             )
-    
-    elif callback_data == "cancel_payment":
-        await query.edit_message_text("❌ Оплата отменена.")
+        else:
+            await query.edit_message_text("❌ Ошибка обработки платежа. Обратитесь в поддержку.")
+    else:
+        # Платеж еще не прошел
+        keyboard = [
+            [InlineKeyboardButton("🔄 Проверить еще раз", callback_data=encode_callback(OP_CHECK, payment_id))],
+            [InlineKeyboardButton("❌ Отмена", callback_data=encode_callback(OP_CANCEL))]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        await query.edit_message_text(
+            "⏳ Платеж еще не поступил.\n\nПожалуйста, завершите оплату и нажмите 'Проверить еще раз'.",
+            reply_markup=reply_markup
+        )
+
+@router.callback(OP_CANCEL)
+async def handle_purchase_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE, argument: str):
+    """Отмена оплаты"""
+    await update.callback_query.edit_message_text("❌ Оплата отменена.")
 
 async def check_payments_periodically():
     """Периодическая проверка платежей (можно запускать в фоне)"""
@@ -441,28 +968,88 @@ async def check_payments_periodically():
         logger.error(f"Ошибка автоматической проверки платежей: {e}")
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Основной обработчик сообщений"""
+    """Основной обработчик сообщений: выбор обработчика по состоянию и тексту кнопки"""
     user_id = update.effective_user.id
-    current_state = user_states.get(user_id, BotStates.MAIN_MENU)
+    db.update_user_activity(user_id)
+    await router.dispatch_message(user_states.get(user_id, BotStates.MAIN_MENU), update, context)
+
+async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Основной обработчик callback-запросов: выбор обработчика по коду операции"""
+    await router.dispatch_callback(update, context)
+
+def register_handlers(application: Application):
+    """Регистрация обработчиков бота (используется также нагрузочным тестом)"""
+    handlers = [
+        CommandHandler("start", start),
+        CommandHandler("cache_stats", cache_stats_command),
+        CommandHandler("stats", stats_command),
+        CommandHandler("catalog", catalog_command),
+        CallbackQueryHandler(handle_callback),
+        MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message),
+        MessageHandler(filters.Document.ALL, handle_document),
+    ]
     
-    if current_state == BotStates.MAIN_MENU:
-        await handle_main_menu(update, context)
-    elif current_state == BotStates.ROLE_SELECTION:
-        await handle_role_selection(update, context)
-    elif current_state == BotStates.WAITING_FOR_TEXT:
-        await handle_text_analysis(update, context)
-    elif current_state == BotStates.WAITING_FOR_SUPPORT_MESSAGE:
-        await handle_support_message(update, context)
+    for handler in handlers:
+        # В режиме диагностики замеряем время каждого обработчика
+        if DIAGNOSTICS_ENABLED:
+            handler.callback = diagnostics.handler_profiler.wrap(handler.callback)
+        application.add_handler(handler)
+
+async def start_analysis_worker(application: Application):
+    """Запуск воркеров анализа с доставкой результатов через бота приложения"""
+    global telegram_bot
+    telegram_bot = application.bot
+    await analysis_worker.start()
+
+async def post_init(application: Application):
+    """Запуск фоновых задач после инициализации приложения"""
+    global history_pruner, archive_task, prewarm_task
+    await start_analysis_worker(application)
+    # Соединения открываются в фоне, не задерживая прием сообщений
+    prewarm_task = asyncio.create_task(http_pool.prewarm(
+        [endpoint.base_url for endpoint in deepseek_api.pool.endpoints],
+        [payment_manager.client.base_url] if payment_manager.client else []
+    ))
+    history_pruner = asyncio.create_task(prune_history_periodically())
+    if ARCHIVE_ENABLED:
+        archive_task = asyncio.create_task(archiver.run_periodically(ARCHIVE_INTERVAL))
+    if DIAGNOSTICS_ENABLED:
+        diagnostics.setup_report_log()
+        diagnostics.loop_monitor.start()
+        logger.info("Режим диагностики включен")
+
+async def post_shutdown(application: Application):
+    """Остановка фоновых задач"""
+    await analysis_worker.stop()
+    if history_pruner is not None:
+        history_pruner.cancel()
+    if archive_task is not None:
+        archive_task.cancel()
+    if prewarm_task is not None:
+        prewarm_task.cancel()
+    await http_pool.client.aclose()
+    http_pool.session.close()
+    if DIAGNOSTICS_ENABLED:
+        await diagnostics.loop_monitor.stop()
+    if document_executor is not None:
+        document_executor.shutdown(wait=False)
 
 def main():
     """Основная функция запуска бота"""
     # Создаем приложение
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        # Обработчики отвечают параллельно: одного соединения по умолчанию мало
+        .connection_pool_size(TELEGRAM_POOL_SIZE)
+        .http_version("2" if http_pool.HTTP2_AVAILABLE else "1.1")
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     
     # Добавляем обработчики
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CallbackQueryHandler(handle_purchase_callback))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    register_handlers(application)
     
     # Запускаем бота
     logger.info("Запуск бота...")
@@ -0,0 +1,274 @@
+"""
+Каталог ролей, тарифов и текстов сообщений с горячей перезагрузкой.
+
+По умолчанию используются ROLES из roles.py, TARIFFS, ROUTING и MESSAGES из config.py.
+Если существует файл CATALOG_PATH (JSON), его разделы "roles", "tariffs", "routing"
+и "messages" заменяют соответствующие значения без перезапуска бота: время
+изменения файла проверяется не чаще раза в CATALOG_RELOAD_INTERVAL секунд.
+
+Каждая загрузка дает неизменяемый снимок (CatalogSnapshot) с разобранными
+заранее шаблонами сообщений, готовыми клавиатурами и версиями промптов.
+Ошибочный файл не применяется: бот продолжает работать с предыдущим снимком.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import string
+import threading
+import time
+from types import MappingProxyType
+from typing import Dict, Any, List, Tuple, Optional, Mapping
+
+from telegram import ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
+
+from config import TARIFFS, ROUTING, MESSAGES, CATALOG_PATH, CATALOG_RELOAD_INTERVAL
+from roles import ROLES
+from routing import RoutingPolicy
+from router import encode_callback, OP_BUY
+
+logger = logging.getLogger(__name__)
+
+# Кнопки меню ролей, не зависящие от каталога
+ALL_ROLES_BUTTON = '🎭 Все роли'
+BACK_BUTTON = '🔙 Назад'
+
+REQUIRED_ROLE_FIELDS = ('name', 'button', 'prompt')
+REQUIRED_TARIFF_FIELDS = ('label', 'price', 'credits')
+
+# Подстановки прежних версий сообщений: бот по-прежнему их передает,
+# поэтому файлы каталога со старыми текстами остаются допустимыми
+LEGACY_MESSAGE_FIELDS = {
+    'multi_role_selected': frozenset({'cost'}),
+    'multi_no_credits': frozenset({'cost'}),
+}
+
+_formatter = string.Formatter()
+
+
+class CatalogError(ValueError):
+    """Ошибка в данных каталога"""
+
+
+class MessageTemplate:
+    """
+    Шаблон сообщения, разобранный один раз при загрузке каталога.
+
+    Подстановки вида {name} и {name:,} проверяются при загрузке, поэтому
+    ошибка в тексте обнаруживается при перезагрузке, а не при отправке.
+    """
+
+    __slots__ = ('text', 'parts', 'fields')
+
+    def __init__(self, text: str):
+        self.text = text
+        self.parts: Tuple[Tuple[str, Optional[str], str], ...] = ()
+        self.fields = frozenset()
+        try:
+            parsed = list(_formatter.parse(text))
+        except ValueError as e:
+            raise CatalogError(f"ошибка в шаблоне: {e}")
+
+        parts = []
+        for literal, field, spec, conversion in parsed:
+            if field is not None and (not field.isidentifier() or conversion):
+                raise CatalogError(f"неподдерживаемая подстановка {{{field}}}")
+            parts.append((literal, field, spec or ''))
+        self.parts = tuple(parts)
+        self.fields = frozenset(field for _, field, _ in parts if field is not None)
+
+    def render(self, **values) -> str:
+        if not self.fields:
+            return self.text
+        chunks = []
+        for literal, field, spec in self.parts:
+            chunks.append(literal)
+            if field is not None:
+                chunks.append(format(values[field], spec))
+        return ''.join(chunks)
+
+
+def _freeze(mapping: Mapping[str, Mapping[str, Any]]) -> Mapping[str, Mapping[str, Any]]:
+    return MappingProxyType({key: MappingProxyType(dict(value)) for key, value in mapping.items()})
+
+
+def plural(count: int, one: str, few: str, many: str) -> str:
+    """Число со словом в нужной форме: plural(3, 'кредит', 'кредита', 'кредитов') -> '3 кредита'"""
+    if count % 10 == 1 and count % 100 != 11:
+        form = one
+    elif 2 <= count % 10 <= 4 and not 12 <= count % 100 <= 14:
+        form = few
+    else:
+        form = many
+    return f"{count} {form}"
+
+
+def credits_text(count: int) -> str:
+    return plural(count, 'кредит', 'кредита', 'кредитов')
+
+
+def join_names(names: List[str]) -> str:
+    """Перечисление через запятую с «и» перед последним: 'А, Б и В'"""
+    if len(names) < 2:
+        return ''.join(names)
+    return f"{', '.join(names[:-1])} и {names[-1]}"
+
+
+def prompt_version(prompt: str) -> str:
+    """Версия промпта: короткий хеш текста, используется в ключах кэша и аналитике"""
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]
+
+
+class CatalogSnapshot:
+    """Неизменяемый снимок каталога с готовыми шаблонами и клавиатурами"""
+
+    def __init__(self, roles: Dict[str, Dict[str, Any]], tariffs: Dict[str, Dict[str, Any]],
+                 messages: Dict[str, str], source: str, routing: Dict[str, Any] = ROUTING):
+        self._validate_entries('роль', roles, REQUIRED_ROLE_FIELDS)
+        self._validate_entries('тариф', tariffs, REQUIRED_TARIFF_FIELDS)
+        try:
+            self.routing = RoutingPolicy(routing)
+        except ValueError as e:
+            raise CatalogError(f"маршрутизация: {e}")
+
+        templates = {}
+        for key, text in messages.items():
+            try:
+                template = MessageTemplate(text)
+            except CatalogError as e:
+                raise CatalogError(f"сообщение {key}: {e}")
+            # В тексте можно использовать только подстановки, которые передает бот
+            default = MESSAGES.get(key)
+            if default is not None:
+                allowed = MessageTemplate(default).fields | LEGACY_MESSAGE_FIELDS.get(key, frozenset())
+                unknown = template.fields - allowed
+                if unknown:
+                    raise CatalogError(f"сообщение {key}: неизвестные подстановки {sorted(unknown)}")
+            templates[key] = template
+
+        self.roles = _freeze(roles)
+        self.tariffs = _freeze(tariffs)
+        self.templates = MappingProxyType(templates)
+        self.source = source
+        self.loaded_at = time.time()
+
+        self.prompt_versions = MappingProxyType({
+            key: prompt_version(role['prompt']) for key, role in roles.items()
+        })
+        digest = hashlib.sha256(json.dumps(
+            {'roles': roles, 'tariffs': tariffs, 'messages': messages, 'routing': routing},
+            ensure_ascii=False, sort_keys=True
+        ).encode('utf-8'))
+        self.version = digest.hexdigest()[:12]
+
+        self.role_by_button = MappingProxyType({role['button']: key for key, role in roles.items()})
+        self.role_names = join_names([role['name'] for role in roles.values()])
+
+        buttons = [role['button'] for role in roles.values()] + [ALL_ROLES_BUTTON]
+        self.roles_menu: List[List[str]] = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+        self.roles_menu.append([BACK_BUTTON])
+        self.roles_menu_markup = ReplyKeyboardMarkup(self.roles_menu, resize_keyboard=True)
+        self.purchase_markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton(tariff['label'], callback_data=encode_callback(OP_BUY, key))]
+            for key, tariff in tariffs.items()
+        ])
+
+    @staticmethod
+    def _validate_entries(kind: str, entries: Dict[str, Dict[str, Any]], required: Tuple[str, ...]):
+        if not entries:
+            raise CatalogError(f"не задано ни одной записи: {kind}")
+        for key, entry in entries.items():
+            missing = [field for field in required if field not in entry]
+            if missing:
+                raise CatalogError(f"{kind} {key}: нет полей {missing}")
+
+    def text(self, key: str, **values) -> str:
+        """Текст сообщения с подстановкой значений"""
+        return self.templates[key].render(**values)
+
+    def role_name(self, role_key: str) -> str:
+        role = self.roles.get(role_key)
+        return role['name'] if role else role_key
+
+    def tariff_label(self, tariff_key: str) -> str:
+        tariff = self.tariffs.get(tariff_key)
+        return tariff['label'] if tariff else tariff_key
+
+
+class Catalog:
+    """Текущий снимок каталога с перезагрузкой при изменении файла"""
+
+    def __init__(self, path: str = CATALOG_PATH, reload_interval: float = CATALOG_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        self._snapshot = self._build(None)
+        self.refresh(force=True)
+
+    def _build(self, data: Optional[Dict[str, Any]]) -> CatalogSnapshot:
+        data = data or {}
+        messages = dict(MESSAGES)
+        messages.update(data.get('messages', {}))
+        return CatalogSnapshot(
+            roles=data.get('roles', ROLES),
+            tariffs=data.get('tariffs', TARIFFS),
+            messages=messages,
+            routing=data.get('routing', ROUTING),
+            source=self.path if data else 'defaults'
+        )
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Перечитать файл каталога, если он изменился
+
+        Returns:
+            bool: был ли применен новый снимок
+        """
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.reload_interval:
+            return False
+
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns if self.path else None
+            except FileNotFoundError:
+                mtime = None
+
+            if mtime == self._mtime:
+                return False
+
+            try:
+                if mtime is None:
+                    snapshot = self._build(None)
+                else:
+                    with open(self.path, encoding='utf-8') as stream:
+                        snapshot = self._build(json.load(stream))
+            except Exception as e:
+                # Запоминаем mtime, чтобы не разбирать тот же ошибочный файл повторно
+                self._mtime = mtime
+                logger.error(f"Каталог {self.path} не применен, используется версия {self._snapshot.version}: {e}")
+                return False
+
+            self._mtime = mtime
+            self._snapshot = snapshot
+            logger.info(f"Загружен каталог {snapshot.source}, версия {snapshot.version}")
+            return True
+
+    def current(self) -> CatalogSnapshot:
+        """Актуальный снимок каталога"""
+        self.refresh()
+        return self._snapshot
+
+    def text(self, key: str, **values) -> str:
+        return self.current().text(key, **values)
+
+    def role_name(self, role_key: str) -> str:
+        return self.current().role_name(role_key)
+
+
+# Глобальный экземпляр каталога
+catalog = Catalog()
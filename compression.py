@@ -0,0 +1,51 @@
+"""
+Сжатие текстов для хранения в SQLite.
+
+Если установлен zstandard, используется zstd, иначе zlib. Первый байт
+блоба хранит кодек, поэтому данные, сжатые разными кодеками, читаются одинаково.
+"""
+
+import logging
+import zlib
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:
+    # zstd необязателен, без него используется zlib
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CODEC_ZLIB = b'z'
+CODEC_ZSTD = b's'
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 6
+
+_zstd_compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL) if zstandard else None
+_zstd_decompressor = zstandard.ZstdDecompressor() if zstandard else None
+
+
+def compress_text(text: Optional[str]) -> Optional[bytes]:
+    """Сжать текст в блоб с префиксом кодека"""
+    if text is None:
+        return None
+    data = text.encode('utf-8')
+    if _zstd_compressor is not None:
+        return CODEC_ZSTD + _zstd_compressor.compress(data)
+    return CODEC_ZLIB + zlib.compress(data, ZLIB_LEVEL)
+
+
+def decompress_text(blob: Optional[bytes]) -> Optional[str]:
+    """Распаковать блоб, созданный compress_text"""
+    if blob is None:
+        return None
+    codec, payload = blob[:1], blob[1:]
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(payload).decode('utf-8')
+    if codec == CODEC_ZSTD:
+        if _zstd_decompressor is None:
+            raise RuntimeError("Для чтения данных нужен пакет zstandard")
+        return _zstd_decompressor.decompress(payload).decode('utf-8')
+    raise ValueError(f"Неизвестный кодек сжатия: {codec!r}")
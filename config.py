@@ -7,6 +7,26 @@ load_dotenv()
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '7881672933:AAHH6V-5cLloL1vnKQUEmV2zRUAM2BLJ34Y')
 DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY', 'sk-947b9b8781cb46e69562c5ae31ff3a6f')
 DEEPSEEK_API_BASE = os.getenv('DEEPSEEK_API_BASE', 'https://api.deepseek.com')
+# Пул ключей DeepSeek: "ключ@адрес" через запятую (адрес можно опустить); пусто - только ключ выше
+DEEPSEEK_ENDPOINTS = os.getenv('DEEPSEEK_ENDPOINTS', '')
+DEEPSEEK_EJECT_TIME = float(os.getenv('DEEPSEEK_EJECT_TIME', '10'))  # Исключение точки после 429/5xx, секунды
+DEEPSEEK_MAX_EJECT_TIME = float(os.getenv('DEEPSEEK_MAX_EJECT_TIME', '300'))  # Предел исключения при сбоях подряд
+
+# Исходящие HTTP-соединения (DeepSeek, YooMoney, файлы Telegram)
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '100'))  # Соединений в пуле клиента
+HTTP_MAX_KEEPALIVE = int(os.getenv('HTTP_MAX_KEEPALIVE', '32'))  # Простаивающих соединений, которые держит пул
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '90'))  # Сколько держать простаивающее соединение, секунды
+HTTP2_ENABLED = os.getenv('HTTP2_ENABLED', '1') == '1'  # HTTP/2, если установлен пакет h2
+HTTP_DNS_TTL = float(os.getenv('HTTP_DNS_TTL', '300'))  # Время жизни кэша DNS, секунды
+HTTP_PREWARM_CONNECTIONS = int(os.getenv('HTTP_PREWARM_CONNECTIONS', '2'))  # Соединений на хост, открываемых при старте
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '30'))  # Таймаут запросов YooMoney и скачивания файлов, секунды
+TELEGRAM_POOL_SIZE = int(os.getenv('TELEGRAM_POOL_SIZE', '64'))  # Соединений к Telegram Bot API
+
+# Адаптивный лимит одновременных запросов к DeepSeek (AIMD)
+LIMITER_INITIAL = int(os.getenv('LIMITER_INITIAL', '4'))  # Начальный лимит
+LIMITER_MIN = 1  # Лимит не опускается ниже
+LIMITER_MAX = int(os.getenv('LIMITER_MAX', '64'))  # И не поднимается выше
+LIMITER_LATENCY_TOLERANCE = float(os.getenv('LIMITER_LATENCY_TOLERANCE', '2.0'))  # Во сколько раз рост задержки - всплеск
 
 # ID администратора для пересылки сообщений поддержки
 ADMIN_USER_ID = os.getenv('ADMIN_USER_ID', '123456789')  # Замените на ваш Telegram ID
@@ -41,18 +61,112 @@ TARIFFS = {
     }
 }
 
+# Выбор модели и параметров генерации по роли и размеру текста (раздел "routing" каталога).
+# Ступени tiers выбираются по числу токенов текста: первая, у которой up_to не меньше
+ROUTING = {
+    "default": {
+        "model": "deepseek-chat",
+        "temperature": 0.7,
+        "max_tokens": 4000,
+        "tiers": [
+            {"up_to": 1000, "max_tokens": 1500},
+            {"up_to": 8000, "max_tokens": 3000},
+            {"up_to": 20000, "max_tokens": 4000},
+            {"max_tokens": 8000},
+        ],
+    },
+    "roles": {
+        "proofreader": {
+            "temperature": 0.2,
+            # Механические ошибки находит локальная проверка, ответу нужно меньше места
+            "tiers": [
+                {"up_to": 1000, "max_tokens": 1000},
+                {"up_to": 8000, "max_tokens": 2500},
+                {"max_tokens": 6000},
+            ],
+        },
+        "editor": {"temperature": 0.5},
+        "beta_reader": {"temperature": 0.8},
+    },
+}
+
 # Лимиты
 MAX_TEXT_LENGTH = 200000  # Максимальная длина текста в символах
 MAX_TOKENS_PER_REQUEST = 50000  # Максимальное количество токенов на запрос
+MAX_DOCUMENT_SIZE = int(os.getenv('MAX_DOCUMENT_SIZE', str(20 * 1024 * 1024)))  # Лимит Bot API на скачивание файлов
+TEXT_BUFFER_DEBOUNCE = float(os.getenv('TEXT_BUFFER_DEBOUNCE', '2.0'))  # Окно склейки сообщений, секунды
+DOCUMENT_WORKERS = int(os.getenv('DOCUMENT_WORKERS', '2'))  # Процессы для извлечения текста из документов
+
+# Фоновое выполнение анализов
+ANALYSIS_WORKERS = int(os.getenv('ANALYSIS_WORKERS', '32'))  # Верхняя граница одновременных анализов
+ANALYSIS_MAX_ATTEMPTS = int(os.getenv('ANALYSIS_MAX_ATTEMPTS', '3'))  # Попыток на задание при ошибках API
+ANALYSIS_RETRY_DELAY = float(os.getenv('ANALYSIS_RETRY_DELAY', '10'))  # Пауза перед повтором, секунды
+
+# Приоритеты анализов: доли очереди администратора, оплативших и пробных анализов
+PRIORITY_WEIGHTS = {
+    'admin': int(os.getenv('PRIORITY_WEIGHT_ADMIN', '8')),
+    'paid': int(os.getenv('PRIORITY_WEIGHT_PAID', '4')),
+    'free': int(os.getenv('PRIORITY_WEIGHT_FREE', '1')),
+}
+PRIORITY_MAX_WAIT = float(os.getenv('PRIORITY_MAX_WAIT', '120'))  # Дольше ожидающие выходят вне очереди, секунды
+
+# Поиск похожих прошлых отправок (MinHash/LSH)
+SIMILARITY_THRESHOLD = float(os.getenv('SIMILARITY_THRESHOLD', '0.8'))  # Минимальная оценка сходства текстов
+SIMILARITY_MAX_CANDIDATES = 20  # Кандидатов из LSH-корзин для сравнения сигнатур
+
+# Повторная проверка отредактированных текстов (роли с "incremental": True)
+REVISION_CONTEXT_PARAGRAPHS = int(os.getenv('REVISION_CONTEXT_PARAGRAPHS', '1'))  # Соседних абзацев для контекста
+REVISION_SNIPPET_LENGTH = 60  # Длина начала абзаца в отчете, символы
+REVISION_TOKENS_PER_PARAGRAPH = int(os.getenv('REVISION_TOKENS_PER_PARAGRAPH', '15'))  # Запас ответа на метку проверяемого абзаца, токены
+REVISION_MAX_TOKENS = int(os.getenv('REVISION_MAX_TOKENS', '8000'))  # Предел длины ответа модели для размеченного запроса
+
+# Локальная проверка механических ошибок (роли с "proofcheck": True)
+PROOFCHECK_REPORT_ITEMS = 5  # Примеров каждого вида замечаний в отчете
+
+# Статистика текста для промптов (роли с "textstats": True)
+TEXTSTATS_MIN_LENGTH = int(os.getenv('TEXTSTATS_MIN_LENGTH', '5000'))  # Минимальная длина текста, символы
+TEXTSTATS_SHOW_USER = os.getenv('TEXTSTATS_SHOW_USER', '1') == '1'  # Показывать статистику автору сразу
+TEXTSTATS_REPEAT_WINDOW = 50  # Окно поиска повторов слов, слова
+TEXTSTATS_TOP_REPEATS = 5  # Самых частых повторов в сводке
+
+# История анализов (отчеты хранятся сжатыми и выдаются повторно без запроса к API)
+HISTORY_STORE_INPUTS = os.getenv('HISTORY_STORE_INPUTS', '1') == '1'  # Хранить исходные тексты вместе с отчетами
+HISTORY_MAX_INPUT_BLOB_SIZE = int(os.getenv('HISTORY_MAX_INPUT_BLOB_SIZE', str(256 * 1024)))  # Лимит сжатого текста, байты
+HISTORY_RETENTION_DAYS = int(os.getenv('HISTORY_RETENTION_DAYS', '180'))  # Срок хранения отчетов, дни
+HISTORY_MAX_PER_USER = int(os.getenv('HISTORY_MAX_PER_USER', '100'))  # Отчетов в истории на пользователя
+HISTORY_PAGE_SIZE = 5  # Отчетов на странице истории
+HISTORY_PRUNE_INTERVAL = int(os.getenv('HISTORY_PRUNE_INTERVAL', '3600'))  # Период очистки истории, секунды
+
+# Каталог ролей, тарифов и сообщений (JSON, перечитывается при изменении файла)
+CATALOG_PATH = os.getenv('CATALOG_PATH', 'catalog.json')
+CATALOG_RELOAD_INTERVAL = float(os.getenv('CATALOG_RELOAD_INTERVAL', '5'))  # Период проверки файла, секунды
 
 # Настройки базы данных
 DATABASE_PATH = os.getenv('DATABASE_PATH', 'bot.db')
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))  # Пользователей в кэше процесса (0 - без кэша)
+USER_CACHE_NEGATIVE = os.getenv('USER_CACHE_NEGATIVE', '1') == '1'  # Запоминать отсутствующих пользователей
+USER_ACTIVITY_INTERVAL = int(os.getenv('USER_ACTIVITY_INTERVAL', '300'))  # Запись активности не чаще, секунды
+
+# Архивирование старых данных и резервное копирование
+ARCHIVE_ENABLED = os.getenv('ARCHIVE_ENABLED', '1') == '1'
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '365'))  # Возраст строк для переноса в архив, дни
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')  # Каталог помесячных архивных баз
+ARCHIVE_INTERVAL = int(os.getenv('ARCHIVE_INTERVAL', str(24 * 3600)))  # Период обслуживания базы, секунды
+ARCHIVE_BATCH_SIZE = 500  # Строк, переносимых одной транзакцией
+BACKUP_PATH = os.getenv('BACKUP_PATH', 'backup/bot.db')  # Снимок базы; пустое значение отключает копирование
 
 # Настройки Flask для webhook'ов
 FLASK_HOST = os.getenv('FLASK_HOST', '0.0.0.0')
 FLASK_PORT = int(os.getenv('FLASK_PORT', '5000'))
 WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # URL для webhook'ов ЮKassa
 
+# Диагностика задержек (мониторинг event loop и профилирование обработчиков)
+DIAGNOSTICS_ENABLED = os.getenv('DIAGNOSTICS_ENABLED', '0') == '1'
+DIAGNOSTICS_LOG_PATH = os.getenv('DIAGNOSTICS_LOG_PATH', 'diagnostics.log')
+DIAGNOSTICS_LOOP_LAG_MS = int(os.getenv('DIAGNOSTICS_LOOP_LAG_MS', '100'))  # Порог блокировки event loop
+DIAGNOSTICS_SLOW_HANDLER_MS = int(os.getenv('DIAGNOSTICS_SLOW_HANDLER_MS', '2000'))  # Порог медленного обработчика
+DIAGNOSTICS_PROFILER = os.getenv('DIAGNOSTICS_PROFILER', 'stack')  # stack, cprofile или tracemalloc
+
 # Сообщения бота
 MESSAGES = {
     'welcome': """🤖 Добро пожаловать в AiRidder Bot!
@@ -129,25 +243,110 @@ MESSAGES = {
 📖 Бета-ридер - честная оценка читателя
 ✏️ Корректор - поиск ошибок и опечаток  
 📝 Редактор - профессиональная редактура
+🎭 Все роли - три анализа одного текста сразу
 
 После выбора роли отправьте текст для анализа.""",
     
     'role_selected': """✅ Роль "{role}" выбрана!
 
-Теперь отправьте текст для анализа (до {max_length:,} символов).""",
+Теперь отправьте текст для анализа (до {max_length:,} символов)
+или загрузите файл .txt, .docx, .fb2 или .epub.""",
+    
+    'text_buffering': """📥 Текст принимается по частям.
+
+Отправьте оставшиеся части, анализ начнется автоматически через несколько секунд
+после последней. Или нажмите «✅ Готово», чтобы начать сразу.""",
+    
+    'text_buffer_empty': """✏️ Сначала отправьте текст для анализа.""",
+    
+    'document_received': """📄 Файл «{name}» получен, извлекаю текст...""",
+    
+    'document_unsupported': """❌ Этот формат не поддерживается.
+
+Загрузите файл .txt, .docx, .fb2 или .epub.""",
+    
+    'document_too_large': """❌ Файл слишком большой!
+
+📏 Максимальный размер: {max_size} МБ""",
+    
+    'document_too_long': f"""❌ Текст в файле слишком длинный!
+
+📏 Максимальная длина: {MAX_TEXT_LENGTH:,} символов
+
+Пожалуйста, загрузите часть рукописи.""",
+    
+    'document_error': """❌ Не удалось прочитать файл. Проверьте, что он не поврежден, и попробуйте снова.""",
+    
+    'document_wrong_state': """📄 Чтобы проанализировать файл, сначала выберите роль в меню "Роли".""",
     
     'analyzing': """🔄 Анализирую ваш текст...
 
 Роль: {role}
 Длина текста: {length:,} символов
 
-Это может занять несколько минут.""",
+Это может занять несколько минут. Результат придет отдельным сообщением,
+а пока можно пользоваться меню.""",
+    
+    'analysis_failed': """❌ {role}: не удалось выполнить анализ. Кредит возвращен на баланс.""",
+    
+    'similar_found': """♻️ Этот текст почти совпадает ({similarity:.0%}) с текстом, который вы отправляли {date}. Роль: {role}.
+
+Прошлый отчет можно получить бесплатно или запустить новый анализ.""",
+    
+    'similar_expired': """❌ Текст не найден. Отправьте его еще раз.""",
+    
+    'revision_reused': """♻️ Без изменений с прошлой проверки: {reused} из {total} абзацев, замечания к ним сохранены.""",
+    
+    'revision_truncated': """⚠️ Ответ не уместился целиком: проверено абзацев {checked} из {total}. Остальные будут проверены при следующей отправке текста.""",
+    
+    'revision_no_findings': """✅ Замечаний нет.""",
+    
+    'proofcheck_header': """🔎 Автоматическая проверка: замечаний {count}""",
+    
+    'proofcheck_clean': """🔎 Автоматическая проверка: механических ошибок не найдено.""",
+    
+    'proofcheck_more': """… и еще {count}""",
+    
+    'textstats_header': """📊 Статистика текста (пока готовится отчет)""",
     
     'analysis_complete': """✅ Анализ завершен!
 
 💰 Списан 1 кредит
 💰 Остаток: {credits} кредитов""",
     
+    'multi_role_selected': """✅ Выбраны все роли!
+
+Текст проанализируют {roles} одновременно.
+Стоимость: {cost_text}. Отправьте текст для анализа (до {max_length:,} символов).""",
+    
+    'multi_no_credits': """❌ Для анализа всеми ролями нужно {cost_text}!
+
+💰 Ваш баланс: {credits} кредитов
+
+Купите анализы в меню "Купить анализы" или выберите одну роль.""",
+    
+    'multi_analyzing': """🔄 Анализирую ваш текст всеми ролями...
+
+Длина текста: {length:,} символов
+
+Результаты будут приходить по мере готовности.""",
+    
+    'multi_analysis_complete': """✅ Анализ всеми ролями завершен!
+
+💰 Списано кредитов: {spent}
+💰 Остаток: {credits} кредитов""",
+    
+    'history_header': f"""📜 История анализов
+
+Выберите отчет, чтобы получить его повторно — кредиты не списываются.
+Отчеты хранятся {HISTORY_RETENTION_DAYS} дней.""",
+    
+    'history_empty': """📜 История пуста.
+
+Здесь появятся отчеты после первого анализа.""",
+    
+    'history_not_found': """❌ Отчет не найден. Возможно, срок его хранения истек.""",
+    
     'balance': """💰 Ваш баланс
 
 🎯 Доступно анализов: {credits}
@@ -1,13 +1,87 @@
 import sqlite3
 import logging
-from datetime import datetime
-from typing import Optional, Dict, Any
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List, Tuple
+from compression import compress_text, decompress_text
+from similarity import lsh_buckets, similarity
+from catalog import catalog
+from config import (
+    HISTORY_STORE_INPUTS, HISTORY_MAX_INPUT_BLOB_SIZE, HISTORY_RETENTION_DAYS,
+    HISTORY_MAX_PER_USER, HISTORY_PAGE_SIZE,
+    USER_CACHE_SIZE, USER_CACHE_NEGATIVE, USER_ACTIVITY_INTERVAL,
+    SIMILARITY_THRESHOLD, SIMILARITY_MAX_CANDIDATES, ADMIN_USER_ID
+)
 
 logger = logging.getLogger(__name__)
 
+# Результаты завершения платежа (complete_payments)
+PAYMENT_COMPLETED = 'completed'
+PAYMENT_ALREADY_COMPLETED = 'already_completed'
+PAYMENT_NOT_FOUND = 'not_found'
+PAYMENT_DUPLICATE_OPERATION = 'duplicate_operation'
+PAYMENT_ERROR = 'error'
+
+# Классы приоритета заданий на анализ (веса в PRIORITY_WEIGHTS)
+PRIORITY_ADMIN = 'admin'
+PRIORITY_PAID = 'paid'
+PRIORITY_FREE = 'free'
+
+# Отметка в кэше пользователей: пользователя нет в базе
+_MISSING = object()
+
+class LRUCache:
+    """Ограниченный кэш с вытеснением давно не использованных записей"""
+    
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._items)
+    
+    def get(self, key):
+        """Значение по ключу или None при промахе"""
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+    
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._items.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
 class Database:
-    def __init__(self, db_path: str = "bot.db"):
+    def __init__(self, db_path: str = "bot.db", user_cache_size: int = USER_CACHE_SIZE):
         self.db_path = db_path
+        # Строки users в памяти процесса: просмотр баланса и меню не обращаются к диску.
+        # Все изменения пользователей идут через этот класс и сбрасывают запись кэша.
+        self._users = LRUCache(user_cache_size)
+        # Последняя запись активности пользователя: (день UTC, time.monotonic())
+        self._activity_marks = LRUCache(user_cache_size)
         self.init_database()
     
     def init_database(self):
@@ -68,17 +142,235 @@ class Database:
                 )
             ''')
             
+            # Таблица заданий на анализ (переживают перезапуск бота)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS analysis_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    chat_id INTEGER,
+                    role TEXT,
+                    group_id TEXT,
+                    input_blob BLOB,
+                    text_length INTEGER,
+                    text_tokens INTEGER,
+                    status TEXT DEFAULT 'queued',
+                    attempts INTEGER DEFAULT 0,
+                    result_blob BLOB,
+                    tokens_used INTEGER DEFAULT 0,
+                    error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (user_id)
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_analysis_jobs_status
+                ON analysis_jobs (status, id)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_analysis_jobs_group
+                ON analysis_jobs (group_id)
+            ''')
+            
+            # Группы заданий, о завершении которых пользователь уже уведомлен
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS job_group_notifications (
+                    group_id TEXT PRIMARY KEY,
+                    notified_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Сжатые отчеты и исходные тексты для истории анализов
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS analysis_blobs (
+                    analysis_id INTEGER PRIMARY KEY,
+                    result_blob BLOB,
+                    input_blob BLOB,
+                    result_length INTEGER,
+                    FOREIGN KEY (analysis_id) REFERENCES analyses (id)
+                )
+            ''')
+            
+            # MinHash-сигнатуры текстов и LSH-корзины для поиска похожих прошлых отправок
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS analysis_signatures (
+                    analysis_id INTEGER PRIMARY KEY,
+                    signature BLOB,
+                    FOREIGN KEY (analysis_id) REFERENCES analyses (id)
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS analysis_lsh (
+                    user_id INTEGER,
+                    role TEXT,
+                    band INTEGER,
+                    bucket INTEGER,
+                    analysis_id INTEGER,
+                    PRIMARY KEY (user_id, role, band, bucket, analysis_id)
+                ) WITHOUT ROWID
+            ''')
+            
+            # Замечания к абзацам прошлых проверок (для повторной проверки измененных абзацев)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS paragraph_findings (
+                    user_id INTEGER,
+                    role TEXT,
+                    prompt_version TEXT,
+                    fingerprint TEXT,
+                    findings TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (user_id, role, prompt_version, fingerprint)
+                ) WITHOUT ROWID
+            ''')
+            
+            # Дневные сводки для /stats, обновляются при каждой записи
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_analysis_stats'")
+            stats_missing = cursor.fetchone() is None
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS daily_analysis_stats (
+                    day TEXT,
+                    role TEXT,
+                    analyses INTEGER DEFAULT 0,
+                    tokens_used INTEGER DEFAULT 0,
+                    text_length INTEGER DEFAULT 0,
+                    cache_hit_tokens INTEGER DEFAULT 0,
+                    cache_miss_tokens INTEGER DEFAULT 0,
+                    PRIMARY KEY (day, role)
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS daily_revenue_stats (
+                    day TEXT,
+                    tariff TEXT,
+                    payments INTEGER DEFAULT 0,
+                    amount REAL DEFAULT 0,
+                    credits INTEGER DEFAULT 0,
+                    PRIMARY KEY (day, tariff)
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS daily_user_stats (
+                    day TEXT PRIMARY KEY,
+                    new_users INTEGER DEFAULT 0,
+                    active_users INTEGER DEFAULT 0
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS daily_active_users (
+                    day TEXT,
+                    user_id INTEGER,
+                    PRIMARY KEY (day, user_id)
+                ) WITHOUT ROWID
+            ''')
+            
+            # Миграции: статистика кэша контекста DeepSeek
+            self._add_column_if_missing(cursor, 'analyses', 'prompt_cache_hit_tokens', 'INTEGER DEFAULT 0')
+            self._add_column_if_missing(cursor, 'analyses', 'prompt_cache_miss_tokens', 'INTEGER DEFAULT 0')
+            # Кэш контекста в дневной сводке: /cache_stats не сканирует analyses
+            self._add_column_if_missing(cursor, 'daily_analysis_stats', 'cache_hit_tokens', 'INTEGER DEFAULT 0')
+            if self._add_column_if_missing(cursor, 'daily_analysis_stats', 'cache_miss_tokens', 'INTEGER DEFAULT 0'):
+                cursor.execute('''
+                    UPDATE daily_analysis_stats SET
+                        cache_hit_tokens = COALESCE(totals.hit_tokens, 0),
+                        cache_miss_tokens = COALESCE(totals.miss_tokens, 0)
+                    FROM (
+                        SELECT date(created_at) AS day, role,
+                               SUM(prompt_cache_hit_tokens) AS hit_tokens,
+                               SUM(prompt_cache_miss_tokens) AS miss_tokens
+                        FROM analyses GROUP BY date(created_at), role
+                    ) AS totals
+                    WHERE daily_analysis_stats.day = totals.day AND daily_analysis_stats.role = totals.role
+                ''')
+            
+            # Миграции: MinHash-сигнатура текста задания
+            self._add_column_if_missing(cursor, 'analysis_jobs', 'signature', 'BLOB')
+            
+            # Миграции: класс приоритета задания
+            self._add_column_if_missing(cursor, 'analysis_jobs', 'priority', 'TEXT')
+            
+            # Миграции: версия промпта роли, с которым выполнен анализ
+            self._add_column_if_missing(cursor, 'analyses', 'prompt_version', 'TEXT')
+            
+            # Миграции: модель и параметры генерации, выбранные политикой маршрутизации
+            self._add_column_if_missing(cursor, 'analyses', 'model', 'TEXT')
+            self._add_column_if_missing(cursor, 'analyses', 'max_tokens', 'INTEGER')
+            self._add_column_if_missing(cursor, 'analyses', 'temperature', 'REAL')
+            
+            # Миграции: тариф платежа (раньше извлекался из метки платежа)
+            if self._add_column_if_missing(cursor, 'payments', 'tariff_key', 'TEXT'):
+                cursor.execute("SELECT id, amount, credits FROM payments")
+                cursor.executemany(
+                    "UPDATE payments SET tariff_key = ? WHERE id = ?",
+                    [(self.tariff_for_payment(amount, credits), payment_id)
+                     for payment_id, amount, credits in cursor.fetchall()]
+                )
+            
+            # Миграции: операция YooMoney, которой оплачен платеж (одна операция - один платеж)
+            self._add_column_if_missing(cursor, 'payments', 'operation_id', 'TEXT')
+            cursor.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_payments_operation_id
+                ON payments (operation_id)
+            ''')
+            
+            # Миграции: признак оплаты у пользователя. Старые платежи переносятся в архив,
+            # поэтому класс приоритета определяется по признаку, а не по таблице payments
+            if self._add_column_if_missing(cursor, 'users', 'has_paid', 'INTEGER DEFAULT 0'):
+                cursor.execute('''
+                    UPDATE users SET has_paid = 1
+                    WHERE user_id IN (SELECT user_id FROM payments WHERE status = 'completed')
+                ''')
+            
+            # Постраничный просмотр истории пользователя
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_analyses_user_created
+                ON analyses (user_id, created_at)
+            ''')
+            
+            if stats_missing:
+                # Первый запуск с дневными сводками: заполняем их по накопленным данным
+                self._backfill_stats(cursor)
+            
             conn.commit()
             logger.info("База данных инициализирована")
     
+    def _add_column_if_missing(self, cursor, table: str, column: str, definition: str) -> bool:
+        """Добавить колонку в существующую таблицу, если ее еще нет"""
+        cursor.execute(f"PRAGMA table_info({table})")
+        if column not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            logger.info(f"Добавлена колонка {table}.{column}")
+            return True
+        return False
+    
     def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
-        """Получить пользователя по ID"""
+        """Получить пользователя по ID (из кэша, если он там есть)"""
+        cached = self._users.get(user_id)
+        if cached is not None:
+            return None if cached is _MISSING else dict(cached)
+        
         with sqlite3.connect(self.db_path) as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
             row = cursor.fetchone()
-            return dict(row) if row else None
+        
+        if row:
+            user = dict(row)
+            self._users.put(user_id, user)
+            return dict(user)
+        if USER_CACHE_NEGATIVE:
+            self._users.put(user_id, _MISSING)
+        return None
+    
+    def get_user_cache_stats(self) -> Dict[str, Any]:
+        """Статистика кэша пользователей"""
+        requests = self._users.hits + self._users.misses
+        return {
+            'size': len(self._users),
+            'hits': self._users.hits,
+            'misses': self._users.misses,
+            'hit_ratio': self._users.hits / requests if requests else 0.0,
+        }
     
     def create_user(self, user_id: int, username: str = None, 
                    first_name: str = None, last_name: str = None) -> bool:
@@ -90,41 +382,75 @@ class Database:
                     INSERT INTO users (user_id, username, first_name, last_name, credits)
                     VALUES (?, ?, ?, ?, 1)
                 ''', (user_id, username, first_name, last_name))
+                cursor.execute('''
+                    INSERT INTO daily_user_stats (day, new_users) VALUES (date('now'), 1)
+                    ON CONFLICT (day) DO UPDATE SET new_users = new_users + 1
+                ''')
+                self._record_activity(cursor, user_id)
                 conn.commit()
                 logger.info(f"Создан новый пользователь: {user_id}")
                 return True
         except sqlite3.IntegrityError:
             logger.warning(f"Пользователь {user_id} уже существует")
             return False
+        finally:
+            self._users.invalidate(user_id)
     
     def update_user_activity(self, user_id: int):
-        """Обновить время последней активности пользователя"""
+        """
+        Обновить время последней активности пользователя
+        
+        Запись выполняется не чаще раза в USER_ACTIVITY_INTERVAL секунд и при смене
+        дня, поэтому дневной учет активных пользователей не теряется.
+        """
+        # date('now') в SQLite считается в UTC
+        today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        now = time.monotonic()
+        mark = self._activity_marks.get(user_id)
+        if mark and mark[0] == today and now - mark[1] < USER_ACTIVITY_INTERVAL:
+            return
+        if self._users.get(user_id) is _MISSING:
+            return
+        
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE users SET last_activity = CURRENT_TIMESTAMP 
                 WHERE user_id = ?
             ''', (user_id,))
+            updated = cursor.rowcount > 0
+            if updated:
+                self._record_activity(cursor, user_id)
             conn.commit()
+        
+        if updated:
+            self._activity_marks.put(user_id, (today, now))
+            self._users.invalidate(user_id)
+        elif USER_CACHE_NEGATIVE:
+            self._users.put(user_id, _MISSING)
     
     def get_user_credits(self, user_id: int) -> int:
         """Получить количество кредитов пользователя"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT credits FROM users WHERE user_id = ?", (user_id,))
-            result = cursor.fetchone()
-            return result[0] if result else 0
+        user = self.get_user(user_id)
+        return user['credits'] if user else 0
     
     def spend_credit(self, user_id: int) -> bool:
         """Списать 1 кредит у пользователя"""
+        return self.spend_credits(user_id, 1)
+    
+    def spend_credits(self, user_id: int, credits: int) -> bool:
+        """Атомарно списать несколько кредитов (все или ничего)"""
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                UPDATE users SET credits = credits - 1 
-                WHERE user_id = ? AND credits > 0
-            ''', (user_id,))
+                UPDATE users SET credits = credits - ? 
+                WHERE user_id = ? AND credits >= ?
+            ''', (credits, user_id, credits))
             conn.commit()
-            return cursor.rowcount > 0
+            if cursor.rowcount > 0:
+                self._users.invalidate(user_id)
+                return True
+            return False
     
     def add_credits(self, user_id: int, credits: int) -> bool:
         """Добавить кредиты пользователю"""
@@ -136,6 +462,7 @@ class Database:
                     WHERE user_id = ?
                 ''', (credits, user_id))
                 conn.commit()
+                self._users.invalidate(user_id)
                 logger.info(f"Добавлено {credits} кредитов пользователю {user_id}")
                 return True
         except Exception as e:
@@ -143,58 +470,114 @@ class Database:
             return False
     
     def create_payment(self, user_id: int, payment_id: str, 
-                      amount: float, credits: int) -> bool:
+                      amount: float, credits: int, tariff_key: str = None) -> bool:
         """Создать запись о платеже"""
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
-                    INSERT INTO payments (user_id, payment_id, amount, credits)
-                    VALUES (?, ?, ?, ?)
-                ''', (user_id, payment_id, amount, credits))
+                    INSERT INTO payments (user_id, payment_id, amount, credits, tariff_key)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (user_id, payment_id, amount, credits, tariff_key))
                 conn.commit()
                 return True
         except Exception as e:
             logger.error(f"Ошибка создания платежа: {e}")
             return False
     
-    def complete_payment(self, payment_id: str) -> Optional[Dict[str, Any]]:
-        """Завершить платеж и начислить кредиты"""
+    def get_payment(self, payment_id: str) -> Optional[Dict[str, Any]]:
+        """Получить платеж по идентификатору (поиск по уникальному индексу payment_id)"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM payments WHERE payment_id = ?", (payment_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    
+    def complete_payment(self, payment_id: str, operation_id: str = None) -> Optional[Dict[str, Any]]:
+        """Завершить платеж и начислить кредиты (None, если платеж не ожидает оплаты)"""
+        outcome = self.complete_payments([(payment_id, operation_id)]).get(payment_id)
+        if outcome and outcome['status'] == PAYMENT_COMPLETED:
+            return outcome['payment']
+        return None
+    
+    def complete_payments(self, items: List[Tuple[str, Optional[str]]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Завершить пачку платежей одной транзакцией и начислить кредиты
+        
+        Транзакция открывается через BEGIN IMMEDIATE, поэтому параллельные проверки
+        одного платежа (повторное нажатие, сверка в фоне) выполняются по очереди:
+        кредиты начисляет только первая, остальные получают already_completed.
+        Операция YooMoney (operation_id) уникальна и не может оплатить два платежа.
+        
+        Args:
+            items: список (payment_id, operation_id); operation_id может быть None
+            
+        Returns:
+            Dict[str, Dict]: payment_id -> {'status': ..., 'payment': данные платежа или None}
+        """
+        outcomes = {}
+        if not items:
+            return outcomes
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            conn = sqlite3.connect(self.db_path, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            try:
                 cursor = conn.cursor()
-                
-                # Получить информацию о платеже
-                cursor.execute('''
-                    SELECT * FROM payments 
-                    WHERE payment_id = ? AND status = 'pending'
-                ''', (payment_id,))
-                payment = cursor.fetchone()
-                
-                if not payment:
-                    return None
-                
-                # Обновить статус платежа
-                cursor.execute('''
-                    UPDATE payments 
-                    SET status = 'completed', completed_at = CURRENT_TIMESTAMP
-                    WHERE payment_id = ?
-                ''', (payment_id,))
-                
-                # Начислить кредиты
-                cursor.execute('''
-                    UPDATE users SET credits = credits + ?
-                    WHERE user_id = ?
-                ''', (payment['credits'], payment['user_id']))
-                
-                conn.commit()
-                logger.info(f"Платеж {payment_id} завершен, начислено {payment['credits']} кредитов")
-                return dict(payment)
-                
+                cursor.execute("BEGIN IMMEDIATE")
+                try:
+                    for payment_id, operation_id in items:
+                        outcomes[payment_id] = self._complete_payment(cursor, payment_id, operation_id)
+                    cursor.execute("COMMIT")
+                except Exception:
+                    cursor.execute("ROLLBACK")
+                    raise
+            finally:
+                conn.close()
         except Exception as e:
-            logger.error(f"Ошибка завершения платежа: {e}")
-            return None
+            logger.error(f"Ошибка завершения платежей: {e}")
+            return {payment_id: {'status': PAYMENT_ERROR, 'payment': None} for payment_id, _ in items}
+        
+        for payment_id, outcome in outcomes.items():
+            if outcome['status'] == PAYMENT_COMPLETED:
+                self._users.invalidate(outcome['payment']['user_id'])
+                logger.info(f"Платеж {payment_id} завершен, начислено {outcome['payment']['credits']} кредитов")
+        return outcomes
+    
+    def _complete_payment(self, cursor, payment_id: str, operation_id: Optional[str]) -> Dict[str, Any]:
+        """Завершить один платеж внутри открытой транзакции"""
+        cursor.execute("SELECT * FROM payments WHERE payment_id = ?", (payment_id,))
+        row = cursor.fetchone()
+        if not row:
+            return {'status': PAYMENT_NOT_FOUND, 'payment': None}
+        
+        payment = dict(row)
+        if not payment['tariff_key']:
+            payment['tariff_key'] = self.tariff_for_payment(payment['amount'], payment['credits'])
+        if payment['status'] != 'pending':
+            return {'status': PAYMENT_ALREADY_COMPLETED, 'payment': payment}
+        
+        # Обновить статус платежа; операция, уже оплатившая другой платеж, нарушит UNIQUE
+        try:
+            cursor.execute('''
+                UPDATE payments 
+                SET status = 'completed', completed_at = CURRENT_TIMESTAMP, operation_id = ?
+                WHERE id = ?
+            ''', (operation_id, payment['id']))
+        except sqlite3.IntegrityError:
+            logger.warning(f"Операция {operation_id} уже зачтена другому платежу, платеж {payment_id} не завершен")
+            return {'status': PAYMENT_DUPLICATE_OPERATION, 'payment': payment}
+        
+        # Начислить кредиты и отметить пользователя оплатившим (признак переживает архивирование платежей)
+        cursor.execute('''
+            UPDATE users SET credits = credits + ?, has_paid = 1
+            WHERE user_id = ?
+        ''', (payment['credits'], payment['user_id']))
+        
+        self._record_payment_stats(cursor, payment['tariff_key'], payment['amount'], payment['credits'])
+        payment['status'] = 'completed'
+        payment['operation_id'] = operation_id
+        return {'status': PAYMENT_COMPLETED, 'payment': payment}
     
     def save_support_message(self, user_id: int, message: str) -> bool:
         """Сохранить сообщение в поддержку"""
@@ -212,18 +595,641 @@ class Database:
             logger.error(f"Ошибка сохранения сообщения поддержки: {e}")
             return False
     
-    def save_analysis(self, user_id: int, role: str, text_length: int, tokens_used: int) -> bool:
+    def save_analysis(self, user_id: int, role: str, text_length: int, tokens_used: int,
+                      cache_hit_tokens: int = 0, cache_miss_tokens: int = 0,
+                      prompt_version: str = None, model: str = None, max_tokens: int = None,
+                      temperature: float = None) -> bool:
         """Сохранить информацию об анализе"""
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
-                    INSERT INTO analyses (user_id, role, text_length, tokens_used)
-                    VALUES (?, ?, ?, ?)
-                ''', (user_id, role, text_length, tokens_used))
+                    INSERT INTO analyses (user_id, role, text_length, tokens_used,
+                                          prompt_cache_hit_tokens, prompt_cache_miss_tokens, prompt_version,
+                                          model, max_tokens, temperature)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (user_id, role, text_length, tokens_used, cache_hit_tokens, cache_miss_tokens,
+                      prompt_version, model, max_tokens, temperature))
+                self._record_analysis_stats(
+                    cursor, role, tokens_used, text_length, cache_hit_tokens, cache_miss_tokens
+                )
                 conn.commit()
                 return True
         except Exception as e:
             logger.error(f"Ошибка сохранения анализа: {e}")
             return False
+    
+    def get_priority_class(self, user_id: int) -> str:
+        """
+        Класс приоритета анализов пользователя
+        
+        Администратор - PRIORITY_ADMIN, пользователь хотя бы с одним завершенным
+        платежом (users.has_paid) - PRIORITY_PAID, остальные (только пробные
+        кредиты) - PRIORITY_FREE
+        """
+        if str(user_id) == str(ADMIN_USER_ID):
+            return PRIORITY_ADMIN
+        try:
+            user = self.get_user(user_id)
+            return PRIORITY_PAID if user and user.get('has_paid') else PRIORITY_FREE
+        except Exception as e:
+            logger.error(f"Ошибка определения приоритета пользователя {user_id}: {e}")
+            return PRIORITY_FREE
+    
+    def enqueue_analysis_jobs(self, user_id: int, chat_id: int, roles: List[str], text: str,
+                              text_tokens: int, group_id: str = None,
+                              signature: bytes = None,
+                              priority: str = PRIORITY_FREE) -> Optional[List[int]]:
+        """
+        Создать задания на анализ и зарезервировать кредиты одной транзакцией
+        
+        Returns:
+            Optional[List[int]]: ID заданий или None, если кредитов недостаточно
+        """
+        input_blob = compress_text(text)
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE users SET credits = credits - ? 
+                    WHERE user_id = ? AND credits >= ?
+                ''', (len(roles), user_id, len(roles)))
+                if cursor.rowcount == 0:
+                    return None
+                
+                job_ids = []
+                for role in roles:
+                    cursor.execute('''
+                        INSERT INTO analysis_jobs (user_id, chat_id, role, group_id, input_blob,
+                                                   text_length, text_tokens, signature, priority)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (user_id, chat_id, role, group_id, input_blob, len(text), text_tokens, signature,
+                          priority))
+                    job_ids.append(cursor.lastrowid)
+                conn.commit()
+                self._users.invalidate(user_id)
+                logger.info(f"Созданы задания на анализ {job_ids} для пользователя {user_id}")
+                return job_ids
+        except Exception as e:
+            logger.error(f"Ошибка создания заданий на анализ: {e}")
+            return None
+    
+    def claim_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Взять задание в работу (только из очереди) и вернуть его с распакованным текстом"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE analysis_jobs
+                SET status = 'running', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'queued'
+            ''', (job_id,))
+            if cursor.rowcount == 0:
+                return None
+            cursor.execute("SELECT * FROM analysis_jobs WHERE id = ?", (job_id,))
+            job = dict(cursor.fetchone())
+            conn.commit()
+        
+        job['text'] = decompress_text(job.pop('input_blob'))
+        return job
+    
+    def complete_job(self, job: Dict[str, Any], result: str, tokens_used: int,
+                     cache_hit_tokens: int = 0, cache_miss_tokens: int = 0,
+                     prompt_version: str = None, model: str = None, max_tokens: int = None,
+                     temperature: float = None) -> Optional[int]:
+        """
+        Сохранить результат задания, запись об анализе и отчет для истории одной транзакцией
+        
+        Returns:
+            Optional[int]: ID записи об анализе или None при ошибке
+        """
+        result_blob = compress_text(result)
+        # Исходный текст копируется в историю уже сжатым, если не превышает лимит
+        input_limit = HISTORY_MAX_INPUT_BLOB_SIZE if HISTORY_STORE_INPUTS else -1
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE analysis_jobs
+                    SET status = 'done', result_blob = ?, tokens_used = ?, error = NULL,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (result_blob, tokens_used, job['id']))
+                cursor.execute('''
+                    INSERT INTO analyses (user_id, role, text_length, tokens_used,
+                                          prompt_cache_hit_tokens, prompt_cache_miss_tokens, prompt_version,
+                                          model, max_tokens, temperature)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (job['user_id'], job['role'], job['text_length'], tokens_used,
+                      cache_hit_tokens, cache_miss_tokens, prompt_version, model, max_tokens, temperature))
+                analysis_id = cursor.lastrowid
+                self._record_analysis_stats(
+                    cursor, job['role'], tokens_used, job['text_length'], cache_hit_tokens, cache_miss_tokens
+                )
+                cursor.execute('''
+                    INSERT INTO analysis_blobs (analysis_id, result_blob, input_blob, result_length)
+                    SELECT ?, ?, CASE WHEN length(input_blob) <= ? THEN input_blob END, ?
+                    FROM analysis_jobs WHERE id = ?
+                ''', (analysis_id, result_blob, input_limit, len(result), job['id']))
+                if job.get('signature'):
+                    self._index_signature(cursor, analysis_id, job['user_id'], job['role'], job['signature'])
+                conn.commit()
+                return analysis_id
+        except Exception as e:
+            logger.error(f"Ошибка сохранения результата задания {job['id']}: {e}")
+            return None
+    
+    def requeue_job(self, job_id: int, error: str):
+        """Вернуть задание в очередь для повторной попытки"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                UPDATE analysis_jobs
+                SET status = 'queued', error = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (error, job_id))
+            conn.commit()
+    
+    def fail_job(self, job: Dict[str, Any], error: str) -> bool:
+        """Пометить задание неудавшимся и вернуть зарезервированный кредит"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE analysis_jobs
+                    SET status = 'failed', error = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND status = 'running'
+                ''', (error, job['id']))
+                if cursor.rowcount > 0:
+                    cursor.execute('''
+                        UPDATE users SET credits = credits + 1
+                        WHERE user_id = ?
+                    ''', (job['user_id'],))
+                conn.commit()
+                self._users.invalidate(job['user_id'])
+                return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Ошибка завершения задания {job['id']}: {e}")
+            return False
+    
+    def mark_job_delivered(self, job_id: int):
+        """Пометить результат задания доставленным пользователю"""
+        # Тексты доставленного задания уже сохранены в истории (analysis_blobs)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                UPDATE analysis_jobs
+                SET status = 'delivered', input_blob = NULL, result_blob = NULL, signature = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (job_id,))
+            conn.commit()
+    
+    def get_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Получить задание с распакованным результатом (без входного текста)"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, user_id, chat_id, role, group_id, text_length, status, attempts,
+                       result_blob, tokens_used, error, created_at, updated_at
+                FROM analysis_jobs WHERE id = ?
+            ''', (job_id,))
+            row = cursor.fetchone()
+        if not row:
+            return None
+        job = dict(row)
+        job['result'] = decompress_text(job.pop('result_blob'))
+        return job
+    
+    def recover_jobs(self) -> Dict[str, List[Tuple[int, Optional[str]]]]:
+        """
+        Восстановить задания после перезапуска: прерванные возвращаются в очередь
+        
+        Returns:
+            Dict со списками (ID, класс приоритета): 'queued' - ожидают выполнения,
+            'done' - ожидают доставки
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE analysis_jobs SET status = 'queued', updated_at = CURRENT_TIMESTAMP
+                WHERE status = 'running'
+            ''')
+            if cursor.rowcount:
+                logger.info(f"Возвращено в очередь прерванных заданий: {cursor.rowcount}")
+            conn.commit()
+            
+            recovered = {}
+            for status in ('queued', 'done'):
+                cursor.execute(
+                    "SELECT id, priority FROM analysis_jobs WHERE status = ? ORDER BY id", (status,)
+                )
+                recovered[status] = cursor.fetchall()
+            return recovered
+    
+    def get_job_group_summary(self, group_id: str) -> Dict[str, int]:
+        """Количество заданий группы по статусам"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT status, COUNT(*) FROM analysis_jobs
+                WHERE group_id = ? GROUP BY status
+            ''', (group_id,))
+            return dict(cursor.fetchall())
+    
+    def claim_group_notification(self, group_id: str) -> bool:
+        """
+        Атомарно занять уведомление о завершении группы
 
+        Returns:
+            bool: True ровно для одного вызова на группу, в том числе после перезапуска
+        """
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    'INSERT OR IGNORE INTO job_group_notifications (group_id) VALUES (?)', (group_id,)
+                )
+                return cursor.rowcount == 1
+        except Exception as e:
+            logger.error(f"Ошибка отметки уведомления группы {group_id}: {e}")
+            return False
+    
+    def get_analysis_history(self, user_id: int, limit: int = HISTORY_PAGE_SIZE,
+                             before_id: int = None) -> List[Dict[str, Any]]:
+        """
+        Страница истории анализов пользователя, новые первыми
+        
+        Пагинация по ключу: следующая страница начинается после анализа before_id,
+        поэтому запрос читает только limit строк индекса (user_id, created_at).
+        """
+        query = '''
+            SELECT a.id, a.role, a.text_length, a.created_at,
+                   b.input_blob IS NOT NULL AS has_input
+            FROM analyses a
+            JOIN analysis_blobs b ON b.analysis_id = a.id
+            WHERE a.user_id = ?
+        '''
+        params = [user_id]
+        if before_id is not None:
+            query += '''
+              AND (a.created_at, a.id) < (SELECT created_at, id FROM analyses WHERE id = ?)
+            '''
+            params.append(before_id)
+        query += " ORDER BY a.created_at DESC, a.id DESC LIMIT ?"
+        params.append(limit)
+        
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_analysis_report(self, user_id: int, analysis_id: int,
+                            with_input: bool = False) -> Optional[Dict[str, Any]]:
+        """Получить сохраненный отчет пользователя (и при необходимости исходный текст)"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT a.id, a.role, a.text_length, a.created_at, b.result_blob,
+                       b.input_blob IS NOT NULL AS has_input
+                       {', b.input_blob' if with_input else ''}
+                FROM analyses a
+                JOIN analysis_blobs b ON b.analysis_id = a.id
+                WHERE a.id = ? AND a.user_id = ?
+            ''', (analysis_id, user_id))
+            row = cursor.fetchone()
+        if not row:
+            return None
+        report = dict(row)
+        report['result'] = decompress_text(report.pop('result_blob'))
+        if with_input:
+            report['input'] = decompress_text(report.pop('input_blob'))
+        return report
+    
+    def _index_signature(self, cursor, analysis_id: int, user_id: int, role: str, signature: bytes):
+        """Сохранить сигнатуру анализа и его LSH-корзины"""
+        cursor.execute(
+            "INSERT OR REPLACE INTO analysis_signatures (analysis_id, signature) VALUES (?, ?)",
+            (analysis_id, signature)
+        )
+        cursor.executemany('''
+            INSERT OR IGNORE INTO analysis_lsh (user_id, role, band, bucket, analysis_id)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(user_id, role, band, bucket, analysis_id) for band, bucket in lsh_buckets(signature)])
+    
+    def find_similar_analysis(self, user_id: int, role: str, signature: bytes,
+                              threshold: float = SIMILARITY_THRESHOLD) -> Optional[Dict[str, Any]]:
+        """
+        Найти самый похожий прошлый анализ пользователя той же ролью
+        
+        Кандидаты выбираются по совпадающим LSH-корзинам (поиск по первичному ключу),
+        затем сравниваются сигнатуры. Учитываются только анализы, отчет которых
+        еще хранится в истории.
+        
+        Returns:
+            Optional[Dict]: {'analysis_id', 'similarity', 'created_at'} или None
+        """
+        buckets = lsh_buckets(signature)
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT l.analysis_id, s.signature, a.created_at
+                FROM (
+                    SELECT lsh.analysis_id, COUNT(*) AS bands
+                    FROM (VALUES {", ".join(["(?, ?)"] * len(buckets))}) v
+                    JOIN analysis_lsh lsh
+                      ON lsh.user_id = ? AND lsh.role = ? AND lsh.band = v.column1 AND lsh.bucket = v.column2
+                    GROUP BY lsh.analysis_id
+                    ORDER BY bands DESC, lsh.analysis_id DESC
+                    LIMIT ?
+                ) l
+                JOIN analysis_signatures s ON s.analysis_id = l.analysis_id
+                JOIN analyses a ON a.id = l.analysis_id
+                WHERE EXISTS (SELECT 1 FROM analysis_blobs b WHERE b.analysis_id = l.analysis_id)
+            ''', (*[value for bucket in buckets for value in bucket], user_id, role, SIMILARITY_MAX_CANDIDATES))
+            candidates = cursor.fetchall()
+        
+        best = None
+        for analysis_id, candidate, created_at in candidates:
+            score = similarity(signature, candidate)
+            if score >= threshold and (best is None or score > best['similarity']):
+                best = {'analysis_id': analysis_id, 'similarity': score, 'created_at': created_at}
+        return best
+    
+    def get_paragraph_findings(self, user_id: int, role: str, prompt_version: str,
+                               fingerprints: List[str]) -> Dict[str, str]:
+        """Замечания прошлых проверок к абзацам с заданными отпечатками"""
+        findings = {}
+        fingerprints = list(fingerprints)
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            # Пачками, чтобы не упереться в лимит параметров SQLite
+            for start in range(0, len(fingerprints), 500):
+                chunk = fingerprints[start:start + 500]
+                cursor.execute(f'''
+                    SELECT fingerprint, findings FROM paragraph_findings
+                    WHERE user_id = ? AND role = ? AND prompt_version = ?
+                      AND fingerprint IN ({", ".join("?" * len(chunk))})
+                ''', (user_id, role, prompt_version, *chunk))
+                findings.update(cursor.fetchall())
+        return findings
+    
+    def save_paragraph_findings(self, user_id: int, role: str, prompt_version: str,
+                                findings: Dict[str, str]) -> bool:
+        """Запомнить замечания к абзацам (отпечаток абзаца -> текст замечаний)"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.executemany('''
+                    INSERT INTO paragraph_findings (user_id, role, prompt_version, fingerprint, findings)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (user_id, role, prompt_version, fingerprint) DO UPDATE SET
+                        findings = excluded.findings,
+                        created_at = CURRENT_TIMESTAMP
+                ''', [(user_id, role, prompt_version, fingerprint, text)
+                      for fingerprint, text in findings.items()])
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Ошибка сохранения замечаний к абзацам: {e}")
+            return False
+    
+    def prune_history(self, retention_days: int = HISTORY_RETENTION_DAYS,
+                      max_per_user: int = HISTORY_MAX_PER_USER) -> int:
+        """
+        Удалить из истории отчеты старше срока хранения и сверх лимита на пользователя
+        
+        Записи в analyses остаются для статистики, удаляются только тексты.
+        
+        Returns:
+            int: количество удаленных отчетов
+        """
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    DELETE FROM analysis_blobs WHERE analysis_id IN (
+                        SELECT id FROM analyses WHERE created_at < datetime('now', ?)
+                    )
+                ''', (f'-{retention_days} days',))
+                removed = cursor.rowcount
+                cursor.execute('''
+                    DELETE FROM analysis_blobs WHERE analysis_id IN (
+                        SELECT id FROM (
+                            SELECT a.id, ROW_NUMBER() OVER (
+                                PARTITION BY a.user_id ORDER BY a.created_at DESC, a.id DESC
+                            ) AS position
+                            FROM analyses a
+                            JOIN analysis_blobs b ON b.analysis_id = a.id
+                        ) WHERE position > ?
+                    )
+                ''', (max_per_user,))
+                removed += cursor.rowcount
+                cursor.execute(
+                    "DELETE FROM paragraph_findings WHERE created_at < datetime('now', ?)",
+                    (f'-{retention_days} days',)
+                )
+                # Сигнатуры отчетов, удаленных из истории или перенесенных в архив
+                cursor.execute('''
+                    SELECT analysis_id FROM analysis_signatures
+                    WHERE analysis_id NOT IN (SELECT analysis_id FROM analysis_blobs)
+                ''')
+                orphaned = [(row[0],) for row in cursor.fetchall()]
+                cursor.executemany("DELETE FROM analysis_signatures WHERE analysis_id = ?", orphaned)
+                cursor.executemany("DELETE FROM analysis_lsh WHERE analysis_id = ?", orphaned)
+                conn.commit()
+                if removed:
+                    logger.info(f"Удалено отчетов из истории: {removed}")
+                return removed
+        except Exception as e:
+            logger.error(f"Ошибка очистки истории анализов: {e}")
+            return 0
+    
+    def _record_analysis_stats(self, cursor, role: str, tokens_used: int, text_length: int,
+                               cache_hit_tokens: int = 0, cache_miss_tokens: int = 0):
+        """Учесть анализ в дневной сводке (в транзакции записи об анализе)"""
+        cursor.execute('''
+            INSERT INTO daily_analysis_stats (day, role, analyses, tokens_used, text_length,
+                                              cache_hit_tokens, cache_miss_tokens)
+            VALUES (date('now'), ?, 1, ?, ?, ?, ?)
+            ON CONFLICT (day, role) DO UPDATE SET
+                analyses = analyses + 1,
+                tokens_used = tokens_used + excluded.tokens_used,
+                text_length = text_length + excluded.text_length,
+                cache_hit_tokens = cache_hit_tokens + excluded.cache_hit_tokens,
+                cache_miss_tokens = cache_miss_tokens + excluded.cache_miss_tokens
+        ''', (role, tokens_used, text_length, cache_hit_tokens or 0, cache_miss_tokens or 0))
+    
+    def _record_payment_stats(self, cursor, tariff_key: str, amount: float, credits: int):
+        """Учесть завершенный платеж в дневной сводке выручки"""
+        cursor.execute('''
+            INSERT INTO daily_revenue_stats (day, tariff, payments, amount, credits)
+            VALUES (date('now'), ?, 1, ?, ?)
+            ON CONFLICT (day, tariff) DO UPDATE SET
+                payments = payments + 1,
+                amount = amount + excluded.amount,
+                credits = credits + excluded.credits
+        ''', (tariff_key, amount, credits))
+    
+    def _record_activity(self, cursor, user_id: int):
+        """Отметить пользователя активным сегодня (один раз в день)"""
+        cursor.execute(
+            "INSERT OR IGNORE INTO daily_active_users (day, user_id) VALUES (date('now'), ?)",
+            (user_id,)
+        )
+        if cursor.rowcount:
+            cursor.execute('''
+                INSERT INTO daily_user_stats (day, active_users) VALUES (date('now'), 1)
+                ON CONFLICT (day) DO UPDATE SET active_users = active_users + 1
+            ''')
+    
+    @staticmethod
+    def tariff_for_payment(amount: float, credits: int) -> str:
+        """Ключ тарифа каталога по сумме и количеству кредитов платежа"""
+        tariffs = catalog.current().tariffs
+        for key, tariff in tariffs.items():
+            if tariff['credits'] == credits and tariff['price'] == amount:
+                return key
+        for key, tariff in tariffs.items():
+            if tariff['credits'] == credits:
+                return key
+        return 'other'
+    
+    def _backfill_stats(self, cursor):
+        """
+        Однократно заполнить только что созданные дневные сводки по исходным таблицам
+        
+        Пересчета сводок нет намеренно: активность по дням хранится только в
+        daily_active_users, а старые анализы и платежи уходят в архив, поэтому
+        повторный расчет по основной базе потерял бы историю.
+        """
+        cursor.execute('''
+            INSERT INTO daily_analysis_stats (day, role, analyses, tokens_used, text_length,
+                                              cache_hit_tokens, cache_miss_tokens)
+            SELECT date(created_at), role, COUNT(*), COALESCE(SUM(tokens_used), 0),
+                   COALESCE(SUM(text_length), 0), COALESCE(SUM(prompt_cache_hit_tokens), 0),
+                   COALESCE(SUM(prompt_cache_miss_tokens), 0)
+            FROM analyses
+            GROUP BY date(created_at), role
+        ''')
+        
+        cursor.execute('''
+            SELECT date(COALESCE(completed_at, created_at)), tariff_key, amount, credits
+            FROM payments WHERE status = 'completed'
+        ''')
+        revenue = {}
+        for day, tariff_key, amount, credits in cursor.fetchall():
+            tariff_key = tariff_key or self.tariff_for_payment(amount, credits)
+            item = revenue.setdefault((day, tariff_key), [0, 0.0, 0])
+            item[0] += 1
+            item[1] += amount or 0
+            item[2] += credits or 0
+        cursor.executemany('''
+            INSERT INTO daily_revenue_stats (day, tariff, payments, amount, credits)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(day, tariff, *values) for (day, tariff), values in revenue.items()])
+        
+        # До появления сводок известна только последняя активность пользователя
+        cursor.execute('''
+            INSERT OR IGNORE INTO daily_active_users (day, user_id)
+            SELECT date(last_activity), user_id FROM users WHERE last_activity IS NOT NULL
+        ''')
+        cursor.execute('''
+            INSERT INTO daily_user_stats (day, new_users)
+            SELECT date(created_at), COUNT(*) FROM users GROUP BY date(created_at)
+        ''')
+        cursor.execute('''
+            INSERT INTO daily_user_stats (day, active_users)
+            SELECT day, COUNT(*) FROM daily_active_users GROUP BY day
+            ON CONFLICT (day) DO UPDATE SET active_users = excluded.active_users
+        ''')
+        logger.info("Дневные сводки статистики заполнены по накопленным данным")
+    
+    def get_stats(self, periods: Tuple[int, ...] = (1, 7, 30)) -> Dict[str, Any]:
+        """
+        Статистика для администратора по дневным сводкам
+        
+        Args:
+            periods: Периоды в днях, включая сегодняшний (1 - только сегодня)
+        
+        Returns:
+            Dict: 'periods', 'users', 'active_users', 'new_users', 'analyses' (по ролям),
+            'revenue' (по тарифам); значения по периодам - списки в порядке periods
+        """
+        longest = max(periods)
+        starts = [f'-{days - 1} days' for days in periods]
+        
+        def period_sums(columns: List[str]) -> str:
+            return ", ".join(
+                f"SUM(CASE WHEN day >= date('now', ?) THEN {column} ELSE 0 END)"
+                for column in columns for _ in periods
+            )
+        
+        def split(row, columns: List[str]) -> Dict[str, List]:
+            values = list(row)
+            return {
+                column: [values.pop(0) or 0 for _ in periods]
+                for column in columns
+            }
+        
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            stats = {'periods': list(periods)}
+            
+            columns = ['new_users', 'active_users']
+            cursor.execute(f'''
+                SELECT {period_sums(columns)} FROM daily_user_stats
+                WHERE day >= date('now', ?)
+            ''', starts * len(columns) + [f'-{longest - 1} days'])
+            stats.update(split(cursor.fetchone(), columns))
+            
+            # Уникальные активные пользователи за период (сводка хранит только дневные значения)
+            stats['unique_active_users'] = []
+            for start in starts:
+                cursor.execute(
+                    "SELECT COUNT(DISTINCT user_id) FROM daily_active_users WHERE day >= date('now', ?)",
+                    (start,)
+                )
+                stats['unique_active_users'].append(cursor.fetchone()[0])
+            
+            cursor.execute("SELECT COALESCE(SUM(new_users), 0) FROM daily_user_stats")
+            stats['users'] = cursor.fetchone()[0]
+            
+            columns = ['analyses', 'tokens_used']
+            cursor.execute(f'''
+                SELECT role, {period_sums(columns)} FROM daily_analysis_stats
+                WHERE day >= date('now', ?)
+                GROUP BY role ORDER BY role
+            ''', starts * len(columns) + [f'-{longest - 1} days'])
+            stats['analyses'] = {row[0]: split(row[1:], columns) for row in cursor.fetchall()}
+            
+            columns = ['payments', 'amount']
+            cursor.execute(f'''
+                SELECT tariff, {period_sums(columns)} FROM daily_revenue_stats
+                WHERE day >= date('now', ?)
+                GROUP BY tariff ORDER BY tariff
+            ''', starts * len(columns) + [f'-{longest - 1} days'])
+            stats['revenue'] = {row[0]: split(row[1:], columns) for row in cursor.fetchall()}
+            return stats
+    
+    def get_cache_stats(self) -> List[Dict[str, Any]]:
+        """Доля попаданий в кэш контекста DeepSeek по ролям (по дневным сводкам, с учетом архива)"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT role,
+                       SUM(analyses) AS analyses,
+                       COALESCE(SUM(cache_hit_tokens), 0) AS hit_tokens,
+                       COALESCE(SUM(cache_miss_tokens), 0) AS miss_tokens
+                FROM daily_analysis_stats
+                GROUP BY role
+                ORDER BY role
+            ''')
+            stats = []
+            for row in cursor.fetchall():
+                item = dict(row)
+                total = item['hit_tokens'] + item['miss_tokens']
+                item['hit_ratio'] = item['hit_tokens'] / total if total else 0.0
+                stats.append(item)
+            return stats
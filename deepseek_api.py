@@ -1,18 +1,47 @@
 import openai
 import tiktoken
+import hashlib
 import logging
-from typing import Optional, Tuple
-from config import DEEPSEEK_API_KEY, DEEPSEEK_API_BASE, MAX_TOKENS_PER_REQUEST
-from roles import ROLES
+from typing import Optional, Tuple, Dict, Any
+from config import DEEPSEEK_API_KEY, DEEPSEEK_API_BASE, DEEPSEEK_ENDPOINTS, MAX_TOKENS_PER_REQUEST
+from catalog import catalog
+from singleflight import SingleFlight, content_key
+from routing import Route
+from endpoints import EndpointPool, parse_endpoints
+from limiter import AdaptiveLimiter
+import http_pool
 
 logger = logging.getLogger(__name__)
 
+# Инструкция перед текстом пользователя. Вместе с промптом роли образует
+# неизменный префикс запроса, который DeepSeek кэширует на своей стороне
+ANALYSIS_INSTRUCTION = "Проанализируй следующий текст:\n\n"
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Пауза из заголовка Retry-After ответа с ошибкой, если он есть"""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
 class DeepSeekAPI:
     def __init__(self):
         """Инициализация клиента DeepSeek API"""
-        self.client = openai.OpenAI(
-            api_key=DEEPSEEK_API_KEY,
-            base_url=DEEPSEEK_API_BASE
+        # Асинхронные клиенты по одному на ключ и адрес: запросы не блокируют event loop,
+        # выполняются параллельно и распределяются между точками пула
+        endpoints = parse_endpoints(DEEPSEEK_ENDPOINTS, DEEPSEEK_API_KEY, DEEPSEEK_API_BASE)
+        # С несколькими точками повтор после 429/5xx уходит в другую точку, а не в ту же
+        client_options = {'max_retries': 0} if len(endpoints) > 1 else {}
+        # Клиенты точек делят один пул соединений http_pool.client (keep-alive, кэш DNS)
+        self.pool = EndpointPool(
+            endpoints,
+            lambda api_key, base_url: openai.AsyncOpenAI(
+                api_key=api_key, base_url=base_url, http_client=http_pool.client, **client_options
+            )
         )
         
         # Инициализация токенизатора для подсчета токенов
@@ -21,6 +50,17 @@ class DeepSeekAPI:
         except Exception as e:
             logger.error(f"Ошибка инициализации токенизатора: {e}")
             self.tokenizer = None
+        
+        # Префиксы запросов по ролям и версиям промптов:
+        # (системное сообщение, токены префикса, отпечаток, версия промпта)
+        self._prefixes: Dict[Tuple[str, str], Tuple[Dict[str, str], int, str, str]] = {}
+        
+        # Одинаковые анализы (роль, версия промпта, текст), выполняющиеся одновременно
+        self.inflight = SingleFlight()
+        
+        # Число одновременных запросов подстраивается под текущую пропускную способность DeepSeek;
+        # объединенные запросы места не занимают
+        self.limiter = AdaptiveLimiter()
     
     def count_tokens(self, text: str) -> int:
         """Подсчет количества токенов в тексте"""
@@ -34,112 +74,250 @@ class DeepSeekAPI:
             logger.error(f"Ошибка подсчета токенов: {e}")
             return len(text) // 4
     
-    def prepare_messages(self, role_key: str, user_text: str) -> list:
-        """Подготовка сообщений для API"""
-        if role_key not in ROLES:
+    def _get_prefix(self, role_key: str, snapshot=None) -> Tuple[Dict[str, str], int, str, str]:
+        """
+        Неизменный префикс запроса для роли.
+        
+        Системное сообщение собирается один раз для каждой версии промпта и затем
+        переиспользуется, поэтому каждый запрос роли начинается с побайтно
+        одинакового префикса и попадает в кэш контекста DeepSeek.
+        """
+        snapshot = snapshot or catalog.current()
+        if role_key not in snapshot.roles:
             raise ValueError(f"Неизвестная роль: {role_key}")
         
-        role_info = ROLES[role_key]
+        key = (role_key, snapshot.prompt_versions[role_key])
+        prefix = self._prefixes.get(key)
+        if prefix is None:
+            system_message = {"role": "system", "content": snapshot.roles[role_key]["prompt"]}
+            prefix_text = system_message["content"] + ANALYSIS_INSTRUCTION
+            prefix_tokens = self.count_tokens(prefix_text)
+            fingerprint = hashlib.sha256(prefix_text.encode("utf-8")).hexdigest()[:16]
+            
+            prefix = (system_message, prefix_tokens, fingerprint, key[1])
+            self._prefixes[key] = prefix
+            logger.info(
+                f"Префикс роли {role_key} (промпт {key[1]}): {prefix_tokens} токенов, отпечаток {fingerprint}"
+            )
+        
+        return prefix
+    
+    def get_prefix_fingerprint(self, role_key: str) -> str:
+        """Отпечаток префикса роли (для проверки стабильности кэша)"""
+        return self._get_prefix(role_key)[2]
+    
+    def prepare_messages(self, role_key: str, user_text: str, prefix: Tuple = None,
+                         instruction: str = ANALYSIS_INSTRUCTION, notes: str = '') -> list:
+        """
+        Подготовка сообщений для API
+        
+        Сведения notes (итоги локальной проверки, статистика текста) ставятся перед
+        инструкцией: системное сообщение роли остается неизменным префиксом для кэша.
+        """
+        system_message = (prefix or self._get_prefix(role_key))[0]
         
         messages = [
-            {
-                "role": "system",
-                "content": role_info["prompt"]
-            },
+            system_message,
             {
                 "role": "user", 
-                "content": f"Проанализируй следующий текст:\n\n{user_text}"
+                "content": notes + instruction + user_text
             }
         ]
         
         return messages
     
-    async def analyze_text(self, role_key: str, user_text: str) -> Tuple[Optional[str], int]:
+    def _extract_cache_usage(self, response) -> Dict[str, int]:
+        """Статистика кэша контекста из поля usage ответа DeepSeek"""
+        usage = getattr(response, "usage", None)
+        return {
+            'prompt_cache_hit_tokens': getattr(usage, "prompt_cache_hit_tokens", None) or 0,
+            'prompt_cache_miss_tokens': getattr(usage, "prompt_cache_miss_tokens", None) or 0,
+        }
+    
+    async def _request(self, role_key: str, messages: list, total_tokens: int, route: Route,
+                       priority: Optional[str] = None):
+        """Запрос к DeepSeek API в пределах адаптивного лимита одновременных запросов"""
+        started = await self.limiter.acquire(priority)
+        output_tokens = None
+        overloaded = False
+        try:
+            logger.info(
+                f"Отправка запроса к DeepSeek API. Роль: {role_key}, токенов: {total_tokens}, "
+                f"модель: {route.model}, max_tokens: {route.max_tokens}, temperature: {route.temperature}"
+            )
+            response = await self._send(messages, route)
+            usage = getattr(response, "usage", None)
+            output_tokens = getattr(usage, "completion_tokens", None) or 0
+            return response
+        except openai.RateLimitError:
+            # 429 от всех точек пула: запросов больше, чем DeepSeek сейчас принимает
+            overloaded = True
+            raise
+        finally:
+            self.limiter.release(started, output_tokens, overloaded)
+    
+    async def _send(self, messages: list, route: Route):
+        """Отправка запроса в точку пула с переходом в следующую при лимите или сбое"""
+        tried = ()
+        while True:
+            endpoint = self.pool.acquire(exclude=tried)
+            try:
+                response = await endpoint.client.chat.completions.create(
+                    model=route.model,
+                    messages=messages,
+                    max_tokens=route.max_tokens,
+                    temperature=route.temperature,
+                    stream=False
+                )
+            except (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError) as e:
+                # Лимит или сбой точки: исключаем ее и пробуем следующую
+                self.pool.release(endpoint, failed=True, retry_after=_retry_after(e))
+                tried += (endpoint,)
+                if len(tried) >= len(self.pool):
+                    raise
+                logger.warning(f"Точка DeepSeek {endpoint.name} не ответила ({e.__class__.__name__}), повтор через другую")
+                continue
+            except BaseException:
+                self.pool.release(endpoint)
+                raise
+            self.pool.release(endpoint)
+            return response
+    
+    async def analyze_text(self, role_key: str, user_text: str, text_tokens: Optional[int] = None,
+                           instruction: str = ANALYSIS_INSTRUCTION, notes: str = '',
+                           max_tokens: Optional[int] = None,
+                           priority: Optional[str] = None) -> Tuple[Optional[str], int, Dict[str, Any]]:
         """
         Анализ текста с помощью DeepSeek API
         
         Args:
             role_key: Ключ роли (beta_reader, proofreader, editor)
             user_text: Текст для анализа
+            text_tokens: Заранее подсчитанное количество токенов текста (чтобы не токенизировать повторно)
+            instruction: Инструкция перед текстом (по умолчанию ANALYSIS_INSTRUCTION)
+            notes: Сведения для модели перед инструкцией (см. prepare_messages)
+            max_tokens: Лимит длины ответа модели вместо выбранного политикой маршрутизации
+            priority: Класс приоритета задания для очереди лимита запросов (admin, paid, free)
             
         Returns:
-            Tuple[Optional[str], int]: (результат анализа, количество использованных токенов)
+            Tuple[Optional[str], int, Dict[str, Any]]: (результат анализа, количество использованных токенов,
+                статистика кэша контекста prompt_cache_hit_tokens/prompt_cache_miss_tokens,
+                версия промпта роли prompt_version, параметры запроса model/max_tokens/temperature,
+                причина завершения ответа finish_reason
+                и признак coalesced - ответ получен от одновременного одинакового запроса).
+                При ошибке API возвращается текст ошибки и 0 токенов.
         """
+        cache_usage = {'prompt_cache_hit_tokens': 0, 'prompt_cache_miss_tokens': 0}
         try:
-            # Подготавливаем сообщения
-            messages = self.prepare_messages(role_key, user_text)
+            # Подготавливаем сообщения: префикс, версия промпта и маршрут берутся из одного снимка каталога
+            snapshot = catalog.current()
+            prefix = self._get_prefix(role_key, snapshot)
+            messages = self.prepare_messages(role_key, user_text, prefix, instruction, notes)
             
-            # Подсчитываем токены в запросе
-            total_tokens = sum(self.count_tokens(msg["content"]) for msg in messages)
+            # Подсчитываем токены в запросе: префикс роли посчитан заранее
+            if text_tokens is None:
+                text_tokens = self.count_tokens(user_text)
+            total_tokens = prefix[1] + text_tokens
+            if notes or instruction != ANALYSIS_INSTRUCTION:
+                total_tokens += self.count_tokens(notes + instruction) - self.count_tokens(ANALYSIS_INSTRUCTION)
             
             # Проверяем лимит токенов
             if total_tokens > MAX_TOKENS_PER_REQUEST:
                 logger.warning(f"Превышен лимит токенов: {total_tokens} > {MAX_TOKENS_PER_REQUEST}")
-                return None, total_tokens
+                return None, total_tokens, cache_usage
             
-            logger.info(f"Отправка запроса к DeepSeek API. Роль: {role_key}, токенов: {total_tokens}")
+            # Модель и лимит ответа зависят от роли и размера текста без промпта роли
+            route = snapshot.routing.route(role_key, total_tokens - prefix[1])
+            if max_tokens is not None:
+                route = route._replace(max_tokens=max_tokens)
             
-            # Отправляем запрос к API
-            response = self.client.chat.completions.create(
-                model="deepseek-chat",
-                messages=messages,
-                max_tokens=4000,
-                temperature=0.7,
-                stream=False
+            # Повторное нажатие или дубликат текста, пока первый запрос еще выполняется,
+            # ждет тот же ответ вместо второй генерации
+            key = content_key(role_key, prefix[3], notes + instruction, user_text, *map(str, route))
+            leader = key not in self.inflight
+            response = await self.inflight.do(
+                key, lambda: self._request(role_key, messages, total_tokens, route, priority)
             )
+            if not leader:
+                logger.info(f"Анализ роли {role_key} объединен с выполняющимся запросом")
             
             # Извлекаем результат
             if response.choices and len(response.choices) > 0:
                 result = response.choices[0].message.content
+                # Токены кэша учитываются только у запроса, который действительно ушел в API
+                if leader:
+                    cache_usage = self._extract_cache_usage(response)
+                cache_usage['prompt_version'] = prefix[3]
+                cache_usage['coalesced'] = not leader
+                # "length" - ответ обрезан по max_tokens
+                cache_usage['finish_reason'] = response.choices[0].finish_reason
+                cache_usage.update(route._asdict())
                 
                 # Подсчитываем общее количество токенов (запрос + ответ)
                 response_tokens = self.count_tokens(result) if result else 0
                 total_used_tokens = total_tokens + response_tokens
                 
-                logger.info(f"Получен ответ от DeepSeek API. Токенов использовано: {total_used_tokens}")
+                logger.info(
+                    f"Получен ответ от DeepSeek API. Токенов использовано: {total_used_tokens}, "
+                    f"из кэша: {cache_usage['prompt_cache_hit_tokens']}"
+                )
                 
-                return result, total_used_tokens
+                return result, total_used_tokens, cache_usage
             else:
                 logger.error("Пустой ответ от DeepSeek API")
-                return None, total_tokens
+                return None, total_tokens, cache_usage
                 
         except openai.RateLimitError as e:
             logger.error(f"Превышен лимит запросов к DeepSeek API: {e}")
-            return "❌ Превышен лимит запросов к API. Попробуйте позже.", 0
+            return "❌ Превышен лимит запросов к API. Попробуйте позже.", 0, cache_usage
             
         except openai.APIError as e:
             logger.error(f"Ошибка API DeepSeek: {e}")
-            return "❌ Ошибка при обращении к API. Попробуйте позже.", 0
+            return "❌ Ошибка при обращении к API. Попробуйте позже.", 0, cache_usage
             
         except Exception as e:
             logger.error(f"Неожиданная ошибка при работе с DeepSeek API: {e}")
-            return "❌ Произошла ошибка при анализе текста. Попробуйте позже.", 0
+            return "❌ Произошла ошибка при анализе текста. Попробуйте позже.", 0, cache_usage
     
-    def validate_text_length(self, text: str) -> Tuple[bool, str]:
+    def measure_text(self, text: str) -> Tuple[bool, str, int]:
         """
-        Проверка длины текста и количества токенов
+        Проверка длины текста с возвратом количества токенов
         
         Args:
             text: Текст для проверки
             
         Returns:
-            Tuple[bool, str]: (валиден ли текст, сообщение об ошибке)
+            Tuple[bool, str, int]: (валиден ли текст, сообщение об ошибке, количество токенов)
         """
         # Проверяем количество символов
         if len(text) > 200000:
-            return False, f"Текст слишком длинный: {len(text):,} символов (максимум 200,000)"
+            return False, f"Текст слишком длинный: {len(text):,} символов (максимум 200,000)", 0
         
         # Проверяем количество токенов
         tokens = self.count_tokens(text)
         if tokens > MAX_TOKENS_PER_REQUEST:
-            return False, f"Слишком много токенов: {tokens:,} (максимум {MAX_TOKENS_PER_REQUEST:,})"
+            return False, f"Слишком много токенов: {tokens:,} (максимум {MAX_TOKENS_PER_REQUEST:,})", tokens
         
-        return True, ""
+        return True, "", tokens
+    
+    def validate_text_length(self, text: str) -> Tuple[bool, str]:
+        """
+        Проверка длины текста и количества токенов
+        
+        Args:
+            text: Текст для проверки
+            
+        Returns:
+            Tuple[bool, str]: (валиден ли текст, сообщение об ошибке)
+        """
+        is_valid, error_message, _ = self.measure_text(text)
+        return is_valid, error_message
     
     def get_role_description(self, role_key: str) -> str:
         """Получить описание роли"""
-        if role_key in ROLES:
-            return ROLES[role_key]["name"]
+        roles = catalog.current().roles
+        if role_key in roles:
+            return roles[role_key]["name"]
         return "Неизвестная роль"
 
 # Создаем глобальный экземпляр API
@@ -0,0 +1,256 @@
+"""
+Диагностика задержек: мониторинг лагов event loop и профилирование медленных обработчиков.
+
+Включается переменной окружения DIAGNOSTICS_ENABLED=1. Все отчеты пишутся
+в отдельный ротируемый файл (DIAGNOSTICS_LOG_PATH), чтобы не засорять основной лог.
+"""
+
+import asyncio
+import cProfile
+import functools
+import io
+import logging
+import pstats
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from typing import Optional, Callable, Dict, Any, Deque
+
+from config import (
+    DIAGNOSTICS_LOG_PATH, DIAGNOSTICS_LOOP_LAG_MS, DIAGNOSTICS_SLOW_HANDLER_MS,
+    DIAGNOSTICS_PROFILER
+)
+
+logger = logging.getLogger(__name__)
+
+# Отдельный логгер для отчетов, пишет только в ротируемый файл
+report_logger = logging.getLogger("diagnostics.report")
+report_logger.propagate = False
+
+PROFILER_MODES = ("stack", "cprofile", "tracemalloc")
+
+
+def setup_report_log(path: str = DIAGNOSTICS_LOG_PATH, max_bytes: int = 5 * 1024 * 1024,
+                     backup_count: int = 5):
+    """Подключить ротируемый файл для диагностических отчетов"""
+    if report_logger.handlers:
+        return
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+    report_logger.addHandler(handler)
+    report_logger.setLevel(logging.INFO)
+
+
+def _format_thread_stack(thread_id: int) -> str:
+    frame = sys._current_frames().get(thread_id)
+    if frame is None:
+        return "<стек недоступен>"
+    return "".join(traceback.format_stack(frame))
+
+
+class LoopLagMonitor:
+    """
+    Непрерывное измерение задержки event loop.
+
+    Корутина-пульс просыпается каждые interval секунд и фиксирует, насколько
+    позже запланированного она проснулась. Сторожевой поток следит за временем
+    последнего пульса: если loop не отвечает дольше порога, он снимает стек
+    потока loop'а в момент блокировки — это и есть виновник задержки.
+    """
+
+    def __init__(self, interval: float = 0.05, threshold_ms: float = DIAGNOSTICS_LOOP_LAG_MS,
+                 max_samples: int = 10000, capture_stacks: bool = True):
+        self.interval = interval
+        self.threshold = threshold_ms / 1000
+        self.capture_stacks = capture_stacks
+        self.samples = deque(maxlen=max_samples)
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._last_beat = time.monotonic()
+        self._loop_thread_id = None
+        self._task = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            self._last_beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+    def _watch(self):
+        reported_beat = None
+        while not self._stopped.wait(self.interval / 2):
+            beat = self._last_beat
+            stalled_for = time.monotonic() - beat
+            if stalled_for < self.threshold or beat == reported_beat:
+                continue
+
+            # Один отчет на одну блокировку
+            reported_beat = beat
+            self.stalls += 1
+            stack = _format_thread_stack(self._loop_thread_id) if self.capture_stacks else ""
+            logger.warning(f"Event loop заблокирован более {stalled_for * 1000:.0f} мс")
+            report_logger.info(
+                f"LOOP STALL {stalled_for * 1000:.0f} мс (порог {self.threshold * 1000:.0f} мс)\n{stack}"
+            )
+
+    def start(self):
+        """Запустить мониторинг в текущем event loop"""
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        """Остановить мониторинг"""
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._watchdog:
+            self._watchdog.join(timeout=1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Текущая статистика лагов"""
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {'samples': 0, 'p50_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0, 'stalls': self.stalls}
+        return {
+            'samples': len(ordered),
+            'p50_ms': ordered[len(ordered) // 2] * 1000,
+            'p99_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+            'max_ms': self.max_lag * 1000,
+            'stalls': self.stalls,
+        }
+
+
+class HandlerProfiler:
+    """
+    Обертка обработчиков с замером времени.
+
+    Если обработчик выполняется дольше порога, в отчет попадает стек его корутины
+    в момент превышения порога, а в режимах cprofile/tracemalloc — еще и профиль
+    вызовов или снимок аллокаций за время выполнения.
+    """
+
+    def __init__(self, threshold_ms: float = DIAGNOSTICS_SLOW_HANDLER_MS, mode: str = DIAGNOSTICS_PROFILER,
+                 max_samples: int = 10000):
+        if mode not in PROFILER_MODES:
+            logger.warning(f"Неизвестный режим профилировщика: {mode}, используется stack")
+            mode = "stack"
+        self.threshold = threshold_ms / 1000
+        self.mode = mode
+        self.max_samples = max_samples
+        # Последние замеры для перцентилей; количество вызовов и максимум - за все время
+        self.timings: Dict[str, Deque[float]] = {}
+        self.calls: Dict[str, int] = {}
+        self.max_elapsed: Dict[str, float] = {}
+        self.slow_calls = 0
+        # cProfile и tracemalloc глобальны для процесса — профилируем один вызов за раз
+        self._profiling_lock = threading.Lock()
+
+    def _capture_task_stack(self, task: asyncio.Task, name: str, holder: Dict[str, str]):
+        if task.done():
+            return
+        buffer = io.StringIO()
+        task.print_stack(file=buffer)
+        holder['stack'] = buffer.getvalue()
+        logger.warning(f"Обработчик {name} выполняется дольше {self.threshold * 1000:.0f} мс")
+
+    def wrap(self, callback: Callable, name: Optional[str] = None) -> Callable:
+        """Обернуть асинхронный обработчик telegram.ext"""
+        name = name or getattr(callback, "__name__", repr(callback))
+        if self.mode == "tracemalloc" and not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+
+        @functools.wraps(callback)
+        async def instrumented(update, context):
+            task = asyncio.current_task()
+            holder: Dict[str, str] = {}
+            timer = asyncio.get_running_loop().call_later(
+                self.threshold, self._capture_task_stack, task, name, holder
+            )
+
+            profiler = None
+            snapshot_before = None
+            if self.mode != "stack" and self._profiling_lock.acquire(blocking=False):
+                if self.mode == "cprofile":
+                    profiler = cProfile.Profile()
+                    profiler.enable()
+                else:
+                    snapshot_before = tracemalloc.take_snapshot()
+
+            started = time.perf_counter()
+            try:
+                return await callback(update, context)
+            finally:
+                elapsed = time.perf_counter() - started
+                timer.cancel()
+                if profiler is not None:
+                    profiler.disable()
+                if profiler is not None or snapshot_before is not None:
+                    self._profiling_lock.release()
+
+                self._record(name, elapsed)
+                if elapsed >= self.threshold:
+                    self._report(name, elapsed, holder.get('stack', ''), profiler, snapshot_before)
+
+        return instrumented
+
+    def _record(self, name: str, elapsed: float):
+        samples = self.timings.get(name)
+        if samples is None:
+            samples = self.timings[name] = deque(maxlen=self.max_samples)
+        samples.append(elapsed)
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.max_elapsed[name] = max(self.max_elapsed.get(name, 0.0), elapsed)
+
+    def _report(self, name: str, elapsed: float, stack: str,
+                profiler: Optional[cProfile.Profile], snapshot_before):
+        self.slow_calls += 1
+        parts = [f"SLOW HANDLER {name}: {elapsed * 1000:.0f} мс (порог {self.threshold * 1000:.0f} мс)"]
+        if stack:
+            parts.append(stack)
+
+        if profiler is not None:
+            buffer = io.StringIO()
+            pstats.Stats(profiler, stream=buffer).sort_stats("cumulative").print_stats(25)
+            parts.append(buffer.getvalue())
+
+        if snapshot_before is not None:
+            top = tracemalloc.take_snapshot().compare_to(snapshot_before, "lineno")[:15]
+            parts.append("\n".join(str(stat) for stat in top))
+
+        report_logger.info("\n".join(parts))
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Сводка по обработчикам: количество вызовов, p50/p95 за последние вызовы и максимум"""
+        result = {}
+        for name, values in self.timings.items():
+            ordered = sorted(values)
+            result[name] = {
+                'count': self.calls[name],
+                'p50_ms': ordered[len(ordered) // 2] * 1000,
+                'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+                'max_ms': self.max_elapsed[name] * 1000,
+            }
+        return result
+
+
+# Глобальные экземпляры, используются при DIAGNOSTICS_ENABLED=1
+loop_monitor = LoopLagMonitor()
+handler_profiler = HandlerProfiler()
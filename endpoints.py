@@ -0,0 +1,125 @@
+"""
+Пул ключей и адресов DeepSeek API с балансировкой нагрузки.
+
+Каждая пара "ключ@адрес" - отдельная точка со своим клиентом и своим лимитом
+запросов. Запрос уходит в исправную точку с наименьшим числом выполняющихся
+запросов (least outstanding requests), при равенстве - в ту, что дольше не
+выбиралась. Точка, ответившая 429, 5xx или недоступная по сети, временно
+исключается: на время из Retry-After либо на DEEPSEEK_EJECT_TIME секунд,
+удваивающееся при повторных сбоях подряд до DEEPSEEK_MAX_EJECT_TIME.
+Если исключены все точки, запрос получает ту, что вернется раньше других.
+"""
+
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from config import DEEPSEEK_EJECT_TIME, DEEPSEEK_MAX_EJECT_TIME
+
+logger = logging.getLogger(__name__)
+
+
+def parse_endpoints(spec: str, default_key: str, default_base: str) -> List[Tuple[str, str]]:
+    """
+    Разобрать список точек "ключ@адрес,ключ@адрес"
+
+    Адрес можно опустить (используется default_base); пустой список - одна точка
+    из DEEPSEEK_API_KEY и DEEPSEEK_API_BASE.
+    """
+    endpoints = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        key, _, base = item.partition('@')
+        endpoints.append((key.strip(), base.strip() or default_base))
+    return endpoints or [(default_key, default_base)]
+
+
+class Endpoint:
+    """Точка API: клиент, число выполняющихся запросов и состояние здоровья"""
+
+    def __init__(self, name: str, api_key: str, base_url: str, client: Any):
+        self.name = name
+        self.api_key = api_key
+        self.base_url = base_url
+        self.client = client
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.last_used = 0.0
+
+    def available(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+
+class EndpointPool:
+    """Выбор точки API по наименьшему числу выполняющихся запросов"""
+
+    def __init__(self, endpoints: List[Tuple[str, str]], client_factory: Callable[[str, str], Any],
+                 eject_time: float = DEEPSEEK_EJECT_TIME, max_eject_time: float = DEEPSEEK_MAX_EJECT_TIME):
+        self.eject_time = eject_time
+        self.max_eject_time = max_eject_time
+        self.endpoints: List[Endpoint] = []
+        for index, (api_key, base_url) in enumerate(endpoints):
+            # В имени только хост и конец ключа: имя попадает в логи и /cache_stats
+            name = f"{urlsplit(base_url).netloc or base_url}#{index + 1}:…{api_key[-4:]}"
+            self.endpoints.append(Endpoint(name, api_key, base_url, client_factory(api_key, base_url)))
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    def acquire(self, exclude: Tuple[Endpoint, ...] = ()) -> Endpoint:
+        """
+        Выбрать точку для запроса и учесть его как выполняющийся
+
+        Args:
+            exclude: точки, уже не ответившие на этот запрос (берутся, только если других нет)
+        """
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e.available(now) and e not in exclude]
+        if not candidates:
+            candidates = [e for e in self.endpoints if e not in exclude] or self.endpoints
+            # Все исключены: ждать не имеет смысла, берем ту, что вернется первой
+            endpoint = min(candidates, key=lambda e: (e.ejected_until, e.outstanding))
+        else:
+            endpoint = min(candidates, key=lambda e: (e.outstanding, e.last_used))
+        endpoint.outstanding += 1
+        endpoint.requests += 1
+        endpoint.last_used = now
+        return endpoint
+
+    def release(self, endpoint: Endpoint, failed: bool = False, retry_after: Optional[float] = None):
+        """Завершить запрос; при сбое исключить точку на время"""
+        endpoint.outstanding -= 1
+        if not failed:
+            endpoint.consecutive_failures = 0
+            return
+
+        endpoint.failures += 1
+        endpoint.consecutive_failures += 1
+        if retry_after is None:
+            retry_after = min(
+                self.eject_time * 2 ** (endpoint.consecutive_failures - 1), self.max_eject_time
+            )
+        endpoint.ejected_until = max(endpoint.ejected_until, time.monotonic() + retry_after)
+        endpoint.ejections += 1
+        logger.warning(f"Точка DeepSeek {endpoint.name} исключена на {retry_after:.0f} с")
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        return [
+            {
+                'name': endpoint.name,
+                'outstanding': endpoint.outstanding,
+                'requests': endpoint.requests,
+                'failures': endpoint.failures,
+                'ejections': endpoint.ejections,
+                'ejected_for': max(0.0, endpoint.ejected_until - now),
+            }
+            for endpoint in self.endpoints
+        ]
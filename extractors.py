@@ -0,0 +1,231 @@
+"""
+Потоковое извлечение текста из загруженных документов (.txt, .docx, .fb2, .epub).
+
+Файлы читаются блоками, XML разбирается через iterparse с очисткой
+обработанных элементов, а сбор текста прекращается, как только превышен
+лимит длины, поэтому память на одну загрузку ограничена независимо от размера файла.
+"""
+
+import codecs
+import logging
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from html.parser import HTMLParser
+from typing import List, Tuple, IO
+
+from config import MAX_TEXT_LENGTH
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = ('.txt', '.docx', '.fb2', '.epub')
+
+READ_BLOCK_SIZE = 64 * 1024
+
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+FB2_TEXT_TAGS = {'p', 'v', 'subtitle', 'text-author'}
+HTML_BLOCK_TAGS = {'p', 'div', 'br', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'tr'}
+HTML_SKIP_TAGS = {'script', 'style', 'head'}
+
+
+class _LimitReached(Exception):
+    """Собрано больше текста, чем допускает лимит"""
+
+
+class TextCollector:
+    """Накопитель текста списком фрагментов с ограничением по длине"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.length = 0
+        self.chunks: List[str] = []
+
+    def add(self, text: str):
+        if not text:
+            return
+        self.chunks.append(text)
+        self.length += len(text)
+        if self.length > self.limit:
+            raise _LimitReached()
+
+    def paragraph(self, text: str):
+        text = text.strip()
+        if text:
+            self.add(text + '\n\n')
+
+    def text(self) -> str:
+        return ''.join(self.chunks).strip()[:self.limit]
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+
+def _detect_encoding(sample: bytes) -> str:
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'cp1251'
+
+
+def _iter_decoded(stream: IO[bytes], encoding: str = None):
+    """Чтение бинарного потока блоками с инкрементальным декодированием"""
+    first = stream.read(READ_BLOCK_SIZE)
+    decoder = codecs.getincrementaldecoder(encoding or _detect_encoding(first))(errors='replace')
+    block = first
+    while block:
+        yield decoder.decode(block)
+        block = stream.read(READ_BLOCK_SIZE)
+    yield decoder.decode(b'', final=True)
+
+
+def _extract_txt(path: str, collector: TextCollector):
+    with open(path, 'rb') as stream:
+        for chunk in _iter_decoded(stream):
+            collector.add(chunk)
+
+
+def _extract_docx(path: str, collector: TextCollector):
+    with zipfile.ZipFile(path) as archive, archive.open('word/document.xml') as stream:
+        parts: List[str] = []
+        for event, elem in ET.iterparse(stream, events=('end',)):
+            tag = elem.tag
+            if tag == WORD_NS + 't':
+                parts.append(elem.text or '')
+            elif tag == WORD_NS + 'tab':
+                parts.append('\t')
+            elif tag == WORD_NS + 'br':
+                parts.append('\n')
+            elif tag == WORD_NS + 'p':
+                collector.paragraph(''.join(parts))
+                parts.clear()
+                elem.clear()
+
+
+def _extract_fb2(path: str, collector: TextCollector):
+    in_body = 0
+    with open(path, 'rb') as stream:
+        for event, elem in ET.iterparse(stream, events=('start', 'end')):
+            name = _local_name(elem.tag)
+            if event == 'start':
+                if name == 'body':
+                    in_body += 1
+                continue
+
+            if name == 'body':
+                in_body -= 1
+                elem.clear()
+            elif name in FB2_TEXT_TAGS and in_body:
+                collector.paragraph(''.join(elem.itertext()))
+                elem.clear()
+            elif name in ('binary', 'section', 'description'):
+                # Картинки в base64 и обработанные разделы сразу освобождаем
+                elem.clear()
+
+
+class _HTMLTextParser(HTMLParser):
+    """Извлечение текста из XHTML глав EPUB с разбивкой на абзацы"""
+
+    def __init__(self, collector: TextCollector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+        self.parts: List[str] = []
+        self.skip_depth = 0
+
+    def _flush(self):
+        if self.parts:
+            self.collector.paragraph(''.join(self.parts))
+            self.parts.clear()
+
+    def handle_starttag(self, tag, attrs):
+        if tag in HTML_SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag in HTML_BLOCK_TAGS:
+            self._flush()
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in HTML_BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in HTML_SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in HTML_BLOCK_TAGS:
+            self._flush()
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def _epub_spine(archive: zipfile.ZipFile) -> List[str]:
+    """Пути глав EPUB в порядке чтения (spine из OPF)"""
+    with archive.open('META-INF/container.xml') as stream:
+        container = ET.parse(stream)
+    rootfile = next(el for el in container.iter() if _local_name(el.tag) == 'rootfile')
+    opf_path = rootfile.get('full-path')
+    opf_dir = posixpath.dirname(opf_path)
+
+    with archive.open(opf_path) as stream:
+        opf = ET.parse(stream)
+
+    manifest = {}
+    spine = []
+    for el in opf.iter():
+        name = _local_name(el.tag)
+        if name == 'item':
+            manifest[el.get('id')] = el.get('href')
+        elif name == 'itemref':
+            spine.append(el.get('idref'))
+
+    return [posixpath.normpath(posixpath.join(opf_dir, manifest[idref]))
+            for idref in spine if idref in manifest]
+
+
+def _extract_epub(path: str, collector: TextCollector):
+    with zipfile.ZipFile(path) as archive:
+        for chapter in _epub_spine(archive):
+            parser = _HTMLTextParser(collector)
+            with archive.open(chapter) as stream:
+                for chunk in _iter_decoded(stream, 'utf-8'):
+                    parser.feed(chunk)
+            parser.close()
+
+
+EXTRACTORS = {
+    '.txt': _extract_txt,
+    '.docx': _extract_docx,
+    '.fb2': _extract_fb2,
+    '.epub': _extract_epub,
+}
+
+
+def extract_text(path: str, extension: str, limit: int = MAX_TEXT_LENGTH) -> Tuple[str, bool]:
+    """
+    Извлечение текста из документа
+
+    Args:
+        path: Путь к файлу на диске
+        extension: Расширение файла (.txt, .docx, .fb2, .epub)
+        limit: Максимальная длина текста в символах
+
+    Returns:
+        Tuple[str, bool]: (текст не длиннее limit, был ли документ длиннее лимита)
+    """
+    extractor = EXTRACTORS.get(extension.lower())
+    if extractor is None:
+        raise ValueError(f"Неподдерживаемый формат: {extension}")
+
+    collector = TextCollector(limit)
+    try:
+        extractor(path, collector)
+    except _LimitReached:
+        return collector.text(), True
+    return collector.text(), False
@@ -0,0 +1,249 @@
+"""
+Общие пулы исходящих HTTP-соединений.
+
+DeepSeek, YooMoney и скачивание файлов Telegram работают через общие клиенты,
+которые держат соединения открытыми: по умолчанию httpx закрывает простаивающее
+соединение через 5 секунд, и следующий запрос снова платит за TCP и TLS, а SDK
+YooMoney открывает новое соединение на каждый вызов requests.request.
+
+- client: httpx.AsyncClient с долгим keep-alive, HTTP/2 (если установлен пакет
+  h2), кэшем DNS и TCP keep-alive; передается в AsyncOpenAI
+- session: requests.Session с пулом соединений и таймаутом по умолчанию для SDK YooMoney
+- prewarm: открыть соединения к известным хостам при старте
+
+По каждому хосту считаются запросы и новые соединения: их отношение показывает,
+как часто соединение переиспользуется (/cache_stats).
+"""
+
+import asyncio
+import logging
+import socket
+import time
+from collections import defaultdict
+from ipaddress import ip_address
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpcore
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import h2  # noqa: F401
+except ImportError:
+    # HTTP/2 необязателен, без h2 используется HTTP/1.1
+    h2 = None
+
+from config import (
+    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY, HTTP2_ENABLED,
+    HTTP_DNS_TTL, HTTP_PREWARM_CONNECTIONS, HTTP_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+HTTP2_AVAILABLE = HTTP2_ENABLED and h2 is not None
+
+# TCP keep-alive: простаивающее соединение не обрывают NAT и балансировщики по пути
+_SOCKET_OPTIONS = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+
+
+class HostStats:
+    """Запросы и новые соединения по хостам"""
+
+    def __init__(self):
+        self.requests: Dict[str, int] = defaultdict(int)
+        self.connections: Dict[str, int] = defaultdict(int)
+
+
+host_stats = HostStats()
+
+
+class CachingBackend(httpcore.AsyncNetworkBackend):
+    """
+    Сетевой бэкенд httpcore с кэшем DNS и учетом новых соединений
+
+    Соединение открывается по адресу из кэша, а TLS проверяется по имени хоста
+    (httpcore передает его отдельно), поэтому подмена адреса безопасна.
+    """
+
+    def __init__(self, backend: httpcore.AsyncNetworkBackend, ttl: float = HTTP_DNS_TTL,
+                 stats: HostStats = host_stats):
+        self._backend = backend
+        self.ttl = ttl
+        self.stats = stats
+        self.lookups = 0
+        self.hits = 0
+        self._cache: Dict[Tuple[str, int], Tuple[float, str]] = {}
+
+    async def _resolve(self, host: str, port: int) -> str:
+        try:
+            ip_address(host)
+            return host
+        except ValueError:
+            pass
+
+        now = time.monotonic()
+        cached = self._cache.get((host, port))
+        if cached and cached[0] > now:
+            self.hits += 1
+            return cached[1]
+
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        address = infos[0][4][0]
+        self._cache[(host, port)] = (now + self.ttl, address)
+        self.lookups += 1
+        return address
+
+    async def connect_tcp(self, host: str, port: int, timeout: Optional[float] = None,
+                          local_address: Optional[str] = None, socket_options=None):
+        address = await self._resolve(host, port)
+        try:
+            stream = await self._backend.connect_tcp(
+                address, port, timeout=timeout, local_address=local_address, socket_options=socket_options
+            )
+        except Exception:
+            # Адрес мог смениться: следующее соединение разрешит имя заново
+            self._cache.pop((host, port), None)
+            raise
+        self.stats.connections[host] += 1
+        return stream
+
+    async def connect_unix_socket(self, path: str, timeout: Optional[float] = None, socket_options=None):
+        return await self._backend.connect_unix_socket(path, timeout=timeout, socket_options=socket_options)
+
+    async def sleep(self, seconds: float):
+        await self._backend.sleep(seconds)
+
+
+network_backend = CachingBackend(httpcore.AnyIOBackend())
+
+
+class CachingTransport(httpx.AsyncHTTPTransport):
+    """
+    Транспорт httpx, пул которого открывает соединения через CachingBackend
+
+    httpx не принимает сетевой бэкенд в параметрах транспорта, поэтому пул
+    создается здесь через публичный параметр network_backend пула httpcore.
+    Прокси не поддерживаются: общий клиент ходит к DeepSeek и Telegram напрямую.
+    Разбор запросов и ответов наследуется от AsyncHTTPTransport, который хранит
+    пул в атрибуте _pool, поэтому версии httpx и httpcore закреплены в requirements.txt.
+    """
+
+    def __init__(self, backend: httpcore.AsyncNetworkBackend = network_backend, http2: bool = HTTP2_AVAILABLE,
+                 limits: httpx.Limits = httpx.Limits(
+                     max_connections=HTTP_MAX_CONNECTIONS,
+                     max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                     keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                 ),
+                 socket_options=_SOCKET_OPTIONS):
+        self._pool = httpcore.AsyncConnectionPool(
+            ssl_context=httpx.create_ssl_context(),
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            http1=True,
+            http2=http2,
+            socket_options=socket_options,
+            network_backend=backend,
+        )
+
+
+async def _count_request(request: httpx.Request):
+    host_stats.requests[request.url.host] += 1
+
+
+def create_client(**kwargs) -> httpx.AsyncClient:
+    """Асинхронный клиент с общим кэшем DNS и учетом соединений"""
+    return httpx.AsyncClient(transport=CachingTransport(), event_hooks={'request': [_count_request]}, **kwargs)
+
+
+class _Session(requests.Session):
+    """Сессия с таймаутом по умолчанию: SDK YooMoney вызывает requests.request без таймаута"""
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', HTTP_TIMEOUT)
+        host_stats.requests[urlsplit(url).hostname] += 1
+        return super().request(method, url, **kwargs)
+
+
+def create_session() -> requests.Session:
+    """Синхронная сессия с пулом соединений"""
+    session = _Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_MAX_KEEPALIVE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+# Общие клиенты процесса
+client = create_client(timeout=HTTP_TIMEOUT)
+session = create_session()
+
+
+def _session_connections() -> Dict[str, int]:
+    """Новые соединения сессии по хостам (счетчики пулов urllib3)"""
+    connections: Dict[str, int] = defaultdict(int)
+    for adapter in session.adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                connections[pool.host] += pool.num_connections
+    return connections
+
+
+async def prewarm(urls: List[str], session_urls: List[str] = (),
+                  connections: int = HTTP_PREWARM_CONNECTIONS):
+    """
+    Открыть соединения заранее, чтобы первые запросы не ждали DNS, TCP и TLS
+
+    Args:
+        urls: адреса для общего асинхронного клиента (DeepSeek)
+        session_urls: адреса для синхронной сессии (YooMoney)
+        connections: соединений на адрес (с HTTP/2 хватает одного)
+    """
+    def warm_session(url: str):
+        try:
+            session.get(url)
+        except requests.RequestException as e:
+            logger.warning(f"Не удалось прогреть соединение с {url}: {e}")
+
+    async def warm(url: str):
+        try:
+            await client.get(url)
+        except httpx.HTTPError as e:
+            logger.warning(f"Не удалось прогреть соединение с {url}: {e}")
+
+    urls, session_urls = list(dict.fromkeys(urls)), list(dict.fromkeys(session_urls))
+    started = time.monotonic()
+    await asyncio.gather(
+        *(warm(url) for url in urls for _ in range(1 if HTTP2_AVAILABLE else connections)),
+        *(asyncio.to_thread(warm_session, url) for url in session_urls for _ in range(connections))
+    )
+    hosts = ", ".join(urlsplit(url).netloc for url in urls + session_urls)
+    logger.info(f"Прогреты соединения ({hosts}) за {time.monotonic() - started:.2f} с")
+
+
+def get_stats() -> Dict[str, Any]:
+    """Запросы, новые соединения и доля переиспользования соединений по хостам, попадания в кэш DNS"""
+    connections = dict(host_stats.connections)
+    for host, count in _session_connections().items():
+        connections[host] = connections.get(host, 0) + count
+
+    hosts = []
+    for host in sorted(set(host_stats.requests) | set(connections)):
+        requests_count = host_stats.requests.get(host, 0)
+        opened = connections.get(host, 0)
+        hosts.append({
+            'host': host,
+            'requests': requests_count,
+            'connections': opened,
+            'reuse': max(0.0, 1 - opened / requests_count) if requests_count else 0.0,
+        })
+    return {
+        'hosts': hosts,
+        'dns_lookups': network_backend.lookups,
+        'dns_hits': network_backend.hits,
+        'http2': HTTP2_AVAILABLE,
+    }
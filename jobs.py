@@ -0,0 +1,175 @@
+"""
+Фоновое выполнение анализов.
+
+Задания хранятся в SQLite (таблица analysis_jobs), поэтому переживают перезапуск
+контейнера: прерванные задания возвращаются в очередь, а готовые, но не
+доставленные результаты отправляются пользователю при следующем старте.
+Прием сообщений не ждет генерации: обработчик только ставит задание в очередь.
+
+Очередь учитывает класс приоритета задания (scheduling.FairQueue): анализы
+оплативших пользователей и администратора выполняются раньше пробных, но
+пробные не ждут бесконечно.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Dict, Any, List, Callable, Awaitable, Optional
+
+from config import ANALYSIS_WORKERS, ANALYSIS_MAX_ATTEMPTS, ANALYSIS_RETRY_DELAY
+from database import Database
+from scheduling import FairQueue
+
+logger = logging.getLogger(__name__)
+
+# analyze(job) -> (результат, токены, статистика кэша и версия промпта), как у DeepSeekAPI.analyze_text
+AnalyzeCallback = Callable[[Dict[str, Any]], Awaitable[tuple]]
+# deliver(job) -> None; job содержит 'result' либо 'error' при окончательной неудаче
+DeliverCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class AnalysisWorker:
+    """Пул воркеров, выполняющих задания на анализ из очереди"""
+
+    def __init__(self, db: Database, analyze: AnalyzeCallback, deliver: DeliverCallback,
+                 concurrency: int = ANALYSIS_WORKERS, max_attempts: int = ANALYSIS_MAX_ATTEMPTS,
+                 retry_delay: float = ANALYSIS_RETRY_DELAY):
+        self.db = db
+        self.analyze = analyze
+        self.deliver = deliver
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.queue: FairQueue = None
+        self.durations = deque(maxlen=10000)
+        self._submitted_at: Dict[int, float] = {}
+        self._workers: List[asyncio.Task] = []
+        self._retries = set()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self):
+        """Запустить воркеры и восстановить незавершенные задания"""
+        self.queue = FairQueue()
+        self._workers = [
+            asyncio.create_task(self._worker_loop(index), name=f"analysis-worker-{index}")
+            for index in range(self.concurrency)
+        ]
+
+        recovered = self.db.recover_jobs()
+        for job_id, priority in recovered['queued']:
+            self.queue.push(job_id, priority)
+        for job_id, _ in recovered['done']:
+            job = self.db.get_job(job_id)
+            if job:
+                await self._deliver(job)
+
+        logger.info(
+            f"Запущено воркеров анализа: {self.concurrency}; восстановлено заданий: "
+            f"{len(recovered['queued'])} в очереди, {len(recovered['done'])} к доставке"
+        )
+
+    async def stop(self):
+        """Остановить воркеры. Незавершенные задания будут восстановлены при следующем старте"""
+        for task in self._workers + list(self._retries):
+            task.cancel()
+        await asyncio.gather(*self._workers, *self._retries, return_exceptions=True)
+        self._workers = []
+        self._retries.clear()
+
+    def submit(self, job_ids: List[int], priority: Optional[str] = None):
+        """Поставить созданные в базе задания в очередь выполнения с классом приоритета"""
+        now = time.monotonic()
+        for job_id in job_ids:
+            self._submitted_at[job_id] = now
+            self.queue.push(job_id, priority)
+
+    async def join(self):
+        """Дождаться выполнения всех заданий в очереди (включая повторы)"""
+        while True:
+            await self.queue.join()
+            if not self._retries:
+                return
+            await asyncio.gather(*self._retries, return_exceptions=True)
+
+    def _schedule_retry(self, job_id: int, priority: Optional[str] = None):
+        async def retry_later():
+            await asyncio.sleep(self.retry_delay)
+            self.queue.push(job_id, priority)
+
+        task = asyncio.create_task(retry_later())
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _worker_loop(self, index: int):
+        while True:
+            job_id, _ = await self.queue.get()
+            try:
+                await self._run_job(job_id)
+            except Exception as e:
+                logger.error(f"Воркер {index}: ошибка выполнения задания {job_id}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _run_job(self, job_id: int):
+        job = self.db.claim_job(job_id)
+        if job is None:
+            # Задание уже выполнено или взято другим воркером
+            return
+
+        try:
+            result, tokens_used, cache_usage = await self.analyze(job)
+        except Exception as e:
+            logger.error(f"Ошибка анализа в задании {job_id}: {e}")
+            result, tokens_used, cache_usage = None, 0, {}
+
+        # Ошибки API возвращаются без учета токенов; отчет, целиком собранный
+        # из прошлых проверок (reused), готов без запроса к API
+        if result is not None and (tokens_used > 0 or cache_usage.get('reused')):
+            # Ответ, объединенный с одновременным одинаковым запросом, уже учтен у ведущего:
+            # один запрос к API не должен попадать в статистику несколько раз
+            if cache_usage.get('coalesced'):
+                tokens_used = 0
+            analysis_id = self.db.complete_job(
+                job, result, tokens_used,
+                cache_hit_tokens=cache_usage.get('prompt_cache_hit_tokens', 0),
+                cache_miss_tokens=cache_usage.get('prompt_cache_miss_tokens', 0),
+                prompt_version=cache_usage.get('prompt_version'),
+                model=cache_usage.get('model'),
+                max_tokens=cache_usage.get('max_tokens'),
+                temperature=cache_usage.get('temperature')
+            )
+            job.pop('text', None)
+            job.update(result=result, tokens_used=tokens_used, status='done', analysis_id=analysis_id)
+            await self._deliver(job)
+            return
+
+        error = result or "Пустой ответ API"
+        if result is not None and job['attempts'] < self.max_attempts:
+            # Временная ошибка API (лимит запросов, сбой сервера) - повторяем позже
+            logger.warning(f"Задание {job_id}: попытка {job['attempts']} не удалась, повтор через {self.retry_delay} с")
+            self.db.requeue_job(job_id, error)
+            self._schedule_retry(job_id, job.get('priority'))
+            return
+
+        self.db.fail_job(job, error)
+        job.pop('text', None)
+        job.update(result=None, error=error, status='failed')
+        await self._deliver(job)
+
+    async def _deliver(self, job: Dict[str, Any]):
+        try:
+            await self.deliver(job)
+        except Exception as e:
+            # Задание остается в статусе done и будет доставлено при следующем старте
+            logger.error(f"Ошибка доставки результата задания {job['id']}: {e}")
+            return
+
+        if job['status'] == 'done':
+            self.db.mark_job_delivered(job['id'])
+        submitted = self._submitted_at.pop(job['id'], None)
+        if submitted is not None:
+            self.durations.append(time.monotonic() - submitted)
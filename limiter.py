@@ -0,0 +1,152 @@
+"""
+Адаптивный лимит одновременных запросов к DeepSeek (AIMD).
+
+Пропускная способность DeepSeek меняется в течение дня, поэтому постоянный
+лимит либо простаивает, либо вызывает шквал 429. Лимит подбирается сам:
+пока задержки в норме и лимит используется полностью, он растет на единицу
+за каждые limit успешных запросов (аддитивный рост); ответ 429 или всплеск
+задержки уменьшает его вдвое (мультипликативное снижение). Снижение
+срабатывает не чаще раза на волну запросов: запросы, начатые до прошлого
+снижения, его уже не вызывают.
+
+Задержка считается в пересчете на токен ответа (время генерации растет
+с длиной ответа). Всплеском считается превышение быстрого скользящего
+среднего над медленным в LIMITER_LATENCY_TOLERANCE раз: единичный медленный
+ответ не снижает лимит, а стойкий рост задержек снижает.
+
+Ожидающие места выстраиваются в очередь scheduling.FairQueue по классам
+приоритета: освободившееся место раньше получает анализ оплатившего
+пользователя, чем пробный.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from config import LIMITER_INITIAL, LIMITER_MIN, LIMITER_MAX, LIMITER_LATENCY_TOLERANCE
+from scheduling import FairQueue
+
+logger = logging.getLogger(__name__)
+
+# Вес нового замера в быстром и медленном скользящих средних задержки
+_SHORT_SMOOTHING = 0.3
+_LONG_SMOOTHING = 0.02
+# Замеров до начала поиска всплесков
+_WARMUP_SAMPLES = 10
+
+
+class AdaptiveLimiter:
+    """Лимит одновременных запросов с очередью ожидающих"""
+
+    def __init__(self, initial: int = LIMITER_INITIAL, min_limit: int = LIMITER_MIN,
+                 max_limit: int = LIMITER_MAX, tolerance: float = LIMITER_LATENCY_TOLERANCE,
+                 backoff: float = 0.5):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.in_flight = 0
+        self.latency: Optional[float] = None
+        self.baseline: Optional[float] = None
+        self.samples = 0
+        self.increases = 0
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._waiters = FairQueue()
+
+    @property
+    def queue_length(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, priority: Optional[str] = None) -> float:
+        """
+        Дождаться свободного места
+
+        Args:
+            priority: класс приоритета запроса (см. PRIORITY_WEIGHTS)
+
+        Returns:
+            float: момент начала запроса (передается в release)
+        """
+        if not self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return time.monotonic()
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.push(future, priority)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Место уже выдано: возвращаем его следующему
+                self.in_flight -= 1
+                self._wake()
+            else:
+                self._waiters.remove(future, priority)
+            raise
+        return time.monotonic()
+
+    def release(self, started: float, output_tokens: Optional[int] = None, overloaded: bool = False):
+        """
+        Освободить место и учесть результат запроса
+
+        Args:
+            started: значение, полученное от acquire
+            output_tokens: токенов в ответе; None - запрос не дал замера (ошибка, отмена)
+            overloaded: DeepSeek ответил 429
+        """
+        saturated = bool(self._waiters) or self.in_flight >= int(self.limit)
+        self.in_flight -= 1
+        if overloaded:
+            self._decrease(started, "ответ 429")
+        elif output_tokens is not None:
+            sample = (time.monotonic() - started) / max(output_tokens, 1)
+            if self.baseline is None:
+                self.latency = self.baseline = sample
+            else:
+                self.latency += _SHORT_SMOOTHING * (sample - self.latency)
+                # Медленное среднее учитывает и всплески: при стойком замедлении DeepSeek
+                # оно догонит новые задержки, и рост лимита возобновится
+                self.baseline += _LONG_SMOOTHING * (sample - self.baseline)
+            self.samples += 1
+            spike = self.samples >= _WARMUP_SAMPLES and self.latency > self.baseline * self.tolerance
+            if spike:
+                self._decrease(
+                    started, f"задержка {self.latency * 1000:.1f} мс/токен при обычной {self.baseline * 1000:.1f}"
+                )
+            elif saturated and self.limit < self.max_limit:
+                # Растем, только когда лимит действительно ограничивал запросы
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self.increases += 1
+        self._wake()
+
+    def _decrease(self, started: float, reason: str):
+        if started < self._last_decrease:
+            return
+        previous = self.limit
+        self.limit = max(float(self.min_limit), self.limit * self.backoff)
+        self._last_decrease = time.monotonic()
+        self.decreases += 1
+        logger.warning(f"Лимит запросов к DeepSeek снижен с {previous:.1f} до {self.limit:.1f}: {reason}")
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            future, _ = self._waiters.pop()
+            self._waiters.task_done()
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'limit': self.limit,
+            'in_flight': self.in_flight,
+            'queue': len(self._waiters),
+            'increases': self.increases,
+            'decreases': self.decreases,
+            'latency': self.latency,
+            'baseline': self.baseline,
+            'classes': self._waiters.get_stats(),
+        }
@@ -0,0 +1,697 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест AiRidder Bot без реальных токенов.
+
+Поднимает локальные фейковые серверы Telegram Bot API, DeepSeek
+(OpenAI-совместимый /chat/completions) и YooMoney operation-history,
+после чего прогоняет через настоящий Application из bot.py синтетические
+Update'ы тысяч пользователей: /start → выбор роли → текст → покупка → проверка оплаты.
+
+Пример запуска:
+    python loadtest.py --users 2000 --concurrency 200 --latency 0.8 --error-rate 0.02
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Optional, Dict, Any, List, Tuple
+from urllib.parse import urlsplit, parse_qs
+
+from router import OP_BUY, OP_CHECK
+
+logger = logging.getLogger(__name__)
+
+FAKE_TOKEN = "123456:LOADTEST-FAKE-TOKEN"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "AiRidder", "username": "airidder_loadtest_bot"}
+
+SAMPLE_PARAGRAPH = (
+    "Старый маяк стоял на краю обрыва уже третью сотню лет. Смотритель поднимался "
+    "по винтовой лестнице каждый вечер, и каждый вечер ему казалось, что ступеней "
+    "стало на одну больше. — Ты опять считаешь? — спросила Марта, не отрываясь от книги. "
+)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль методом ближайшего ранга (q в диапазоне 0..100)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class FakeHTTPServer:
+    """Минимальный HTTP/1.1 сервер на asyncio с keep-alive и chunked-ответами"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.port = None
+        self.requests_total = 0
+        self._server = None
+        self._connections = set()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Фейковый сервер {self.name} запущен на {self.base_url}")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        for task in list(self._connections):
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+
+    async def handle(self, method: str, path: str, query: Dict[str, List[str]],
+                     headers: Dict[str, str], body: bytes) -> Tuple[int, Any]:
+        """Обработка запроса. Возвращает (статус, dict | async-генератор байтов)"""
+        raise NotImplementedError
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", "0"))
+                body = await reader.readexactly(length) if length else b""
+
+                parts = urlsplit(target)
+                self.requests_total += 1
+                try:
+                    status, payload = await self.handle(method, parts.path, parse_qs(parts.query), headers, body)
+                except Exception as e:
+                    logger.error(f"{self.name}: ошибка обработки {target}: {e}")
+                    status, payload = 500, {"error": str(e)}
+
+                await self._write_response(writer, status, payload)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _write_response(self, writer: asyncio.StreamWriter, status: int, payload: Any):
+        reason = {200: "OK", 429: "Too Many Requests", 500: "Internal Server Error"}.get(status, "Status")
+
+        if isinstance(payload, (dict, list)):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status} {reason}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                f"Connection: keep-alive\r\n\r\n".encode("latin-1") + data
+            )
+            await writer.drain()
+            return
+
+        # Потоковый ответ (SSE) через chunked transfer encoding
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: text/event-stream\r\n"
+            f"Transfer-Encoding: chunked\r\n"
+            f"Connection: keep-alive\r\n\r\n".encode("latin-1")
+        )
+        async for chunk in payload:
+            writer.write(f"{len(chunk):X}\r\n".encode("latin-1") + chunk + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+class FakeTelegramServer(FakeHTTPServer):
+    """Фейковый Telegram Bot API: отвечает на методы бота и запоминает inline-клавиатуры"""
+
+    def __init__(self):
+        super().__init__("telegram")
+        self.method_counts: Dict[str, int] = {}
+        self.last_inline_keyboard: Dict[int, Tuple[int, List[Dict[str, Any]]]] = {}
+        self._message_id = 0
+        self._lock = threading.Lock()
+        self.files: Dict[str, bytes] = {}
+
+    def add_file(self, content: bytes) -> str:
+        """Зарегистрировать файл, доступный боту через getFile"""
+        file_id = uuid.uuid4().hex
+        self.files[file_id] = content
+        return file_id
+
+    def _next_message_id(self) -> int:
+        with self._lock:
+            self._message_id += 1
+            return self._message_id
+
+    def _message(self, chat_id: int, message_id: int, text: str) -> Dict[str, Any]:
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": text or "",
+        }
+
+    async def handle(self, method, path, query, headers, body):
+        if path.startswith("/file/"):
+            file_id = path.rsplit("/", 1)[-1]
+            return 200, self._file_body(self.files.pop(file_id, b""))
+
+        api_method = path.rsplit("/", 1)[-1]
+        self.method_counts[api_method] = self.method_counts.get(api_method, 0) + 1
+
+        if headers.get("content-type", "").startswith("application/json"):
+            params = json.loads(body or b"{}")
+        else:
+            params = {k: v[0] for k, v in parse_qs(body.decode("utf-8")).items()}
+
+        if api_method == "getMe":
+            return 200, {"ok": True, "result": {**BOT_USER, "can_join_groups": False,
+                                                "can_read_all_group_messages": False,
+                                                "supports_inline_queries": False}}
+
+        if api_method in ("sendMessage", "editMessageText"):
+            chat_id = int(params.get("chat_id", 0))
+            if api_method == "sendMessage":
+                message_id = self._next_message_id()
+            else:
+                message_id = int(params.get("message_id", 0))
+
+            markup = params.get("reply_markup")
+            if markup:
+                markup = json.loads(markup) if isinstance(markup, str) else markup
+                if "inline_keyboard" in markup:
+                    buttons = [button for row in markup["inline_keyboard"] for button in row]
+                    self.last_inline_keyboard[chat_id] = (message_id, buttons)
+
+            return 200, {"ok": True, "result": self._message(chat_id, message_id, params.get("text"))}
+
+        if api_method == "getFile":
+            file_id = params.get("file_id")
+            return 200, {"ok": True, "result": {
+                "file_id": file_id, "file_unique_id": file_id,
+                "file_size": len(self.files.get(file_id, b"")), "file_path": f"documents/{file_id}",
+            }}
+
+        # answerCallbackQuery, deleteWebhook и прочие методы
+        return 200, {"ok": True, "result": True}
+
+    async def _file_body(self, content: bytes):
+        for offset in range(0, len(content), 64 * 1024):
+            yield content[offset:offset + 64 * 1024]
+
+    def find_callback(self, chat_id: int, prefix: str) -> Optional[Tuple[int, str]]:
+        """Найти callback_data кнопки с заданным префиксом в последней клавиатуре чата"""
+        message_id, buttons = self.last_inline_keyboard.get(chat_id, (0, []))
+        for button in buttons:
+            data = button.get("callback_data")
+            if data and data.startswith(prefix):
+                return message_id, data
+        return None
+
+
+class FakeDeepSeekServer(FakeHTTPServer):
+    """Фейковый OpenAI-совместимый DeepSeek с настраиваемой задержкой, стримингом и ошибками"""
+
+    def __init__(self, latency: float = 1.0, jitter: float = 0.3, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, response_chars: int = 3000, chunk_delay: float = 0.01):
+        super().__init__("deepseek")
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.response_chars = response_chars
+        self.chunk_delay = chunk_delay
+        self.completions = 0
+        self.errors = 0
+        self.seen_prefixes = set()
+
+    def _response_text(self) -> str:
+        return ("Отличный текст. " * (self.response_chars // 16 + 1))[:self.response_chars]
+
+    async def handle(self, method, path, query, headers, body):
+        if not path.endswith("/chat/completions"):
+            return 404, {"error": {"message": "not found"}}
+
+        request = json.loads(body or b"{}")
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            self.errors += 1
+            return 429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}}
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.errors += 1
+            return 500, {"error": {"message": "Internal error", "type": "server_error"}}
+
+        self.completions += 1
+        messages = request.get("messages", [])
+        prompt_chars = sum(len(m.get("content", "")) for m in messages)
+
+        # Кэш контекста как у DeepSeek: системное сообщение, уже встречавшееся ранее, считается попаданием
+        prefix = messages[0].get("content", "") if messages else ""
+        hit_tokens = len(prefix) // 4 if prefix in self.seen_prefixes else 0
+        self.seen_prefixes.add(prefix)
+
+        usage = {
+            "prompt_tokens": prompt_chars // 4,
+            "completion_tokens": self.response_chars // 4,
+            "total_tokens": (prompt_chars + self.response_chars) // 4,
+            "prompt_cache_hit_tokens": hit_tokens,
+            "prompt_cache_miss_tokens": prompt_chars // 4 - hit_tokens,
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        text = self._response_text()
+
+        if request.get("stream"):
+            return 200, self._stream(completion_id, request.get("model", "deepseek-chat"), text)
+
+        return 200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "deepseek-chat"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    async def _stream(self, completion_id: str, model: str, text: str):
+        step = 64
+        for offset in range(0, len(text), step):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": text[offset:offset + step]}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+            await asyncio.sleep(self.chunk_delay)
+        yield b"data: [DONE]\n\n"
+
+
+class FakeYooMoneyServer(FakeHTTPServer):
+    """Фейковый YooMoney API: operation-history по оплаченным меткам"""
+
+    def __init__(self, latency: float = 0.2):
+        super().__init__("yoomoney")
+        self.latency = latency
+        self.paid: Dict[str, float] = {}
+
+    def mark_paid(self, label: str, amount: float):
+        self.paid[label] = amount
+
+    async def handle(self, method, path, query, headers, body):
+        await asyncio.sleep(self.latency)
+        if not path.endswith("/operation-history"):
+            return 404, {"error": "illegal_param_type"}
+
+        params = {k: v[0] for k, v in parse_qs(body.decode("utf-8")).items()}
+        label = params.get("label")
+        labels = [label] if label else list(self.paid)
+
+        operations = []
+        for item in labels:
+            if item in self.paid:
+                operations.append({
+                    "operation_id": uuid.uuid5(uuid.NAMESPACE_OID, item).hex,
+                    "status": "success",
+                    "datetime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                    "title": "Пополнение",
+                    "direction": "in",
+                    "amount": self.paid[item],
+                    "label": item,
+                    "type": "payment-shop",
+                })
+        return 200, {"operations": operations}
+
+
+class ServerThread:
+    """Фоновый поток со своим event loop для фейковых серверов.
+
+    Серверы не должны жить в loop'е бота: блокирующие вызовы в bot.py
+    (синхронный клиент OpenAI, requests в YooMoney) иначе приведут к взаимоблокировке.
+    """
+
+    def __init__(self, servers: List[FakeHTTPServer]):
+        self.servers = servers
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="fake-servers", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        for server in self.servers:
+            asyncio.run_coroutine_threadsafe(server.start(), self.loop).result()
+
+    def stop(self):
+        for server in self.servers:
+            asyncio.run_coroutine_threadsafe(server.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+
+
+class LoadTest:
+    """Сценарий нагрузочного теста поверх настоящего Application"""
+
+    def __init__(self, args: argparse.Namespace, telegram: FakeTelegramServer,
+                 yoomoney: FakeYooMoneyServer):
+        self.args = args
+        self.telegram = telegram
+        self.yoomoney = yoomoney
+        self.timings: Dict[str, List[float]] = {}
+        self.failures: Dict[str, int] = {}
+        self.completed_users = 0
+        self.db = None
+        self._update_id = 0
+        self._message_id = 0
+
+    def _next_ids(self) -> Tuple[int, int]:
+        self._update_id += 1
+        self._message_id += 1
+        return self._update_id, self._message_id
+
+    def _user(self, user_id: int) -> Dict[str, Any]:
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+    def _message_update(self, user_id: int, text: str) -> Dict[str, Any]:
+        update_id, message_id = self._next_ids()
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": update_id, "message": message}
+
+    def _document_update(self, user_id: int, file_id: str, file_name: str, size: int) -> Dict[str, Any]:
+        update = self._message_update(user_id, "")
+        message = update["message"]
+        del message["text"]
+        message["document"] = {"file_id": file_id, "file_unique_id": file_id,
+                               "file_name": file_name, "file_size": size}
+        return update
+
+    def _callback_update(self, user_id: int, message_id: int, data: str) -> Dict[str, Any]:
+        update_id, _ = self._next_ids()
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": BOT_USER,
+                    "text": "",
+                },
+            },
+        }
+
+    async def _step(self, application, name: str, payload: Dict[str, Any]):
+        from telegram import Update
+
+        update = Update.de_json(payload, application.bot)
+        started = time.perf_counter()
+        try:
+            await application.process_update(update)
+        except Exception as e:
+            self.failures[name] = self.failures.get(name, 0) + 1
+            logger.error(f"Шаг {name} завершился ошибкой: {e}")
+        self.timings.setdefault(name, []).append(time.perf_counter() - started)
+
+    def _sample_text(self) -> str:
+        length = random.randint(self.args.min_chars, self.args.max_chars)
+        return (SAMPLE_PARAGRAPH * (length // len(SAMPLE_PARAGRAPH) + 1))[:length]
+
+    async def simulate_user(self, application, user_id: int):
+        """Один пользователь проходит полный сценарий конечного автомата бота"""
+        role_button = random.choice(['📖 Бета-ридер', '✏️ Корректор', '📝 Редактор'])
+        all_roles = random.random() < self.args.all_roles_rate
+
+        await self._step(application, "start", self._message_update(user_id, "/start"))
+        if random.random() < self.args.paid_rate:
+            # Пользователь уже покупал анализы: его задания идут в классе оплативших
+            payment_id = f"loadtest-paid-{user_id}"
+            self.db.create_payment(user_id, payment_id, 99, 1)
+            self.db.complete_payment(payment_id)
+        if all_roles:
+            # Анализ всеми ролями стоит 3 кредита, у нового пользователя только 1
+            role_button = '🎭 Все роли'
+            self.db.add_credits(user_id, 2)
+        await self._step(application, "menu_roles", self._message_update(user_id, '👤 Роли'))
+        await self._step(application, "role_selection", self._message_update(user_id, role_button))
+        if random.random() < self.args.document_rate:
+            content = self._sample_text().encode("utf-8")
+            file_id = self.telegram.add_file(content)
+            await self._step(application, "document_analysis",
+                             self._document_update(user_id, file_id, "chapter.txt", len(content)))
+        else:
+            # Как клиент Telegram: длинный текст уходит частями по 4096 символов
+            text = self._sample_text()
+            for offset in range(0, len(text), 4096):
+                await self._step(application, "text_part", self._message_update(user_id, text[offset:offset + 4096]))
+            await self._step(application, "text_analysis", self._message_update(user_id, '✅ Готово'))
+
+        if random.random() < self.args.purchase_rate:
+            await self._step(application, "menu_purchase", self._message_update(user_id, '💳 Купить анализы'))
+            found = self.telegram.find_callback(user_id, OP_BUY)
+            if found:
+                message_id, data = found
+                await self._step(application, "purchase_buy", self._callback_update(user_id, message_id, data))
+
+                found = self.telegram.find_callback(user_id, OP_CHECK)
+                if found:
+                    message_id, data = found
+                    self.yoomoney.mark_paid(data[len(OP_CHECK):], 99)
+                    await self._step(application, "purchase_check",
+                                     self._callback_update(user_id, message_id, data))
+
+        self.completed_users += 1
+
+    async def run(self, application) -> float:
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+        first_user = 10_000_000
+
+        async def guarded(user_id: int):
+            async with semaphore:
+                await self.simulate_user(application, user_id)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(guarded(first_user + i) for i in range(self.args.users)))
+        return time.perf_counter() - started
+
+
+class FakeQuickpay:
+    """Замена yoomoney.Quickpay: не ходит в сеть, возвращает ссылку на фейковый сервер"""
+
+    base_url = "http://127.0.0.1/quickpay"
+
+    def __init__(self, **kwargs):
+        self.label = kwargs.get("label")
+        self.redirected_url = f"{self.base_url}?label={self.label}"
+
+
+def print_report(test: LoadTest, elapsed: float, lag_samples: List[float],
+                 telegram: FakeTelegramServer, deepseeks: List[FakeDeepSeekServer]):
+    """Вывод итогового отчета"""
+    total_steps = sum(len(v) for v in test.timings.values())
+    print("\n📊 Результаты нагрузочного теста")
+    print(f"Пользователей завершено: {test.completed_users}/{test.args.users} за {elapsed:.2f} с")
+    print(f"Пропускная способность: {total_steps / elapsed:.1f} update/с, "
+          f"{test.completed_users / elapsed:.2f} пользователей/с")
+    print(f"DeepSeek: {sum(d.completions for d in deepseeks)} ответов, {sum(d.errors for d in deepseeks)} ошибок; "
+          f"Telegram API: {telegram.requests_total} запросов")
+
+    print(f"\n{'Обработчик':<18}{'count':>8}{'err':>6}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'max, мс':>10}")
+    for name, values in test.timings.items():
+        print(f"{name:<18}{len(values):>8}{test.failures.get(name, 0):>6}"
+              f"{percentile(values, 50) * 1000:>10.1f}{percentile(values, 95) * 1000:>10.1f}"
+              f"{percentile(values, 99) * 1000:>10.1f}{max(values) * 1000:>10.1f}")
+
+    if lag_samples:
+        print(f"\nЗадержка event loop: p50 {percentile(lag_samples, 50) * 1000:.1f} мс, "
+              f"p95 {percentile(lag_samples, 95) * 1000:.1f} мс, "
+              f"p99 {percentile(lag_samples, 99) * 1000:.1f} мс, "
+              f"max {max(lag_samples) * 1000:.1f} мс")
+
+
+async def run_load_test(args: argparse.Namespace):
+    """Подготовка окружения, запуск сценария и вывод отчета"""
+    telegram = FakeTelegramServer()
+    # Несколько точек DeepSeek проверяют балансировку; первые --degraded-endpoints почти всегда отвечают 429
+    deepseeks = [
+        FakeDeepSeekServer(
+            latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+            rate_limit_rate=0.9 if index < args.degraded_endpoints else args.rate_limit_rate,
+            response_chars=args.response_chars, chunk_delay=args.chunk_delay
+        )
+        for index in range(args.deepseek_endpoints)
+    ]
+    yoomoney = FakeYooMoneyServer(latency=args.yoomoney_latency)
+    servers = ServerThread([telegram, *deepseeks, yoomoney])
+    servers.start()
+
+    # Конфигурация читается при импорте, поэтому окружение настраивается до импорта bot
+    workdir = tempfile.mkdtemp(prefix="airidder_loadtest_")
+    os.environ["TELEGRAM_BOT_TOKEN"] = FAKE_TOKEN
+    os.environ["DEEPSEEK_API_KEY"] = "sk-loadtest"
+    os.environ["DEEPSEEK_API_BASE"] = deepseeks[0].base_url
+    os.environ["DEEPSEEK_ENDPOINTS"] = ",".join(
+        f"sk-loadtest-{index}@{server.base_url}" for index, server in enumerate(deepseeks)
+    )
+    # Исключенные точки возвращаются быстро, чтобы короткий тест успел это увидеть
+    os.environ.setdefault("DEEPSEEK_EJECT_TIME", "1")
+    os.environ["DATABASE_PATH"] = os.path.join(workdir, "bot.db")
+    if args.diagnostics:
+        os.environ["DIAGNOSTICS_ENABLED"] = "1"
+        os.environ.setdefault("DIAGNOSTICS_LOG_PATH", os.path.join(workdir, "diagnostics.log"))
+
+    import payment
+    FakeQuickpay.base_url = f"{yoomoney.base_url}/quickpay"
+    payment.Quickpay = FakeQuickpay
+
+    import bot
+    import diagnostics
+    from telegram.ext import Application
+
+    bot.payment_manager.receiver_wallet = "4100000000000000"
+    bot.payment_manager.client = payment.Client("loadtest-token")
+    bot.payment_manager.client.base_url = f"{yoomoney.base_url}/api/"
+
+    application = (
+        Application.builder()
+        .token(FAKE_TOKEN)
+        .base_url(f"{telegram.base_url}/bot")
+        .base_file_url(f"{telegram.base_url}/file/bot")
+        .connection_pool_size(args.telegram_pool_size)
+        .pool_timeout(30)
+        .build()
+    )
+    bot.register_handlers(application)
+    await application.initialize()
+    await bot.start_analysis_worker(application)
+    # Как при запуске бота: соединения с DeepSeek и YooMoney открываются заранее
+    await bot.http_pool.prewarm(
+        [endpoint.base_url for endpoint in bot.deepseek_api.pool.endpoints],
+        [bot.payment_manager.client.base_url]
+    )
+
+    test = LoadTest(args, telegram, yoomoney)
+    test.db = bot.db
+    monitor = diagnostics.LoopLagMonitor(capture_stacks=args.diagnostics)
+    if args.diagnostics:
+        diagnostics.setup_report_log()
+    monitor.start()
+    started = time.perf_counter()
+    try:
+        elapsed = await test.run(application)
+        # Анализы выполняются в фоне: ждем доставки всех результатов
+        await bot.analysis_worker.join()
+        elapsed_with_jobs = time.perf_counter() - started
+    finally:
+        await bot.analysis_worker.stop()
+        await monitor.stop()
+        await application.shutdown()
+        servers.stop()
+
+    print_report(test, elapsed, list(monitor.samples), telegram, deepseeks)
+    limiter = bot.deepseek_api.limiter.get_stats()
+    print(f"Лимит запросов к DeepSeek: {limiter['limit']:.1f} (повышений {limiter['increases']}, "
+          f"снижений {limiter['decreases']})")
+    if len(deepseeks) > 1:
+        for endpoint in bot.deepseek_api.pool.get_stats():
+            print(f"Точка {endpoint['name']}: запросов {endpoint['requests']}, ошибок {endpoint['failures']}, "
+                  f"исключений {endpoint['ejections']}")
+    durations = list(bot.analysis_worker.durations)
+    if durations:
+        print(f"Задания анализа: {len(durations)} за {elapsed_with_jobs:.2f} с, от постановки до доставки "
+              f"p50 {percentile(durations, 50) * 1000:.0f} мс, p95 {percentile(durations, 95) * 1000:.0f} мс, "
+              f"p99 {percentile(durations, 99) * 1000:.0f} мс")
+    jobs_queue = bot.analysis_worker.queue.get_stats()
+    for cls, label in bot.PRIORITY_LABELS.items():
+        waits = [jobs_queue[cls], limiter['classes'][cls]]
+        if not waits[0]['served']:
+            continue
+        print(f"{label}: заданий {waits[0]['served']}, ожидание в очереди заданий p50 "
+              f"{waits[0]['wait_p50'] * 1000:.0f} мс, p95 {waits[0]['wait_p95'] * 1000:.0f} мс; "
+              f"в очереди к DeepSeek p50 {waits[1]['wait_p50'] * 1000:.0f} мс, "
+              f"p95 {waits[1]['wait_p95'] * 1000:.0f} мс")
+    for host in bot.http_pool.get_stats()['hosts']:
+        print(f"Соединения с {host['host']}: запросов {host['requests']}, новых соединений "
+              f"{host['connections']}, переиспользование {host['reuse']:.0%}")
+    for item in bot.db.get_cache_stats():
+        print(f"Кэш контекста {item['role']}: {item['hit_ratio']:.1%}")
+    if args.diagnostics:
+        print(f"\nБлокировок event loop: {monitor.stalls}, медленных вызовов обработчиков: "
+              f"{diagnostics.handler_profiler.slow_calls}")
+        print(f"Отчеты диагностики: {os.environ['DIAGNOSTICS_LOG_PATH']}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест AiRidder Bot на фейковых серверах")
+    parser.add_argument("--users", type=int, default=1000, help="Количество симулируемых пользователей")
+    parser.add_argument("--concurrency", type=int, default=100, help="Одновременно активных пользователей")
+    parser.add_argument("--min-chars", type=int, default=2000, help="Минимальная длина текста")
+    parser.add_argument("--max-chars", type=int, default=20000, help="Максимальная длина текста")
+    parser.add_argument("--all-roles-rate", type=float, default=0.1, help="Доля пользователей, выбирающих все роли")
+    parser.add_argument("--document-rate", type=float, default=0.1, help="Доля пользователей, загружающих файл .txt")
+    parser.add_argument("--purchase-rate", type=float, default=0.3, help="Доля пользователей, покупающих анализы")
+    parser.add_argument("--paid-rate", type=float, default=0.3,
+                        help="Доля пользователей, оплативших анализы до начала теста")
+    parser.add_argument("--latency", type=float, default=1.0, help="Средняя задержка DeepSeek, с")
+    parser.add_argument("--jitter", type=float, default=0.3, help="Разброс задержки DeepSeek, с")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов DeepSeek 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Доля ответов DeepSeek 429")
+    parser.add_argument("--deepseek-endpoints", type=int, default=1, help="Количество фейковых точек DeepSeek")
+    parser.add_argument("--degraded-endpoints", type=int, default=0,
+                        help="Сколько точек DeepSeek отвечают 429 на 90%% запросов")
+    parser.add_argument("--response-chars", type=int, default=3000, help="Длина ответа DeepSeek в символах")
+    parser.add_argument("--chunk-delay", type=float, default=0.01, help="Пауза между чанками при стриминге, с")
+    parser.add_argument("--yoomoney-latency", type=float, default=0.2, help="Задержка YooMoney API, с")
+    parser.add_argument("--telegram-pool-size", type=int, default=256, help="Размер пула соединений к Telegram")
+    parser.add_argument("--diagnostics", action="store_true",
+                        help="Включить профилирование обработчиков и снятие стеков при блокировках loop")
+    parser.add_argument("--log-level", default="WARNING", help="Уровень логирования бота")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logging.getLogger().setLevel(args.log_level)
+    asyncio.run(run_load_test(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
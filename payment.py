@@ -1,11 +1,22 @@
+import base64
 import logging
-import uuid
+import secrets
 from typing import Optional, Dict, Any, Tuple
 from datetime import datetime, timedelta
-import time
+
+import http_pool
 
 try:
     from yoomoney import Quickpay, Client
+    from yoomoney.account import account as _yoomoney_account
+    from yoomoney.history import history as _yoomoney_history
+    from yoomoney.operation_details import operation_details as _yoomoney_operation_details
+    from yoomoney.quickpay import quickpay as _yoomoney_quickpay
+    
+    # SDK вызывает requests.request без сессии и таймаута: подставляем общую сессию,
+    # чтобы ссылки на оплату и проверки оплаты переиспользовали соединение с YooMoney
+    for _module in (_yoomoney_account, _yoomoney_history, _yoomoney_operation_details, _yoomoney_quickpay):
+        _module.requests = http_pool.session
 except ImportError:
     # Заглушка для случая, если библиотека не установлена
     class Quickpay:
@@ -19,23 +30,31 @@ except ImportError:
         def operation_history(self, **kwargs):
             return type('obj', (object,), {'operations': []})
 
-from config import TARIFFS
-from database import Database
+from catalog import catalog
+from database import Database, PAYMENT_COMPLETED, PAYMENT_ALREADY_COMPLETED, PAYMENT_ERROR
 
 logger = logging.getLogger(__name__)
 
+# Идентификатор платежа: префикс и 64 случайных бита в base32 (15 символов).
+# Он же служит меткой YooMoney и помещается в callback_data кнопки проверки.
+PAYMENT_ID_PREFIX = "ar"
+PAYMENT_ID_RANDOM_BYTES = 8
+# Метки вида airidder_{user_id}_{tariff_key}_{timestamp}_{uuid8} до перехода на короткие идентификаторы
+LEGACY_LABEL_PREFIX = "airidder_"
+
 class PaymentManager:
-    def __init__(self, yoomoney_token: str = None, receiver_wallet: str = None):
+    def __init__(self, yoomoney_token: str = None, receiver_wallet: str = None, db: Database = None):
         """
         Инициализация менеджера платежей
         
         Args:
             yoomoney_token: Токен YooMoney API
             receiver_wallet: Номер кошелька получателя
+            db: Общий экземпляр базы данных (по умолчанию создается новый)
         """
         self.yoomoney_token = yoomoney_token
         self.receiver_wallet = receiver_wallet
-        self.db = Database()
+        self.db = db or Database()
         
         # Инициализация клиента YooMoney
         if yoomoney_token:
@@ -49,11 +68,10 @@ class PaymentManager:
             self.client = None
             logger.warning("YooMoney токен не предоставлен")
     
-    def generate_payment_label(self, user_id: int, tariff_key: str) -> str:
+    def generate_payment_label(self) -> str:
         """Генерация уникальной метки для платежа"""
-        timestamp = int(time.time())
-        unique_id = str(uuid.uuid4())[:8]
-        return f"airidder_{user_id}_{tariff_key}_{timestamp}_{unique_id}"
+        random_part = base64.b32encode(secrets.token_bytes(PAYMENT_ID_RANDOM_BYTES))
+        return PAYMENT_ID_PREFIX + random_part.decode('ascii').rstrip('=').lower()
     
     def create_payment_link(self, user_id: int, tariff_key: str) -> Optional[Dict[str, Any]]:
         """
@@ -66,7 +84,8 @@ class PaymentManager:
         Returns:
             Dict с информацией о платеже или None при ошибке
         """
-        if tariff_key not in TARIFFS:
+        tariffs = catalog.current().tariffs
+        if tariff_key not in tariffs:
             logger.error(f"Неизвестный тариф: {tariff_key}")
             return None
         
@@ -74,8 +93,8 @@ class PaymentManager:
             logger.error("Номер кошелька получателя не настроен")
             return None
         
-        tariff = TARIFFS[tariff_key]
-        payment_label = self.generate_payment_label(user_id, tariff_key)
+        tariff = tariffs[tariff_key]
+        payment_label = self.generate_payment_label()
         
         try:
             # Создаем быстрый платеж
@@ -104,7 +123,8 @@ class PaymentManager:
                 user_id=user_id,
                 payment_id=payment_label,
                 amount=tariff['price'],
-                credits=tariff['credits']
+                credits=tariff['credits'],
+                tariff_key=tariff_key
             )
             
             if success:
@@ -161,64 +181,67 @@ class PaymentManager:
             logger.error(f"Ошибка проверки статуса платежа: {e}")
             return False, None
     
-    def process_successful_payment(self, payment_label: str) -> bool:
+    def process_successful_payment(self, payment_label: str,
+                                   operation_id: str = None) -> Optional[Dict[str, Any]]:
         """
         Обработка успешного платежа - начисление кредитов
         
+        Повторный вызов для того же платежа безопасен: кредиты начисляются один раз,
+        а повтор получает статус already_completed.
+        
         Args:
             payment_label: Метка платежа
+            operation_id: ID операции YooMoney, которой оплачен платеж
             
         Returns:
-            bool: Успешно ли обработан платеж
+            Dict {'status': ..., 'payment': данные платежа} или None при ошибке
         """
-        try:
-            # Завершаем платеж в базе данных и начисляем кредиты
-            payment_info = self.db.complete_payment(payment_label)
-            
-            if payment_info:
-                logger.info(f"Платеж {payment_label} успешно обработан, начислено {payment_info['credits']} кредитов")
-                return True
-            else:
-                logger.error(f"Не удалось обработать платеж: {payment_label}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Ошибка обработки платежа: {e}")
-            return False
+        outcome = self.db.complete_payments([(payment_label, operation_id)])[payment_label]
+        if outcome['status'] == PAYMENT_ERROR:
+            return None
+        if outcome['status'] == PAYMENT_COMPLETED:
+            logger.info(f"Платеж {payment_label} успешно обработан, начислено {outcome['payment']['credits']} кредитов")
+        elif outcome['status'] != PAYMENT_ALREADY_COMPLETED:
+            logger.error(f"Не удалось обработать платеж {payment_label}: {outcome['status']}")
+        return outcome
     
     def check_pending_payments(self) -> list:
         """
         Проверка всех ожидающих платежей
         
+        Все успешные входящие операции из истории YooMoney завершаются одной
+        транзакцией; уже зачтенные платежи пропускаются.
+        
         Returns:
             list: Список успешно обработанных платежей
         """
         if not self.client:
             return []
         
-        processed_payments = []
-        
         try:
-            # Получаем все ожидающие платежи из базы данных
-            # Это упрощенная версия - в реальности нужно добавить метод в Database
-            # Пока что проверим последние операции
-            
-            # Получаем историю операций за последние 24 часа
             history = self.client.operation_history()
             
+            operations = {}
             for operation in history.operations:
                 if (operation.status == "success" and 
                     operation.direction == "in" and 
                     operation.label and 
-                    operation.label.startswith("airidder_")):
-                    
-                    # Проверяем, не обработан ли уже этот платеж
-                    if self.process_successful_payment(operation.label):
-                        processed_payments.append({
-                            'label': operation.label,
-                            'amount': operation.amount,
-                            'datetime': operation.datetime
-                        })
+                    operation.label.startswith((PAYMENT_ID_PREFIX, LEGACY_LABEL_PREFIX))):
+                    operations.setdefault(operation.label, operation)
+            
+            outcomes = self.db.complete_payments([
+                (label, str(operation.operation_id)) for label, operation in operations.items()
+            ])
+            
+            processed_payments = [
+                {
+                    'label': label,
+                    'amount': operations[label].amount,
+                    'datetime': operations[label].datetime
+                }
+                for label, outcome in outcomes.items()
+                if outcome['status'] == PAYMENT_COMPLETED
+            ]
             
             if processed_payments:
                 logger.info(f"Обработано {len(processed_payments)} платежей")
@@ -229,30 +252,21 @@ class PaymentManager:
             logger.error(f"Ошибка проверки ожидающих платежей: {e}")
             return []
     
-    def get_payment_info_from_label(self, payment_label: str) -> Optional[Dict[str, Any]]:
+    def get_payment_info(self, payment_label: str) -> Optional[Dict[str, Any]]:
         """
-        Извлечение информации из метки платежа
+        Информация о платеже по метке
         
         Args:
             payment_label: Метка платежа
             
         Returns:
-            Dict с информацией или None
+            Dict с информацией (user_id, tariff_key, сумма, кредиты, статус) или None
         """
         try:
-            # Формат: airidder_{user_id}_{tariff_key}_{timestamp}_{unique_id}
-            parts = payment_label.split('_')
-            if len(parts) >= 5 and parts[0] == "airidder":
-                return {
-                    'user_id': int(parts[1]),
-                    'tariff_key': parts[2],
-                    'timestamp': int(parts[3]),
-                    'unique_id': parts[4]
-                }
+            return self.db.get_payment(payment_label)
         except Exception as e:
-            logger.error(f"Ошибка парсинга метки платежа: {e}")
-        
-        return None
+            logger.error(f"Ошибка получения платежа {payment_label}: {e}")
+            return None
 
 # Создаем глобальный экземпляр менеджера платежей
 # Токен и кошелек будут настроены позже через переменные окружения
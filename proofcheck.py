@@ -0,0 +1,252 @@
+"""
+Локальная предварительная проверка текста для корректора.
+
+Механические ошибки (двойные пробелы, повторы слов, пробелы у знаков
+препинания, дефис вместо тире, смешение латиницы и кириллицы, непарные скобки
+и кавычки, разное написание имен) находятся регулярными выражениями и
+статистикой по словам за миллисекунды и без запроса к API. Автор видит их
+сразу после отправки текста, а модели передается краткая сводка, чтобы она
+не тратила на них ответ и занималась грамматикой и синтаксисом.
+
+Проверка включается для ролей с признаком "proofcheck" в каталоге.
+Нумерация абзацев [§N] совпадает с revisions.split_paragraphs.
+"""
+
+import re
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Set
+
+import numpy as np
+
+from catalog import catalog
+from config import PROOFCHECK_REPORT_ITEMS
+
+# Виды замечаний в порядке вывода
+KIND_LABELS = {
+    'spaces': "Двойные пробелы",
+    'repeated_word': "Повтор слова",
+    'space_before_punct': "Пробел перед знаком препинания",
+    'missing_space': "Нет пробела после знака препинания",
+    'repeated_punct': "Повтор знака препинания",
+    'dash': "Дефис вместо тире",
+    'mixed_script': "Латинские буквы в русском слове",
+    'unpaired': "Непарные скобки или кавычки",
+    'names': "Разное написание имени",
+}
+
+# Сводка для модели перед текстом (после промпта роли, поэтому кэш префикса не страдает)
+MODEL_NOTE = (
+    "Двойные пробелы, повторы слов, пробелы у знаков препинания, дефисы вместо тире, "
+    "латинские буквы в русских словах, парность скобок и кавычек и единообразие "
+    "написания имен уже проверены автоматически, автор получит эти замечания отдельно. "
+    "Не перечисляй такие ошибки, сосредоточься на орфографии, грамматике, синтаксисе "
+    "и пунктуации.\n"
+)
+
+_FRAGMENT_LENGTH = 40
+# Сколько символов по сторонам ошибки просматривается в поисках соседних слов
+_CONTEXT = 20
+_TAIL = re.compile(r'\S*\s*$')
+_HEAD = re.compile(r'^\s*\S*')
+_LETTERS = r'[^\W\d_]'
+
+# (вид, выражение, замена совпадения). Выражения находят только саму ошибку:
+# соседние слова для отчета добавляет _around, поэтому поиск не перебирает слова целиком
+_RULES = (
+    ('spaces', re.compile(r'(?<=\S)[ \t]{2,}(?=\S)'), lambda m: " "),
+    ('repeated_word', re.compile(rf'\b({_LETTERS}+)\s+\1\b', re.IGNORECASE), lambda m: m.group(1)),
+    ('space_before_punct', re.compile(r'(?<=\w)[ \t]+(?=[,.;:!?)»])'), lambda m: ""),
+    ('missing_space', re.compile(rf'(?<={_LETTERS})[,;:](?={_LETTERS})'), lambda m: m.group() + " "),
+    # Точка между словами, кроме сокращений и инициалов (т.е., А.С.)
+    ('missing_space', re.compile(r'(?<=[а-яё]{2})[.!?](?=[А-ЯЁ][а-яё])'), lambda m: m.group() + " "),
+    ('repeated_punct', re.compile(r',{2,}|;{2,}|:{2,}|(?<!\.)\.\.(?!\.)'), lambda m: m.group()[0]),
+    ('dash', re.compile(rf'(?<={_LETTERS}) - (?={_LETTERS})'), lambda m: " — "),
+    ('dash', re.compile(r'^-(?=\s)'), lambda m: "—"),
+    ('mixed_script', re.compile(rf'\b(?=\w*[а-яё])(?=\w*[a-z]){_LETTERS}+\b', re.IGNORECASE),
+     lambda m: m.group().translate(_HOMOGLYPHS)),
+)
+
+# Латинские буквы, неотличимые от кириллических
+_HOMOGLYPHS = str.maketrans('aceopxyACEHKMOPTXB', 'асеорхуАСЕНКМОРТХВ')
+
+_PAIRS = (('(', ')'), ('«', '»'))
+
+# Имя внутри предложения: после строчной буквы или знака препинания и пробела
+_NAME = re.compile(r'(?<=[а-яё,;:] )[А-ЯЁ][а-яё]{2,}')
+# Падежные окончания, отбрасываемые перед сравнением имен
+_ENDINGS = tuple(sorted(
+    ('ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ым', 'им',
+     'ом', 'ем', 'ов', 'ев', 'ах', 'ях', 'ам', 'ям', 'ую', 'юю', 'а', 'я', 'у', 'ю', 'е', 'и',
+     'ы', 'о', 'ь', 'й'),
+    key=len, reverse=True
+))
+_NAME_MIN_STEM = 4
+
+
+class Finding(NamedTuple):
+    kind: str
+    paragraph: Optional[int]
+    fragment: str
+    suggestion: str
+
+
+def _paragraphs(text: str) -> List[str]:
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def _shorten(fragment: str) -> str:
+    if len(fragment) <= _FRAGMENT_LENGTH:
+        return fragment
+    return fragment[:_FRAGMENT_LENGTH] + "…"
+
+
+def _around(paragraph: str, match: re.Match, replacement: str):
+    """Фрагмент с ошибкой и исправленный фрагмент вместе с соседними словами"""
+    before = _TAIL.search(paragraph[max(0, match.start() - _CONTEXT):match.start()]).group()
+    after = _HEAD.match(paragraph[match.end():match.end() + _CONTEXT]).group()
+    return _shorten(before + match.group() + after), _shorten(before + replacement + after)
+
+
+def _stem(word: str) -> str:
+    """Основа имени без падежных окончаний (не короче трех букв)"""
+    word = word.lower()
+    for _ in range(2):
+        for ending in _ENDINGS:
+            if word.endswith(ending) and len(word) - len(ending) >= 3:
+                word = word[:-len(ending)]
+                break
+        else:
+            break
+    return word
+
+
+def _one_edit_apart(first: str, second: str) -> bool:
+    """Отличаются ли строки ровно одной заменой, вставкой или удалением"""
+    if first == second or abs(len(first) - len(second)) > 1:
+        return False
+    if len(first) > len(second):
+        first, second = second, first
+    index = 0
+    while index < len(first) and first[index] == second[index]:
+        index += 1
+    if len(first) == len(second):
+        return first[index + 1:] == second[index + 1:]
+    return first[index:] == second[index + 1:]
+
+
+def _name_findings(paragraphs: List[str]) -> List[Finding]:
+    """Редкие написания имен, отличающиеся одной буквой от частых"""
+    words, places = [], []
+    for number, paragraph in enumerate(paragraphs, 1):
+        for match in _NAME.finditer(paragraph):
+            words.append(match.group())
+            places.append(number)
+    if len(words) < 2:
+        return []
+
+    forms, first_seen, form_counts = np.unique(np.array(words), return_index=True, return_counts=True)
+    stems, stem_index = np.unique([_stem(form) for form in forms.tolist()], return_inverse=True)
+    stem_counts = np.bincount(stem_index, weights=form_counts).astype(int)
+    # Дальше поэлементный доступ: списки Python быстрее скаляров numpy
+    forms, first_seen, form_counts = forms.tolist(), first_seen.tolist(), form_counts.tolist()
+    stems, stem_index, stem_counts = stems.tolist(), stem_index.tolist(), stem_counts.tolist()
+    # Самая частая форма каждой основы - для показа автору
+    shown = {}
+    for form_index, stem in enumerate(stem_index):
+        if stem not in shown or form_counts[form_index] > form_counts[shown[stem]]:
+            shown[stem] = form_index
+
+    # Отбор пар без сравнения всех основ со всеми: основы на расстоянии одной правки
+    # совпадают целиком или после удаления одной буквы (у одной из них или у обеих
+    # в одной позиции). Каждая основа попадает в len + 1 корзин, поэтому время и
+    # память растут линейно с числом разных имен
+    buckets: Dict[str, List[int]] = defaultdict(list)
+    for row, stem in enumerate(stems):
+        if len(stem) < _NAME_MIN_STEM:
+            continue
+        buckets[stem].append(row)
+        for position in range(len(stem)):
+            buckets[stem[:position] + stem[position + 1:]].append(row)
+
+    candidates: Dict[int, Set[int]] = defaultdict(set)
+    for rows in buckets.values():
+        for rare in rows:
+            for common in rows:
+                if stem_counts[rare] < stem_counts[common]:
+                    candidates[rare].add(common)
+
+    findings = []
+    for rare in sorted(candidates):
+        for common in sorted(candidates[rare]):
+            if not _one_edit_apart(stems[rare], stems[common]):
+                continue
+            rare_form, common_form = forms[shown[rare]], forms[shown[common]]
+            findings.append(Finding(
+                'names', places[first_seen[shown[rare]]],
+                f"{rare_form} ({stem_counts[rare]})", f"{common_form} ({stem_counts[common]})"
+            ))
+            break
+    return findings
+
+
+def check(text: str) -> List[Finding]:
+    """Найти механические ошибки в тексте"""
+    paragraphs = _paragraphs(text)
+    findings = []
+    for number, paragraph in enumerate(paragraphs, 1):
+        for kind, pattern, fix in _RULES:
+            for match in pattern.finditer(paragraph):
+                findings.append(Finding(kind, number, *_around(paragraph, match, fix(match))))
+        for opening, closing in _PAIRS:
+            if paragraph.count(opening) != paragraph.count(closing):
+                findings.append(Finding(
+                    'unpaired', number, _shorten(paragraph),
+                    f"{opening} - {paragraph.count(opening)}, {closing} - {paragraph.count(closing)}"
+                ))
+    findings.extend(_name_findings(paragraphs))
+    return findings
+
+
+def _group(findings: List[Finding]) -> Dict[str, List[Finding]]:
+    grouped: Dict[str, List[Finding]] = {kind: [] for kind in KIND_LABELS}
+    for finding in findings:
+        grouped[finding.kind].append(finding)
+    return {kind: items for kind, items in grouped.items() if items}
+
+
+def format_report(findings: List[Finding], limit: int = PROOFCHECK_REPORT_ITEMS) -> str:
+    """Отчет для автора: замечания по видам, не больше limit примеров каждого вида"""
+    if not findings:
+        return catalog.text('proofcheck_clean')
+
+    sections = [catalog.text('proofcheck_header', count=len(findings))]
+    for kind, items in _group(findings).items():
+        lines = [f"• {KIND_LABELS[kind]}: {len(items)}"]
+        for finding in items[:limit]:
+            place = f"[§{finding.paragraph}] " if finding.paragraph else ""
+            lines.append(f"  {place}«{finding.fragment}» -> «{finding.suggestion}»")
+        if len(items) > limit:
+            lines.append("  " + catalog.text('proofcheck_more', count=len(items) - limit))
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections)
+
+
+def model_note(findings: List[Finding]) -> str:
+    """Сводка для модели: что уже проверено и сколько найдено"""
+    grouped = _group(findings)
+    if not grouped:
+        return MODEL_NOTE + "Автоматическая проверка таких ошибок не нашла.\n\n"
+
+    counts = "; ".join(f"{KIND_LABELS[kind].lower()} - {len(items)}" for kind, items in grouped.items())
+    note = MODEL_NOTE + f"Найдено автоматически: {counts}.\n"
+    names = grouped.get('names')
+    if names:
+        # Варианты имен модели полезно знать, чтобы не считать их опечатками заново
+        variants = ", ".join(f"{item.fragment} / {item.suggestion}" for item in names[:PROOFCHECK_REPORT_ITEMS])
+        note += f"Варианты имен: {variants}.\n"
+    return note + "\n"
+
+
+def enabled_for(role_key: str) -> bool:
+    role = catalog.current().roles.get(role_key)
+    return bool(role and role.get('proofcheck'))
@@ -0,0 +1,233 @@
+"""
+Повторная проверка отредактированных текстов.
+
+Текст делится на абзацы, для каждого абзаца запоминаются отпечаток и замечания
+роли. Когда автор присылает исправленную версию, в DeepSeek уходят только
+измененные абзацы (с соседними для контекста), а замечания к неизмененным
+берутся из прошлой проверки. Расход токенов и время ответа зависят от объема
+правки, а не от длины всего текста.
+
+Подходит только для ролей, чьи замечания относятся к отдельным абзацам:
+такие роли помечены в каталоге признаком "incremental" (сейчас это корректор).
+
+Сохраняются только замечания к абзацам, которые модель явно упомянула;
+абзац без метки в ответе будет проверен снова. Лимит ответа размеченного
+запроса увеличивается на REVISION_TOKENS_PER_PARAGRAPH на каждый проверяемый
+абзац. Если ответ все же обрезан, сохраняются замечания к абзацам, разобранным
+до обрыва, а остальные проверяются при следующей отправке: повторный запрос
+всего текста стоил бы вдвое и снова не уложился бы в тот же лимит. Ответ без
+меток заменяется обычным анализом всего текста.
+"""
+
+import hashlib
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from catalog import catalog
+from config import (
+    REVISION_CONTEXT_PARAGRAPHS, REVISION_SNIPPET_LENGTH, REVISION_TOKENS_PER_PARAGRAPH, REVISION_MAX_TOKENS
+)
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+# Инструкция перед текстом, размеченным по абзацам
+REVISION_INSTRUCTION = (
+    "Текст разбит на абзацы с метками [§N]. Сгруппируй замечания по абзацам: "
+    "каждую группу начинай с метки абзаца [§N] на отдельной строке. "
+    "Упомяни каждый абзац без пометки: если ошибок в нем нет, напиши после метки "
+    "\"Ошибок нет\". Абзацы с пометкой (контекст) не проверяй, "
+    "они даны только для понимания смысла.\n\nПроанализируй следующий текст:\n\n"
+)
+CONTEXT_MARK = "(контекст)"
+# Ответ модели для абзаца без ошибок (сохраняется как пустые замечания)
+NO_FINDINGS = re.compile(r'^[*_]*ошибок\s+нет[.!*_]*$', re.IGNORECASE)
+
+# Метка абзаца в начале строки ответа, возможно внутри markdown-разметки
+PARAGRAPH_MARKER = re.compile(r'^[\s*_#>-]*\[§(\d+)\][*_:]*[ \t]*', re.MULTILINE)
+
+
+def split_paragraphs(text: str) -> List[str]:
+    """Абзацы текста: непустые строки без крайних пробелов"""
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def paragraph_fingerprint(paragraph: str) -> str:
+    """Отпечаток абзаца, не зависящий от лишних пробелов"""
+    normalized = " ".join(paragraph.split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+def parse_findings(result: str) -> Optional[Dict[int, str]]:
+    """
+    Разобрать ответ на замечания по номерам абзацев
+
+    Returns:
+        Optional[Dict[int, str]]: номер абзаца -> замечания (пустая строка - ошибок нет);
+            None, если в ответе нет меток. Абзацы без метки в словарь не попадают
+    """
+    markers = list(PARAGRAPH_MARKER.finditer(result))
+    if not markers:
+        return None
+
+    findings: Dict[int, str] = {}
+    for position, marker in enumerate(markers):
+        end = markers[position + 1].start() if position + 1 < len(markers) else len(result)
+        section = result[marker.end():end].strip()
+        if section.startswith(CONTEXT_MARK):
+            section = section[len(CONTEXT_MARK):].strip()
+        if NO_FINDINGS.match(section):
+            section = ""
+        number = int(marker.group(1))
+        findings[number] = "\n".join(filter(None, [findings.get(number), section]))
+    return findings
+
+
+class RevisionAnalyzer:
+    """Анализ с повторным использованием замечаний к неизмененным абзацам"""
+
+    def __init__(self, db: Database, api, context_paragraphs: int = REVISION_CONTEXT_PARAGRAPHS):
+        self.db = db
+        self.api = api
+        self.context_paragraphs = context_paragraphs
+
+    def supports(self, role_key: str) -> bool:
+        role = catalog.current().roles.get(role_key)
+        return bool(role and role.get('incremental'))
+
+    def _request_text(self, paragraphs: List[str], changed: List[int]) -> str:
+        """Измененные абзацы с метками и соседние абзацы с пометкой контекста"""
+        selected = set()
+        for index in changed:
+            start = max(0, index - self.context_paragraphs)
+            selected.update(range(start, min(len(paragraphs), index + self.context_paragraphs + 1)))
+
+        changed_set = set(changed)
+        lines = []
+        for index in sorted(selected):
+            mark = "" if index in changed_set else f" {CONTEXT_MARK}"
+            lines.append(f"[§{index + 1}]{mark} {paragraphs[index]}")
+        return "\n\n".join(lines)
+
+    def _budget(self, role_key: str, request_text: str, changed: int, options: Dict[str, Any]) -> int:
+        """Лимит ответа: обычный для такого объема текста плюс запас на метку каждого абзаца"""
+        base = options.get('max_tokens') or catalog.current().routing.route(
+            role_key, self.api.count_tokens(request_text)
+        ).max_tokens
+        return min(REVISION_MAX_TOKENS, base + REVISION_TOKENS_PER_PARAGRAPH * changed)
+
+    def build_report(self, paragraphs: List[str], fingerprints: List[str],
+                     findings: Dict[str, str], reused: int, unchecked: int = 0) -> str:
+        """Отчет по всем абзацам текста в порядке следования"""
+        sections = []
+        if reused:
+            sections.append(catalog.text('revision_reused', reused=reused, total=len(paragraphs)))
+        if unchecked:
+            sections.append(catalog.text(
+                'revision_truncated', checked=len(paragraphs) - unchecked, total=len(paragraphs)
+            ))
+
+        reported = 0
+        for index, (paragraph, fingerprint) in enumerate(zip(paragraphs, fingerprints)):
+            text = findings.get(fingerprint)
+            if not text:
+                continue
+            snippet = paragraph[:REVISION_SNIPPET_LENGTH]
+            if len(paragraph) > REVISION_SNIPPET_LENGTH:
+                snippet += "…"
+            sections.append(f"[§{index + 1}] «{snippet}»\n{text}")
+            reported += 1
+
+        if not reported:
+            sections.append(catalog.text('revision_no_findings'))
+        return "\n\n".join(sections)
+
+    async def _full_analysis(self, role_key: str, text: str, spent_tokens: int,
+                             options: Dict[str, Any]) -> Tuple[Optional[str], int, Dict[str, Any]]:
+        """Обычный анализ всего текста; токены неудавшегося частичного запроса тоже учитываются"""
+        result, tokens_used, usage = await self.api.analyze_text(role_key, text, **options)
+        if result is None or tokens_used <= 0:
+            return result, tokens_used, usage
+        return result, tokens_used + spent_tokens, usage
+
+    async def analyze(self, user_id: int, role_key: str, text: str,
+                      **options) -> Tuple[Optional[str], int, Dict[str, Any]]:
+        """
+        Анализ текста с проверкой только измененных абзацев
+
+        Дополнительные параметры (notes, max_tokens, priority) передаются в DeepSeekAPI.analyze_text
+
+        Returns:
+            Tuple[Optional[str], int, Dict[str, Any]]: как у DeepSeekAPI.analyze_text;
+                в статистике дополнительно reused_paragraphs и признак reused -
+                отчет целиком собран из прошлых проверок без запроса к API
+        """
+        paragraphs = split_paragraphs(text)
+        fingerprints = [paragraph_fingerprint(paragraph) for paragraph in paragraphs]
+        prompt_version = catalog.current().prompt_versions[role_key]
+
+        findings = self.db.get_paragraph_findings(user_id, role_key, prompt_version, set(fingerprints))
+        # Абзацы без сохраненных замечаний; повторяющийся абзац проверяется один раз
+        changed, seen = [], set()
+        for index, fingerprint in enumerate(fingerprints):
+            if fingerprint not in findings and fingerprint not in seen:
+                seen.add(fingerprint)
+                changed.append(index)
+        reused = sum(1 for fingerprint in fingerprints if fingerprint in findings)
+
+        cache_usage: Dict[str, Any] = {
+            'prompt_cache_hit_tokens': 0,
+            'prompt_cache_miss_tokens': 0,
+            'prompt_version': prompt_version,
+        }
+        tokens_used = 0
+        unchecked = 0
+        if changed:
+            request_text = self._request_text(paragraphs, changed)
+            options = dict(options, max_tokens=self._budget(role_key, request_text, len(changed), options))
+            result, tokens_used, usage = await self.api.analyze_text(
+                role_key, request_text, instruction=REVISION_INSTRUCTION, **options
+            )
+            if result is None or tokens_used <= 0:
+                # Ошибка API: обрабатывается воркером как обычно
+                return result, tokens_used, usage
+
+            truncated = usage.get('finish_reason') != 'stop'
+            parsed = parse_findings(result)
+            if parsed is None:
+                if truncated:
+                    # Обрезанный ответ без меток - обычный отчет, который тоже не уместился бы
+                    return result, tokens_used, usage
+                logger.warning(f"Ответ роли {role_key} без меток абзацев, выполняется анализ всего текста")
+                return await self._full_analysis(role_key, text, tokens_used, options)
+            if truncated:
+                # Последний абзац ответа мог оборваться на середине замечаний
+                parsed.pop(max(parsed), None)
+
+            cache_usage.update(usage)
+            new_findings = {
+                fingerprints[index]: parsed[index + 1] for index in changed if index + 1 in parsed
+            }
+            if truncated and not new_findings:
+                # Ответ оборвался на первом же абзаце: отдаем его как есть
+                return result, tokens_used, usage
+            missing = len(changed) - len(new_findings)
+            if missing:
+                logger.warning(
+                    f"Ответ роли {role_key} {'обрезан и ' if truncated else ''}не упоминает "
+                    f"{missing} измененных абзацев, они будут проверены снова"
+                )
+            self.db.save_paragraph_findings(user_id, role_key, cache_usage['prompt_version'], new_findings)
+            findings.update(new_findings)
+            if truncated:
+                unchecked = sum(1 for fingerprint in fingerprints if fingerprint not in findings)
+
+        logger.info(
+            f"Повторная проверка ({role_key}): абзацев {len(paragraphs)}, "
+            f"проверено {len(changed)}, без изменений {reused}"
+        )
+        cache_usage['reused_paragraphs'] = reused
+        cache_usage['reused'] = not changed
+        report = self.build_report(paragraphs, fingerprints, findings, reused, unchecked)
+        return report, tokens_used, cache_usage
@@ -1,6 +1,9 @@
 ROLES = {
     "beta_reader": {
         "name": "Бета-ридер",
+        "button": "📖 Бета-ридер",
+        # Сводка локальной статистики текста (textstats.py) добавляется к запросу
+        "textstats": True,
         "prompt": """Ты непредвзятый читатель, который впервые открыл книгу. Твоя задача — проанализировать предоставленный текст с точки зрения обычного читателя и дать честный, конструктивный отзыв. Сосредоточься на следующих аспектах:
 
 1.  **Захватывает ли сюжет?** Оцени, насколько текст увлекает, вызывает ли интерес к дальнейшему чтению. Есть ли моменты, когда хочется отложить книгу или, наоборот, не отрываться?
@@ -27,6 +30,13 @@ ROLES = {
     },
     "proofreader": {
         "name": "Корректор",
+        "button": "✏️ Корректор",
+        # Замечания относятся к отдельным абзацам: при повторной отправке
+        # проверяются только измененные абзацы
+        "incremental": True,
+        # Двойные пробелы, повторы и написание имен проверяются локально
+        # (proofcheck.py), модели остаются грамматика и синтаксис
+        "proofcheck": True,
         "prompt": """Ты профессиональный корректор. Твоя задача — провести тщательную проверку предоставленного текста на предмет всех видов ошибок и неточностей. Сосредоточься на следующем:
 
 1.  **Орфография:** Выяви и исправь все орфографические ошибки, включая опечатки, неправильное написание слов, пропущенные или лишние буквы.
@@ -63,6 +73,9 @@ ROLES = {
     },
     "editor": {
         "name": "Редактор",
+        "button": "📝 Редактор",
+        # Сводка локальной статистики текста (textstats.py) добавляется к запросу
+        "textstats": True,
         "prompt": """Ты профессиональный редактор с многолетним опытом работы с художественными текстами. Твоя задача — провести глубокий анализ предоставленного текста, выявить его сильные и слабые стороны на уровне структуры, стиля, логики и содержания, а также предложить конкретные пути улучшения. Сосредоточься на следующем:
 
 1.  **Структура и композиция:** Оцени логичность построения текста, последовательность изложения, наличие завязки, кульминации, развязки. Есть ли провисания, необоснованные отступления, или, наоборот, слишком резкие переходы? Предложи, как можно улучшить структуру.
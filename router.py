@@ -0,0 +1,145 @@
+"""
+Декларативная маршрутизация сообщений и callback-запросов.
+
+Обработчики регистрируются декораторами: кнопки меню - в словаре своего
+состояния, callback-запросы - по однобайтному коду операции. Выбор обработчика
+сводится к поиску в словаре и не зависит от количества кнопок, ролей и тарифов.
+
+Формат callback_data: первый символ - код операции (заглавная латинская буква),
+остаток строки - аргумент. Так вся кнопка укладывается в лимит Telegram
+в 64 байта. Старые данные кнопок (buy_..., check_..., hist_...) из уже
+отправленных сообщений по-прежнему распознаются.
+"""
+
+import logging
+from typing import Callable, Awaitable, Dict, Tuple, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+# Коды операций callback_data
+OP_BUY = 'B'
+OP_CHECK = 'C'
+OP_CANCEL = 'X'
+OP_HISTORY_PAGE = 'P'
+OP_HISTORY_OPEN = 'O'
+OP_HISTORY_TEXT = 'T'
+OP_REANALYZE = 'R'
+
+# Лимит Telegram на длину callback_data
+CALLBACK_DATA_LIMIT = 64
+
+# Прежний формат callback_data: префикс -> код операции
+LEGACY_PREFIXES = (
+    ('buy_', OP_BUY),
+    ('check_', OP_CHECK),
+    ('hist_page_', OP_HISTORY_PAGE),
+    ('hist_open_', OP_HISTORY_OPEN),
+    ('hist_text_', OP_HISTORY_TEXT),
+)
+LEGACY_EXACT = {'cancel_payment': OP_CANCEL}
+
+MessageHandlerCallback = Callable[[Any, Any], Awaitable[None]]
+CallbackHandlerCallback = Callable[[Any, Any, str], Awaitable[None]]
+
+
+def encode_callback(op: str, argument: Any = '') -> str:
+    """Собрать callback_data из кода операции и аргумента"""
+    data = f"{op}{argument}"
+    if len(data.encode('utf-8')) > CALLBACK_DATA_LIMIT:
+        raise ValueError(f"callback_data длиннее {CALLBACK_DATA_LIMIT} байт: {data}")
+    return data
+
+
+def decode_callback(data: str) -> Tuple[str, str]:
+    """
+    Разобрать callback_data на код операции и аргумент
+
+    Returns:
+        Tuple[str, str]: (код операции, аргумент); для неизвестных данных код пустой
+    """
+    if not data:
+        return '', ''
+    op = data[0]
+    if 'A' <= op <= 'Z':
+        return op, data[1:]
+
+    # Кнопки из сообщений, отправленных до перехода на компактный формат
+    legacy = LEGACY_EXACT.get(data)
+    if legacy:
+        return legacy, ''
+    for prefix, legacy_op in LEGACY_PREFIXES:
+        if data.startswith(prefix):
+            return legacy_op, data[len(prefix):]
+    return '', data
+
+
+class Router:
+    """Таблицы обработчиков: кнопки по состояниям и callback-запросы по кодам операций"""
+
+    def __init__(self):
+        self._buttons: Dict[str, Dict[str, MessageHandlerCallback]] = {}
+        self._fallbacks: Dict[str, MessageHandlerCallback] = {}
+        self._callbacks: Dict[str, CallbackHandlerCallback] = {}
+
+    def button(self, state: str, *texts: str):
+        """Зарегистрировать обработчик кнопок в состоянии"""
+        def decorator(handler: MessageHandlerCallback) -> MessageHandlerCallback:
+            table = self._buttons.setdefault(state, {})
+            for text in texts:
+                if text in table:
+                    raise ValueError(f"Кнопка {text!r} уже зарегистрирована в состоянии {state}")
+                table[text] = handler
+            return handler
+        return decorator
+
+    def fallback(self, state: str):
+        """Зарегистрировать обработчик любого другого текста в состоянии"""
+        def decorator(handler: MessageHandlerCallback) -> MessageHandlerCallback:
+            self._fallbacks[state] = handler
+            return handler
+        return decorator
+
+    def callback(self, *ops: str):
+        """Зарегистрировать обработчик callback-запросов с кодами операций"""
+        def decorator(handler: CallbackHandlerCallback) -> CallbackHandlerCallback:
+            for op in ops:
+                if op in self._callbacks:
+                    raise ValueError(f"Операция {op!r} уже зарегистрирована")
+                self._callbacks[op] = handler
+            return handler
+        return decorator
+
+    def resolve_message(self, state: str, text: str) -> Optional[MessageHandlerCallback]:
+        table = self._buttons.get(state)
+        handler = table.get(text) if table else None
+        return handler or self._fallbacks.get(state)
+
+    async def dispatch_message(self, state: str, update, context) -> bool:
+        """
+        Передать текстовое сообщение обработчику состояния
+
+        Returns:
+            bool: найден ли обработчик
+        """
+        handler = self.resolve_message(state, update.message.text)
+        if handler is None:
+            return False
+        await handler(update, context)
+        return True
+
+    async def dispatch_callback(self, update, context) -> bool:
+        """
+        Ответить на callback-запрос и передать его обработчику операции
+
+        Returns:
+            bool: найден ли обработчик
+        """
+        query = update.callback_query
+        await query.answer()
+        op, argument = decode_callback(query.data)
+        handler = self._callbacks.get(op)
+        if handler is None:
+            logger.warning(f"Неизвестный callback: {query.data!r}")
+            return False
+        await handler(update, context, argument)
+        return True
@@ -0,0 +1,94 @@
+"""
+Выбор модели и параметров генерации по роли и размеру текста.
+
+Политика задается данными (ROUTING в config.py или раздел "routing" каталога):
+
+    {
+      "default": {"model": "deepseek-chat", "temperature": 0.7, "max_tokens": 4000,
+                  "tiers": [{"up_to": 1000, "max_tokens": 1500}, {"max_tokens": 8000}]},
+      "roles": {"proofreader": {"temperature": 0.2}}
+    }
+
+Параметры роли дополняют параметры по умолчанию, ступени tiers (свои у роли
+или общие) выбираются по числу токенов текста: применяется первая ступень,
+у которой up_to не меньше размера текста; ступень без up_to подходит любому.
+Таблицы ступеней собираются при загрузке, выбор - двоичный поиск.
+"""
+
+from bisect import bisect_left
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+ROUTE_FIELDS = ('model', 'max_tokens', 'temperature')
+
+
+class Route(NamedTuple):
+    model: str
+    max_tokens: int
+    temperature: float
+
+
+def _check_fields(where: str, entry: Dict[str, Any]):
+    unknown = set(entry) - set(ROUTE_FIELDS) - {'tiers', 'up_to'}
+    if unknown:
+        raise ValueError(f"{where}: неизвестные поля {sorted(unknown)}")
+    if 'model' in entry and not (isinstance(entry['model'], str) and entry['model']):
+        raise ValueError(f"{where}: model должна быть непустой строкой")
+    if 'max_tokens' in entry and not (isinstance(entry['max_tokens'], int) and entry['max_tokens'] > 0):
+        raise ValueError(f"{where}: max_tokens должно быть положительным целым")
+    if 'up_to' in entry and not (isinstance(entry['up_to'], int) and entry['up_to'] > 0):
+        raise ValueError(f"{where}: up_to должно быть положительным целым")
+    if 'temperature' in entry and not (isinstance(entry['temperature'], (int, float))
+                                       and 0 <= entry['temperature'] <= 2):
+        raise ValueError(f"{where}: temperature должна быть от 0 до 2")
+
+
+class RoutingPolicy:
+    """Разобранная политика: для каждой роли границы ступеней и готовые параметры"""
+
+    def __init__(self, data: Dict[str, Any]):
+        default = dict(data.get('default') or {})
+        _check_fields('default', default)
+        missing = [field for field in ROUTE_FIELDS if field not in default]
+        if missing:
+            raise ValueError(f"default: нет полей {missing}")
+
+        self._default = self._build_table('default', default, {})
+        self._tables = {
+            role_key: self._build_table(f"роль {role_key}", default, dict(entry))
+            for role_key, entry in (data.get('roles') or {}).items()
+        }
+
+    @staticmethod
+    def _build_table(where: str, default: Dict[str, Any],
+                     role: Dict[str, Any]) -> Tuple[List[float], List[Route]]:
+        _check_fields(where, role)
+        base = {field: role.get(field, default[field]) for field in ROUTE_FIELDS}
+        tiers = role.get('tiers', default.get('tiers')) or []
+
+        bounds, routes = [], []
+        for index, tier in enumerate(tiers):
+            _check_fields(f"{where}, ступень {index + 1}", tier)
+            up_to = tier.get('up_to', float('inf'))
+            if bounds and up_to <= bounds[-1]:
+                raise ValueError(f"{where}: up_to ступеней должны возрастать")
+            bounds.append(up_to)
+            routes.append(Route(**{field: tier.get(field, base[field]) for field in ROUTE_FIELDS}))
+        if not bounds or bounds[-1] != float('inf'):
+            # Тексты больше последней ступени получают параметры роли
+            bounds.append(float('inf'))
+            routes.append(Route(**base))
+        return bounds, routes
+
+    def route(self, role_key: str, input_tokens: int) -> Route:
+        """Параметры запроса для роли и размера текста в токенах"""
+        bounds, routes = self._tables.get(role_key, self._default)
+        return routes[bisect_left(bounds, input_tokens)]
+
+    def describe(self, role_key: str) -> str:
+        """Ступени роли одной строкой (для /catalog)"""
+        bounds, routes = self._tables.get(role_key, self._default)
+        parts = []
+        for bound, route in zip(bounds, routes):
+            limit = "дальше" if bound == float('inf') else f"до {bound:,}"
+            parts.append(f"{limit}: {route.model}, {route.max_tokens}, t={route.temperature}")
+        return "; ".join(parts)
@@ -0,0 +1,157 @@
+"""
+Очередь с классами приоритета для анализов.
+
+Задания делятся на классы (администратор, оплатившие, пробные), у каждого
+класса свой вес PRIORITY_WEIGHTS. Класс для следующей выдачи выбирается
+взвешенно-справедливо (stride scheduling): у класса есть "проход", который
+растет на 1/вес при каждой выдаче, и выдается непустой класс с наименьшим
+проходом. При весах 8:4:1 и полной очереди на 8 анализов администратора
+приходится 4 оплаченных и 1 пробный, а свободная доля класса достается
+остальным. Класс, простаивавший пустым, не копит преимущество: его проход
+подтягивается к текущему.
+
+Защита от голодания: элемент, прождавший дольше PRIORITY_MAX_WAIT секунд,
+выдается вне очереди, какой бы класс ни претендовал на место. Время ожидания
+каждого выданного элемента учитывается по классам для /cache_stats.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+from config import PRIORITY_WEIGHTS, PRIORITY_MAX_WAIT
+
+# Замеров ожидания на класс для перцентилей
+_WAIT_SAMPLES = 10000
+
+
+def _percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class FairQueue:
+    """Взвешенно-справедливая очередь по классам со старением ожидающих"""
+
+    def __init__(self, weights: Dict[str, int] = PRIORITY_WEIGHTS, max_wait: float = PRIORITY_MAX_WAIT):
+        if not weights or min(weights.values()) <= 0:
+            raise ValueError("Веса классов должны быть положительными")
+        self.weights = dict(weights)
+        self.max_wait = max_wait
+        # Неизвестный класс считается самым младшим
+        self.fallback = min(self.weights, key=self.weights.get)
+        self.aged = 0
+        self._items = {cls: deque() for cls in self.weights}
+        self._pass = {cls: 0.0 for cls in self.weights}
+        self._virtual = 0.0
+        self._served = {cls: 0 for cls in self.weights}
+        self._waits = {cls: deque(maxlen=_WAIT_SAMPLES) for cls in self.weights}
+        self._getters: deque = deque()
+        self._unfinished = 0
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+    def __len__(self) -> int:
+        return sum(len(items) for items in self._items.values())
+
+    def _class(self, cls: Optional[str]) -> str:
+        return cls if cls in self._items else self.fallback
+
+    def push(self, item: Any, cls: Optional[str] = None):
+        """Поставить элемент в очередь класса"""
+        cls = self._class(cls)
+        if not self._items[cls]:
+            self._pass[cls] = max(self._pass[cls], self._virtual)
+        self._items[cls].append((item, time.monotonic()))
+        self._unfinished += 1
+        self._finished.clear()
+        self._wake_getter()
+
+    def pop(self) -> Tuple[Any, str]:
+        """
+        Выдать следующий элемент
+
+        Returns:
+            Tuple[Any, str]: (элемент, класс)
+
+        Raises:
+            IndexError: очередь пуста
+        """
+        now = time.monotonic()
+        waiting = [cls for cls, items in self._items.items() if items]
+        if not waiting:
+            raise IndexError("Очередь пуста")
+
+        overdue = [cls for cls in waiting if now - self._items[cls][0][1] >= self.max_wait]
+        if overdue:
+            cls = min(overdue, key=lambda c: self._items[c][0][1])
+            self.aged += 1
+        else:
+            cls = min(waiting, key=lambda c: (self._pass[c], -self.weights[c]))
+        self._virtual = max(self._virtual, self._pass[cls])
+        self._pass[cls] += 1 / self.weights[cls]
+
+        item, enqueued = self._items[cls].popleft()
+        self._served[cls] += 1
+        self._waits[cls].append(now - enqueued)
+        return item, cls
+
+    def remove(self, item: Any, cls: Optional[str] = None) -> bool:
+        """Убрать элемент, так и не выданный (например, отмененное ожидание)"""
+        items = self._items[self._class(cls)]
+        for entry in items:
+            if entry[0] is item:
+                items.remove(entry)
+                self.task_done()
+                return True
+        return False
+
+    async def get(self) -> Tuple[Any, str]:
+        """Дождаться и выдать следующий элемент (как asyncio.Queue.get)"""
+        while not len(self):
+            getter = asyncio.get_running_loop().create_future()
+            self._getters.append(getter)
+            try:
+                await getter
+            except asyncio.CancelledError:
+                if getter.done() and not getter.cancelled() and len(self):
+                    # Элемент достался этому ожидающему: будим следующего
+                    self._wake_getter()
+                elif not getter.done():
+                    self._getters.remove(getter)
+                raise
+        return self.pop()
+
+    def _wake_getter(self):
+        while self._getters:
+            getter = self._getters.popleft()
+            if not getter.done():
+                getter.set_result(None)
+                return
+
+    def task_done(self):
+        """Отметить выданный элемент обработанным (для join)"""
+        self._unfinished -= 1
+        if self._unfinished <= 0:
+            self._unfinished = 0
+            self._finished.set()
+
+    async def join(self):
+        """Дождаться обработки всех поставленных элементов"""
+        await self._finished.wait()
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """По классам: в очереди, выдано, ожидание p50/p95/максимум за последние выдачи, секунды"""
+        return {
+            cls: {
+                'queued': len(self._items[cls]),
+                'served': self._served[cls],
+                'wait_p50': _percentile(self._waits[cls], 0.5),
+                'wait_p95': _percentile(self._waits[cls], 0.95),
+                'wait_max': max(self._waits[cls], default=0.0),
+            }
+            for cls in self.weights
+        }
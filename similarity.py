@@ -0,0 +1,90 @@
+"""
+Поиск почти одинаковых текстов: MinHash-сигнатуры и LSH-корзины.
+
+Текст разбивается на шинглы из SHINGLE_SIZE слов, по ним считается сигнатура из
+NUM_PERMUTATIONS минимальных хешей (доля совпадающих позиций двух сигнатур
+оценивает коэффициент Жаккара множеств шинглов). Сигнатура делится на LSH_BANDS
+полос, хеш каждой полосы - номер корзины. Тексты, совпавшие хотя бы в одной
+корзине, считаются кандидатами, и только для них сравниваются сигнатуры целиком.
+Поэтому исправленная опечатка, лишние пробелы или переставленный абзац не мешают
+найти прошлую отправку, а поиск не перебирает все анализы пользователя.
+"""
+
+import hashlib
+import re
+import zlib
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+SHINGLE_SIZE = 3
+
+# Хеш-функции вида (a * x + b) mod P; P - наибольшее простое меньше 2^32,
+# поэтому произведение помещается в uint64, а сигнатура - в uint32
+_PRIME = np.uint64(4294967291)
+_rng = np.random.default_rng(20240229)
+_A = _rng.integers(1, 2 ** 32 - 5, NUM_PERMUTATIONS, dtype=np.uint64)[:, None]
+_B = _rng.integers(0, 2 ** 32 - 5, NUM_PERMUTATIONS, dtype=np.uint64)[:, None]
+# Множители для объединения хешей соседних слов в хеш шингла
+_SHINGLE_MULTIPLIERS = np.array([0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D][:SHINGLE_SIZE], dtype=np.uint64)
+
+# Шинглов за один шаг вычисления минимумов (ограничивает память на длинных текстах)
+_CHUNK = 4096
+
+_WORD = re.compile(r'\w+')
+
+
+def shingle_hashes(text: str) -> np.ndarray:
+    """Уникальные хеши шинглов текста (регистр, пунктуация и пробелы не учитываются)"""
+    words = _WORD.findall(text.lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    word_hashes = np.fromiter(
+        (zlib.crc32(word.encode('utf-8')) for word in words), dtype=np.uint64, count=len(words)
+    )
+    if len(word_hashes) < SHINGLE_SIZE:
+        return np.unique(word_hashes)
+
+    count = len(word_hashes) - SHINGLE_SIZE + 1
+    combined = np.zeros(count, dtype=np.uint64)
+    for offset, multiplier in enumerate(_SHINGLE_MULTIPLIERS):
+        # Переполнение uint64 здесь допустимо: нужен только разброс значений
+        combined = combined * multiplier + word_hashes[offset:offset + count]
+    return np.unique(combined % _PRIME)
+
+
+def signature(text: str) -> Optional[bytes]:
+    """MinHash-сигнатура текста (NUM_PERMUTATIONS значений uint32) или None для пустого текста"""
+    shingles = shingle_hashes(text)
+    if not len(shingles):
+        return None
+
+    minimums = np.full(NUM_PERMUTATIONS, _PRIME, dtype=np.uint64)
+    for start in range(0, len(shingles), _CHUNK):
+        chunk = shingles[None, start:start + _CHUNK]
+        hashed = (_A * chunk % _PRIME + _B) % _PRIME
+        np.minimum(minimums, hashed.min(axis=1), out=minimums)
+    return minimums.astype(np.uint32).tobytes()
+
+
+def lsh_buckets(sig: bytes) -> List[Tuple[int, int]]:
+    """Корзины LSH сигнатуры: [(номер полосы, хеш полосы)]"""
+    band_size = LSH_ROWS * 4
+    buckets = []
+    for band in range(LSH_BANDS):
+        digest = hashlib.blake2b(sig[band * band_size:(band + 1) * band_size], digest_size=8).digest()
+        # Знаковое 64-битное число помещается в INTEGER SQLite
+        buckets.append((band, int.from_bytes(digest, 'big', signed=True)))
+    return buckets
+
+
+def similarity(first: bytes, second: bytes) -> float:
+    """Оценка коэффициента Жаккара по двум сигнатурам"""
+    a = np.frombuffer(first, dtype=np.uint32)
+    b = np.frombuffer(second, dtype=np.uint32)
+    if a.shape != b.shape:
+        return 0.0
+    return float(np.count_nonzero(a == b)) / len(a)
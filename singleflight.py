@@ -0,0 +1,91 @@
+"""
+Объединение одинаковых запросов, выполняющихся одновременно (singleflight).
+
+Первый запрос с ключом запускает вызов в отдельной задаче, остальные запросы
+с тем же ключом, пришедшие до его завершения, ждут тот же результат. Задача
+не привязана к запросу, который ее запустил: если он отменен, вызов
+продолжается для остальных и отменяется только после ухода последнего.
+"""
+
+import asyncio
+import hashlib
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+def content_key(*parts: str) -> str:
+    """Ключ по содержимому: хеш частей, разделенных нулевым символом"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class _Call:
+    """Выполняющийся вызов и число ожидающих его запросов"""
+
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Реестр выполняющихся вызовов по ключу"""
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self.started = 0
+        self.joined = 0
+        self.cancelled = 0
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._calls
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Выполнить factory() или дождаться уже выполняющегося вызова с тем же ключом
+
+        Returns:
+            Any: результат вызова (общий для всех ожидающих)
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.started += 1
+        else:
+            self.joined += 1
+
+        call.waiters += 1
+        try:
+            # shield: отмена одного ожидающего не отменяет общий вызов
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Результат больше никому не нужен
+                self.cancelled += 1
+                self._forget(key, call)
+                call.task.cancel()
+                logger.info(f"Вызов {key[:12]} отменен: не осталось ожидающих")
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            'in_flight': len(self._calls),
+            'started': self.started,
+            'joined': self.joined,
+            'cancelled': self.cancelled,
+        }
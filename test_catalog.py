@@ -0,0 +1,43 @@
+"""Тесты текстов каталога"""
+
+import pytest
+
+from catalog import CatalogSnapshot, credits_text, join_names
+from config import MESSAGES, TARIFFS
+from roles import ROLES
+
+
+@pytest.mark.parametrize('count, expected', [
+    (1, '1 кредит'), (2, '2 кредита'), (4, '4 кредита'), (5, '5 кредитов'),
+    (11, '11 кредитов'), (12, '12 кредитов'), (14, '14 кредитов'),
+    (21, '21 кредит'), (22, '22 кредита'), (0, '0 кредитов'), (111, '111 кредитов'),
+])
+def test_credits_plural(count, expected):
+    assert credits_text(count) == expected
+
+
+def test_join_names():
+    assert join_names([]) == ''
+    assert join_names(['Корректор']) == 'Корректор'
+    assert join_names(['Корректор', 'Редактор']) == 'Корректор и Редактор'
+    assert join_names(['А', 'Б', 'В']) == 'А, Б и В'
+
+
+def test_multi_role_text_follows_catalog_roles():
+    roles = {key: ROLES[key] for key in list(ROLES)[:2]}
+    snapshot = CatalogSnapshot(roles, TARIFFS, dict(MESSAGES), source='test')
+
+    text = snapshot.text(
+        'multi_role_selected', roles=snapshot.role_names, cost=2, cost_text=credits_text(2), max_length=1000
+    )
+
+    names = [role['name'] for role in roles.values()]
+    assert f"{names[0]} и {names[1]}" in text
+    assert "2 кредита" in text
+
+
+def test_legacy_cost_field_still_accepted():
+    messages = dict(MESSAGES, multi_no_credits="Нужно {cost} кредита, у вас {credits}")
+    snapshot = CatalogSnapshot(ROLES, TARIFFS, messages, source='test')
+
+    assert snapshot.text('multi_no_credits', cost=3, cost_text='3 кредита', credits=1) == "Нужно 3 кредита, у вас 1"
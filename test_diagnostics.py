@@ -0,0 +1,25 @@
+"""Тесты профилировщика обработчиков"""
+
+import asyncio
+
+from diagnostics import HandlerProfiler
+
+
+def test_handler_timings_are_bounded():
+    profiler = HandlerProfiler(threshold_ms=10000, max_samples=5)
+
+    async def handler(update, context):
+        return update
+
+    wrapped = profiler.wrap(handler, 'handler')
+
+    async def scenario():
+        for index in range(12):
+            assert await wrapped(index, None) == index
+
+    asyncio.run(scenario())
+
+    assert len(profiler.timings['handler']) == 5
+    summary = profiler.summary()['handler']
+    assert summary['count'] == 12
+    assert summary['max_ms'] >= summary['p95_ms']
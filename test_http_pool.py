@@ -0,0 +1,46 @@
+"""Тесты общего пула HTTP-соединений"""
+
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpcore
+import httpx
+
+from http_pool import CachingBackend, CachingTransport, HostStats
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_transport_reuses_connection_and_caches_dns():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stats = HostStats()
+    backend = CachingBackend(httpcore.AnyIOBackend(), ttl=60, stats=stats)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=CachingTransport(backend)) as client:
+            for _ in range(3):
+                response = await client.get(f"http://localhost:{server.server_port}/")
+                assert response.text == "ok"
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert backend.lookups == 1
+    assert stats.connections['localhost'] == 1
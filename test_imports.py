@@ -68,6 +68,60 @@ def test_imports():
         from payment import PaymentManager
         print("✅ payment - OK")
         
+        from loadtest import FakeDeepSeekServer, FakeTelegramServer
+        print("✅ loadtest - OK")
+        
+        from diagnostics import LoopLagMonitor, HandlerProfiler
+        print("✅ diagnostics - OK")
+        
+        from extractors import extract_text
+        print("✅ extractors - OK")
+        
+        from text_buffer import TextAccumulator
+        print("✅ text_buffer - OK")
+        
+        from jobs import AnalysisWorker
+        print("✅ jobs - OK")
+        
+        from archive import Archiver
+        print("✅ archive - OK")
+        
+        from catalog import catalog
+        print("✅ catalog - OK")
+        
+        from router import Router
+        print("✅ router - OK")
+        
+        from singleflight import SingleFlight
+        print("✅ singleflight - OK")
+        
+        from revisions import RevisionAnalyzer
+        print("✅ revisions - OK")
+        
+        from similarity import signature
+        print("✅ similarity - OK")
+        
+        from proofcheck import check
+        print("✅ proofcheck - OK")
+        
+        from textstats import compute
+        print("✅ textstats - OK")
+        
+        from routing import RoutingPolicy
+        print("✅ routing - OK")
+        
+        from endpoints import EndpointPool
+        print("✅ endpoints - OK")
+        
+        from limiter import AdaptiveLimiter
+        print("✅ limiter - OK")
+        
+        from scheduling import FairQueue
+        print("✅ scheduling - OK")
+        
+        from http_pool import HostStats
+        print("✅ http_pool - OK")
+        
         print("\n✅ Все импорты успешны!")
         return True
         
@@ -0,0 +1,72 @@
+"""Тесты фонового выполнения анализов"""
+
+import asyncio
+import sqlite3
+from types import SimpleNamespace
+
+from database import Database
+from deepseek_api import DeepSeekAPI
+from jobs import AnalysisWorker
+
+TEXT = "Одинаковый текст, присланный двумя пользователями одновременно."
+
+
+def _response(content: str):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason='stop')],
+        usage=SimpleNamespace(prompt_cache_hit_tokens=0, prompt_cache_miss_tokens=100, completion_tokens=20),
+    )
+
+
+def test_coalesced_requests_are_charged_once(tmp_path):
+    db = Database(str(tmp_path / "bot.db"))
+    api = DeepSeekAPI()
+    upstream_calls = []
+
+    async def fake_send(messages, route):
+        upstream_calls.append(messages)
+        # Второй запрос успевает присоединиться к первому
+        await asyncio.sleep(0.05)
+        return _response("Отчет")
+
+    api._send = fake_send
+    delivered = []
+
+    async def analyze(job):
+        return await api.analyze_text(job['role'], job['text'], text_tokens=job['text_tokens'])
+
+    async def deliver(job):
+        delivered.append(job)
+
+    async def scenario():
+        worker = AnalysisWorker(db, analyze, deliver, concurrency=2)
+        await worker.start()
+        try:
+            for user_id in (1, 2):
+                db.create_user(user_id)
+                worker.submit(db.enqueue_analysis_jobs(user_id, user_id, ['proofreader'], TEXT, 20))
+            await worker.join()
+        finally:
+            await worker.stop()
+
+    asyncio.run(scenario())
+
+    assert len(upstream_calls) == 1
+    assert sorted(job['result'] for job in delivered) == ["Отчет", "Отчет"]
+    with sqlite3.connect(db.db_path) as conn:
+        charged = [row[0] for row in conn.execute("SELECT tokens_used FROM analyses ORDER BY id")]
+    assert len(charged) == 2
+    assert sum(1 for tokens in charged if tokens > 0) == 1
+
+
+def test_group_notification_claimed_once(tmp_path):
+    path = str(tmp_path / "bot.db")
+    db = Database(path)
+    db.create_user(1)
+    db.add_credits(1, 1)
+    assert db.enqueue_analysis_jobs(1, 1, ['proofreader', 'editor'], TEXT, 20, group_id='group-1')
+
+    # Оба задания группы доставляются (одновременно или повторно после перезапуска)
+    assert db.claim_group_notification('group-1') is True
+    assert db.claim_group_notification('group-1') is False
+    assert Database(path).claim_group_notification('group-1') is False
@@ -0,0 +1,110 @@
+"""Тесты адаптивного лимита запросов (AIMD)"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import limiter
+from limiter import AdaptiveLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=0.0)
+    monkeypatch.setattr(limiter, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def _acquire(adaptive: AdaptiveLimiter) -> float:
+    return asyncio.run(adaptive.acquire())
+
+
+def test_additive_increase_when_saturated(clock):
+    adaptive = AdaptiveLimiter(initial=2, min_limit=1, max_limit=4)
+    first, second = _acquire(adaptive), _acquire(adaptive)
+    clock.now = 1.0
+
+    adaptive.release(first, output_tokens=10)
+
+    assert adaptive.limit == pytest.approx(2.5)
+    assert adaptive.increases == 1
+    adaptive.release(second, output_tokens=10)
+    # Второй запрос уже не упирался в лимит
+    assert adaptive.limit == pytest.approx(2.5)
+
+
+def test_no_increase_below_limit(clock):
+    adaptive = AdaptiveLimiter(initial=4, min_limit=1, max_limit=8)
+    started = _acquire(adaptive)
+    clock.now = 1.0
+
+    adaptive.release(started, output_tokens=10)
+
+    assert adaptive.limit == 4
+    assert adaptive.increases == 0
+
+
+def test_increase_capped_by_max_limit(clock):
+    adaptive = AdaptiveLimiter(initial=2, min_limit=1, max_limit=2)
+    started = [_acquire(adaptive), _acquire(adaptive)]
+
+    adaptive.release(started[0], output_tokens=10)
+
+    assert adaptive.limit == 2
+
+
+def test_overload_decreases_once_per_wave(clock):
+    adaptive = AdaptiveLimiter(initial=8, min_limit=1, max_limit=16)
+    clock.now = 1.0
+    first, second = _acquire(adaptive), _acquire(adaptive)
+    clock.now = 2.0
+
+    adaptive.release(first, overloaded=True)
+    # Запрос той же волны начат до снижения и не снижает лимит повторно
+    adaptive.release(second, overloaded=True)
+    assert adaptive.limit == 4
+    assert adaptive.decreases == 1
+
+    clock.now = 3.0
+    adaptive.release(_acquire(adaptive), overloaded=True)
+    assert adaptive.limit == 2
+
+
+def test_decrease_bounded_by_min_limit(clock):
+    adaptive = AdaptiveLimiter(initial=2, min_limit=2, max_limit=8)
+    clock.now = 1.0
+
+    adaptive.release(_acquire(adaptive), overloaded=True)
+
+    assert adaptive.limit == 2
+
+
+def test_latency_spike_decreases_after_warmup(clock):
+    adaptive = AdaptiveLimiter(initial=8, min_limit=1, max_limit=16, tolerance=2.0)
+    for _ in range(limiter._WARMUP_SAMPLES):
+        started = _acquire(adaptive)
+        clock.now += 10.0
+        adaptive.release(started, output_tokens=10)
+    assert adaptive.decreases == 0
+
+    started = _acquire(adaptive)
+    clock.now += 50.0
+    adaptive.release(started, output_tokens=10)
+
+    assert adaptive.limit == 4
+    assert adaptive.decreases == 1
+
+
+def test_single_slow_response_during_warmup_ignored(clock):
+    adaptive = AdaptiveLimiter(initial=8, min_limit=1, max_limit=16, tolerance=2.0)
+    started = _acquire(adaptive)
+    clock.now += 10.0
+    adaptive.release(started, output_tokens=10)
+
+    started = _acquire(adaptive)
+    clock.now += 100.0
+    adaptive.release(started, output_tokens=10)
+
+    assert adaptive.limit == 8
+    assert adaptive.decreases == 0
@@ -0,0 +1,47 @@
+"""Тесты завершения платежей: повторные операции и параллельные проверки"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from database import (
+    Database, PAYMENT_COMPLETED, PAYMENT_ALREADY_COMPLETED, PAYMENT_DUPLICATE_OPERATION
+)
+
+
+def _database(tmp_path) -> Database:
+    db = Database(str(tmp_path / "bot.db"))
+    db.create_user(1)
+    return db
+
+
+def test_duplicate_operation_is_credited_once(tmp_path):
+    db = _database(tmp_path)
+    db.create_payment(1, 'label-1', 100, 10)
+    db.create_payment(1, 'label-2', 100, 10)
+
+    outcomes = db.complete_payments([('label-1', 'operation-1'), ('label-2', 'operation-1')])
+
+    assert outcomes['label-1']['status'] == PAYMENT_COMPLETED
+    assert outcomes['label-2']['status'] == PAYMENT_DUPLICATE_OPERATION
+    assert db.get_user_credits(1) == 1 + 10
+    assert db.complete_payment('label-2', 'operation-1') is None
+    assert db.get_user_credits(1) == 1 + 10
+
+
+def test_concurrent_completion_is_idempotent(tmp_path):
+    db = _database(tmp_path)
+    db.create_payment(1, 'label-1', 100, 10)
+    workers = 8
+    barrier = threading.Barrier(workers)
+
+    def complete():
+        # Повторные нажатия «Проверить оплату» и сверка в фоне приходят одновременно
+        barrier.wait()
+        return db.complete_payments([('label-1', 'operation-1')])['label-1']['status']
+
+    with ThreadPoolExecutor(workers) as executor:
+        statuses = list(executor.map(lambda _: complete(), range(workers)))
+
+    assert statuses.count(PAYMENT_COMPLETED) == 1
+    assert statuses.count(PAYMENT_ALREADY_COMPLETED) == workers - 1
+    assert db.get_user_credits(1) == 1 + 10
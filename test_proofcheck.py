@@ -0,0 +1,33 @@
+"""Тесты локальной проверки: разное написание имен"""
+
+import random
+import tracemalloc
+
+from proofcheck import check
+
+
+def _names(findings):
+    return [(finding.fragment, finding.suggestion) for finding in findings if finding.kind == 'names']
+
+
+def test_rare_spelling_of_name_reported():
+    text = "Пришел Парамонов.\nи Парамонов, и Парамонову ответили.\nпотом Параманов ушел."
+
+    assert _names(check(text)) == [("Параманов (1)", "Парамонов (3)")]
+
+
+def test_many_distinct_names_use_bounded_memory():
+    random.seed(1)
+    letters = 'абвгдежзиклмнопрстуфхцчшэюя'
+    words = {''.join(random.choice(letters) for _ in range(random.randint(4, 9))).capitalize() for _ in range(8000)}
+    text = " ".join(f"и {word}" for word in words)
+
+    tracemalloc.start()
+    try:
+        check(text)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    # Попарное сравнение всех основ занимало сотни мегабайт
+    assert peak < 50 * 1024 * 1024
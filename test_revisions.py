@@ -0,0 +1,136 @@
+"""Тесты повторной проверки: разбор меток абзацев и сохранение замечаний"""
+
+import asyncio
+
+from catalog import catalog
+from config import REVISION_TOKENS_PER_PARAGRAPH
+from revisions import RevisionAnalyzer, paragraph_fingerprint, parse_findings
+
+ROLE = 'proofreader'
+
+
+def test_parse_findings_by_marker():
+    result = "[§1]\nОпечатка в слове «карова».\n\n[§3]\nЗапятая перед «что»."
+    assert parse_findings(result) == {1: "Опечатка в слове «карова».", 3: "Запятая перед «что»."}
+
+
+def test_parse_findings_without_markers():
+    assert parse_findings("Ошибок не найдено.") is None
+
+
+def test_parse_findings_missing_markers_not_reported():
+    findings = parse_findings("[§2]\nЛишний пробел.")
+    assert 1 not in findings
+    assert 3 not in findings
+    assert findings == {2: "Лишний пробел."}
+
+
+def test_parse_findings_out_of_order_and_repeated():
+    result = "[§4]\nПовтор слова.\n[§2] Ошибок нет.\n[§4]\nТире вместо дефиса."
+    assert parse_findings(result) == {4: "Повтор слова.\nТире вместо дефиса.", 2: ""}
+
+
+def test_parse_findings_markdown_and_context_mark():
+    result = "**[§1]** (контекст) Замечание.\n### [§2]: **Ошибок нет**"
+    assert parse_findings(result) == {1: "Замечание.", 2: ""}
+
+
+class FakeDatabase:
+    def __init__(self, stored=None):
+        self.stored = dict(stored or {})
+        self.saved = []
+
+    def get_paragraph_findings(self, user_id, role_key, prompt_version, fingerprints):
+        return {key: value for key, value in self.stored.items() if key in fingerprints}
+
+    def save_paragraph_findings(self, user_id, role_key, prompt_version, findings):
+        self.saved.append(dict(findings))
+
+
+class FakeAPI:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def count_tokens(self, text):
+        return len(text) // 4
+
+    async def analyze_text(self, role_key, text, **options):
+        self.calls.append((text, options))
+        return self.responses.pop(0)
+
+
+def _usage(finish_reason='stop'):
+    return {'prompt_cache_hit_tokens': 0, 'prompt_cache_miss_tokens': 0,
+            'prompt_version': catalog.current().prompt_versions[ROLE], 'finish_reason': finish_reason}
+
+
+def test_only_mentioned_paragraphs_are_saved():
+    text = "Первый абзац.\nВторой абзац.\nТретий абзац."
+    db = FakeDatabase()
+    api = FakeAPI(("[§1]\nОпечатка.\n[§3] Ошибок нет", 100, _usage()))
+    analyzer = RevisionAnalyzer(db, api)
+
+    report, tokens, usage = asyncio.run(analyzer.analyze(1, ROLE, text))
+
+    assert tokens == 100
+    assert db.saved == [{
+        paragraph_fingerprint("Первый абзац."): "Опечатка.",
+        paragraph_fingerprint("Третий абзац."): "",
+    }]
+    assert "Опечатка." in report
+
+
+def test_first_truncated_reply_keeps_parsed_paragraphs():
+    text = "Первый абзац.\nВторой абзац.\nТретий абзац."
+    db = FakeDatabase()
+    api = FakeAPI(("[§1]\nОпечатка.\n[§2]\nЗапя", 100, _usage('length')))
+    analyzer = RevisionAnalyzer(db, api)
+
+    report, tokens, _ = asyncio.run(analyzer.analyze(1, ROLE, text))
+
+    # Весь текст повторно не отправляется: токены оплачены один раз
+    assert len(api.calls) == 1
+    assert tokens == 100
+    # Оборванный последний абзац не сохраняется и будет проверен при следующей отправке
+    assert db.saved == [{paragraph_fingerprint("Первый абзац."): "Опечатка."}]
+    assert "Опечатка." in report
+    assert "проверено абзацев 1 из 3" in report
+
+
+def test_labelled_request_budget_grows_with_paragraphs():
+    paragraphs = [f"Абзац номер {index}." for index in range(100)]
+    api = FakeAPI(("[§1] Ошибок нет", 100, _usage()))
+    analyzer = RevisionAnalyzer(FakeDatabase(), api)
+
+    asyncio.run(analyzer.analyze(1, ROLE, "\n".join(paragraphs), max_tokens=1000))
+
+    assert api.calls[0][1]['max_tokens'] == 1000 + REVISION_TOKENS_PER_PARAGRAPH * 100
+
+
+def test_truncated_reply_without_markers_is_returned_as_is():
+    api = FakeAPI(("Обычный отчет без меток, оборванный на полусл", 100, _usage('length')))
+    analyzer = RevisionAnalyzer(FakeDatabase(), api)
+
+    report, tokens, _ = asyncio.run(analyzer.analyze(1, ROLE, "Первый абзац.\nВторой абзац."))
+
+    assert len(api.calls) == 1
+    assert report.startswith("Обычный отчет")
+    assert tokens == 100
+
+
+def test_reply_without_markers_falls_back_to_full_analysis():
+    text = "Первый абзац.\nВторой абзац."
+    db = FakeDatabase()
+    api = FakeAPI(
+        ("Замечания без меток", 100, _usage()),
+        ("Полный отчет", 150, _usage()),
+    )
+    analyzer = RevisionAnalyzer(db, api)
+
+    report, tokens, _ = asyncio.run(analyzer.analyze(1, ROLE, text))
+
+    assert report == "Полный отчет"
+    assert tokens == 250
+    assert db.saved == []
+    assert api.calls[1][0] == text
@@ -0,0 +1,80 @@
+"""Тесты формата callback_data и маршрутизации"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from router import (
+    Router, encode_callback, decode_callback, CALLBACK_DATA_LIMIT,
+    OP_BUY, OP_CHECK, OP_CANCEL, OP_HISTORY_PAGE, OP_HISTORY_OPEN, OP_HISTORY_TEXT, OP_REANALYZE
+)
+
+
+@pytest.mark.parametrize('op, argument', [
+    (OP_BUY, 'pro'),
+    (OP_CHECK, '5f1c2e9a-7b3d-4c11-9a8e-1234567890ab'),
+    (OP_CANCEL, ''),
+    (OP_HISTORY_PAGE, 0),
+    (OP_HISTORY_OPEN, 12345),
+    (OP_HISTORY_TEXT, 'тариф_базовый'),
+    (OP_REANALYZE, '42:proofreader'),
+])
+def test_round_trip(op, argument):
+    assert decode_callback(encode_callback(op, argument)) == (op, str(argument))
+
+
+def test_encode_rejects_data_over_telegram_limit():
+    # Кириллица занимает два байта: лимит считается в байтах, а не в символах
+    argument = 'я' * (CALLBACK_DATA_LIMIT // 2)
+    with pytest.raises(ValueError):
+        encode_callback(OP_BUY, argument)
+    assert len(encode_callback(OP_BUY, argument[:-1]).encode('utf-8')) <= CALLBACK_DATA_LIMIT
+
+
+@pytest.mark.parametrize('data, expected', [
+    ('buy_pro', (OP_BUY, 'pro')),
+    ('check_abc', (OP_CHECK, 'abc')),
+    ('cancel_payment', (OP_CANCEL, '')),
+    ('hist_page_2', (OP_HISTORY_PAGE, '2')),
+    ('hist_open_17', (OP_HISTORY_OPEN, '17')),
+    ('hist_text_17', (OP_HISTORY_TEXT, '17')),
+])
+def test_legacy_data(data, expected):
+    assert decode_callback(data) == expected
+
+
+def test_unknown_data():
+    assert decode_callback('') == ('', '')
+    assert decode_callback('something_else') == ('', 'something_else')
+
+
+def test_dispatch_callback_passes_argument():
+    router = Router()
+    calls = []
+
+    @router.callback(OP_HISTORY_OPEN)
+    async def open_analysis(update, context, argument):
+        calls.append(argument)
+
+    async def answer():
+        pass
+
+    def update(data):
+        return SimpleNamespace(callback_query=SimpleNamespace(data=data, answer=answer))
+
+    assert asyncio.run(router.dispatch_callback(update(encode_callback(OP_HISTORY_OPEN, 7)), None))
+    assert asyncio.run(router.dispatch_callback(update('hist_open_8'), None))
+    assert not asyncio.run(router.dispatch_callback(update(encode_callback(OP_BUY, 'pro')), None))
+    assert calls == ['7', '8']
+
+
+def test_duplicate_registration_rejected():
+    router = Router()
+
+    @router.callback(OP_BUY)
+    async def buy(update, context, argument):
+        pass
+
+    with pytest.raises(ValueError):
+        router.callback(OP_BUY)(buy)
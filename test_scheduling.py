@@ -0,0 +1,119 @@
+"""Тесты взвешенно-справедливой очереди по классам приоритета"""
+
+import asyncio
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+
+import scheduling
+from scheduling import FairQueue
+
+WEIGHTS = {'admin': 4, 'paid': 2, 'free': 1}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=0.0)
+    monkeypatch.setattr(scheduling, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def _fill(queue: FairQueue, cls: str, count: int):
+    for index in range(count):
+        queue.push(f"{cls}-{index}", cls)
+
+
+def _pop_classes(queue: FairQueue, count: int):
+    return [queue.pop()[1] for _ in range(count)]
+
+
+def test_stride_order_follows_weights(clock):
+    queue = FairQueue(WEIGHTS, max_wait=1000)
+    for cls in WEIGHTS:
+        _fill(queue, cls, 20)
+
+    served = Counter(_pop_classes(queue, 14))
+
+    assert served == {'admin': 8, 'paid': 4, 'free': 2}
+
+
+def test_items_within_class_are_fifo(clock):
+    queue = FairQueue(WEIGHTS, max_wait=1000)
+    _fill(queue, 'paid', 3)
+
+    assert [queue.pop()[0] for _ in range(3)] == ['paid-0', 'paid-1', 'paid-2']
+
+
+def test_idle_class_does_not_accumulate_advantage(clock):
+    queue = FairQueue(WEIGHTS, max_wait=1000)
+    _fill(queue, 'free', 20)
+    _pop_classes(queue, 10)
+
+    # Класс, простаивавший пустым, получает свою долю, а не все места подряд
+    _fill(queue, 'admin', 20)
+    served = Counter(_pop_classes(queue, 6))
+
+    # Без подтягивания прохода администратор занял бы 40 выдач подряд
+    assert served == {'admin': 5, 'free': 1}
+
+
+def test_overdue_item_served_first(clock):
+    queue = FairQueue(WEIGHTS, max_wait=60)
+    queue.push('free-0', 'free')
+    clock.now = 30.0
+    _fill(queue, 'admin', 10)
+
+    assert queue.pop() == ('admin-0', 'admin')
+    clock.now = 60.0
+    assert queue.pop() == ('free-0', 'free')
+    assert queue.aged == 1
+    assert queue.get_stats()['free']['wait_max'] == 60.0
+
+
+def test_aging_bounds_wait_under_constant_load(clock):
+    queue = FairQueue({'admin': 100, 'free': 1}, max_wait=10)
+    _fill(queue, 'free', 3)
+    waits = []
+    for step in range(300):
+        clock.now = float(step)
+        queue.push(f"admin-{step}", 'admin')
+        item, cls = queue.pop()
+        if cls == 'free':
+            waits.append(clock.now)
+
+    # По весам следующий пробный элемент вышел бы только после 100 элементов администратора,
+    # со старением - как только прождал max_wait
+    assert waits == [1.0, 10.0, 11.0]
+    assert queue.aged == 2
+
+
+def test_unknown_class_falls_back_to_lowest_weight(clock):
+    queue = FairQueue(WEIGHTS)
+    queue.push('item', 'unknown')
+
+    assert queue.pop() == ('item', 'free')
+
+
+def test_pop_empty_raises(clock):
+    with pytest.raises(IndexError):
+        FairQueue(WEIGHTS).pop()
+
+
+def test_remove_and_join(clock):
+    async def scenario():
+        queue = FairQueue(WEIGHTS)
+        queue.push('kept', 'paid')
+        queue.push('removed', 'paid')
+        assert queue.remove('removed', 'paid')
+        assert await queue.get() == ('kept', 'paid')
+        queue.task_done()
+        await asyncio.wait_for(queue.join(), 1)
+        assert len(queue) == 0
+
+    asyncio.run(scenario())
+
+
+def test_invalid_weights():
+    with pytest.raises(ValueError):
+        FairQueue({'admin': 1, 'free': 0})
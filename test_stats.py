@@ -0,0 +1,35 @@
+"""Тесты дневных сводок статистики"""
+
+import sqlite3
+
+from database import Database
+
+
+def test_cache_stats_from_daily_rollup(tmp_path):
+    db = Database(str(tmp_path / "bot.db"))
+    db.create_user(1)
+    db.save_analysis(1, 'proofreader', 1000, 500, cache_hit_tokens=300, cache_miss_tokens=100)
+    db.save_analysis(1, 'proofreader', 1000, 500, cache_hit_tokens=100, cache_miss_tokens=300)
+    db.save_analysis(1, 'editor', 1000, 500, cache_miss_tokens=200)
+
+    stats = {item['role']: item for item in db.get_cache_stats()}
+
+    assert stats['proofreader']['analyses'] == 2
+    assert stats['proofreader']['hit_ratio'] == 0.5
+    assert stats['editor']['hit_tokens'] == 0
+    assert stats['editor']['miss_tokens'] == 200
+
+
+def test_cache_columns_backfilled_on_migration(tmp_path):
+    path = str(tmp_path / "bot.db")
+    db = Database(path)
+    db.create_user(1)
+    db.save_analysis(1, 'proofreader', 1000, 500, cache_hit_tokens=300, cache_miss_tokens=100)
+    with sqlite3.connect(path) as conn:
+        # Сводка в схеме до появления колонок кэша
+        conn.execute("ALTER TABLE daily_analysis_stats DROP COLUMN cache_hit_tokens")
+        conn.execute("ALTER TABLE daily_analysis_stats DROP COLUMN cache_miss_tokens")
+
+    stats = Database(path).get_cache_stats()
+
+    assert [(item['role'], item['hit_tokens'], item['miss_tokens']) for item in stats] == [('proofreader', 300, 100)]
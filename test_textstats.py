@@ -0,0 +1,28 @@
+"""Тесты статистики текста"""
+
+import pytest
+
+from textstats import compute
+
+
+def test_preamble_belongs_to_first_chapter():
+    text = "Название романа\nЭпиграф из двух слов\nГлава 1\nОдин два три.\nГлава 2\nЧетыре пять."
+
+    assert compute(text)['chapters'] == [2 + 4 + 3, 2]
+
+
+def test_chapters_without_preamble():
+    text = "Глава 1\nОдин два три.\n***\nЧетыре пять."
+
+    assert compute(text)['chapters'] == [3, 2]
+
+
+def test_no_headings_no_chapters():
+    assert compute("Один два три.\nЧетыре пять.")['chapters'] == []
+
+
+def test_readability_uses_oborneva_coefficients():
+    # 2 предложения, 6 слов, 13 слогов
+    stats = compute("Мама мыла раму. Папа читал газету.")
+
+    assert stats['readability'] == pytest.approx(206.835 - 1.3 * 3 - 60.1 * 13 / 6)
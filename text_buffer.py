@@ -0,0 +1,121 @@
+"""
+Склейка длинных текстов, которые Telegram разбивает на несколько сообщений.
+
+Сообщения пользователя, пришедшие подряд в пределах окна ожидания, копятся
+в буфере и уходят на анализ одним заданием: по истечении окна или по кнопке «Готово».
+"""
+
+import asyncio
+import logging
+from typing import Dict, List, Callable, Awaitable, Any
+
+from config import MAX_TEXT_LENGTH, TEXT_BUFFER_DEBOUNCE
+
+logger = logging.getLogger(__name__)
+
+
+class TextBuffer:
+    """
+    Текст пользователя в виде списка фрагментов.
+
+    Фрагменты не склеиваются при каждом добавлении: строка собирается
+    один раз при отправке на анализ. После превышения лимита фрагменты
+    больше не сохраняются, учитывается только общая длина.
+    """
+
+    separator = '\n'
+
+    def __init__(self, limit: int = MAX_TEXT_LENGTH):
+        self.limit = limit
+        self.chunks: List[str] = []
+        self.length = 0
+        self.update = None
+        self.context = None
+
+    def append(self, text: str, update: Any = None, context: Any = None):
+        """Добавить сообщение в буфер"""
+        if self.chunks:
+            self.length += len(self.separator)
+        self.length += len(text)
+        if not self.overflow:
+            self.chunks.append(text)
+        self.update = update
+        self.context = context
+
+    @property
+    def overflow(self) -> bool:
+        return self.length > self.limit
+
+    @property
+    def parts(self) -> int:
+        return len(self.chunks)
+
+    def text(self) -> str:
+        return self.separator.join(self.chunks)
+
+
+FlushCallback = Callable[[Any, Any, TextBuffer], Awaitable[None]]
+
+
+class TextAccumulator:
+    """Буферы пользователей с отложенной отправкой (debounce)"""
+
+    def __init__(self, on_flush: FlushCallback, debounce: float = TEXT_BUFFER_DEBOUNCE):
+        self.on_flush = on_flush
+        self.debounce = debounce
+        self._buffers: Dict[int, TextBuffer] = {}
+        self._timers: Dict[int, asyncio.Task] = {}
+
+    def has_pending(self, user_id: int) -> bool:
+        return user_id in self._buffers
+
+    def add(self, user_id: int, text: str, update: Any, context: Any) -> TextBuffer:
+        """
+        Добавить сообщение пользователя и перезапустить окно ожидания
+
+        Returns:
+            TextBuffer: буфер пользователя после добавления
+        """
+        buffer = self._buffers.get(user_id)
+        if buffer is None:
+            buffer = self._buffers[user_id] = TextBuffer()
+        buffer.append(text, update, context)
+
+        self._cancel_timer(user_id)
+        self._timers[user_id] = asyncio.get_running_loop().create_task(self._flush_later(user_id))
+        return buffer
+
+    def discard(self, user_id: int):
+        """Отбросить накопленный текст пользователя"""
+        self._cancel_timer(user_id)
+        self._buffers.pop(user_id, None)
+
+    async def flush(self, user_id: int) -> bool:
+        """
+        Немедленно отправить накопленный текст на анализ
+
+        Returns:
+            bool: был ли буфер непустым
+        """
+        self._cancel_timer(user_id)
+        buffer = self._buffers.pop(user_id, None)
+        if buffer is None:
+            return False
+
+        try:
+            await self.on_flush(buffer.update, buffer.context, buffer)
+        except Exception as e:
+            logger.error(f"Ошибка обработки накопленного текста пользователя {user_id}: {e}")
+        return True
+
+    def _cancel_timer(self, user_id: int):
+        timer = self._timers.pop(user_id, None)
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+
+    async def _flush_later(self, user_id: int):
+        try:
+            await asyncio.sleep(self.debounce)
+        except asyncio.CancelledError:
+            return
+        await self.flush(user_id)
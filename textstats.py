@@ -0,0 +1,184 @@
+"""
+Статистика текста для редактора и бета-ридера.
+
+Длины предложений, доля диалогов, повторы слов рядом друг с другом, размеры
+глав и индекс удобочитаемости считаются локально за один проход по строкам
+текста: длины предложений копятся в гистограмме фиксированного размера, повторы
+ищутся в скользящем окне слов, поэтому время линейно, а память ограничена.
+
+Краткая сводка добавляется к запросу роли (модель не тратит на эти подсчеты
+токены ответа) и может сразу показываться автору, пока модель работает.
+Статистика считается для ролей с признаком "textstats" в каталоге и текстов
+не короче TEXTSTATS_MIN_LENGTH символов.
+"""
+
+import re
+from collections import Counter, deque
+from typing import Any, Dict
+
+import numpy as np
+
+from catalog import catalog
+from config import TEXTSTATS_MIN_LENGTH, TEXTSTATS_REPEAT_WINDOW, TEXTSTATS_TOP_REPEATS
+
+# Предложения длиннее попадают в последний столбец гистограммы
+MAX_SENTENCE_WORDS = 100
+LONG_SENTENCE_WORDS = 40
+
+_LINE = re.compile(r'[^\n]+')
+_WORD = re.compile(r'[^\W\d_]+(?:-[^\W\d_]+)*')
+_VOWELS = re.compile(r'[аеёиоуыэюяaeiouy]', re.IGNORECASE)
+_SENTENCE_END = re.compile(r'(?<=[.!?…])\s+')
+_DIALOGUE = re.compile(r'^[—–-]\s')
+_HEADING = re.compile(
+    r'^(?:(?:глава|часть|пролог|эпилог|chapter)\b.{0,60}|[IVXLC]+\.?|\d{1,3}\.?|\*(?:\s*\*){2,})$',
+    re.IGNORECASE
+)
+
+# Для повторов учитываются слова не короче пяти букв; сравнивается начало слова,
+# чтобы формы одного слова (глаза, глазами) считались повтором
+_REPEAT_MIN_LENGTH = 5
+_REPEAT_PREFIX = 6
+
+# Оценка удобочитаемости: формула Флеша в адаптации Обороневой для русского языка,
+# 206.835 - 1.3 * (слов в предложении) - 60.1 * (слогов в слове). Адаптация
+# приводит русские тексты к шкале Флеша, поэтому границы уровней - обычные для нее
+# (60-70 - стандартный текст, 30-50 - сложный, ниже 30 - очень сложный)
+_READABILITY_BASE = 206.835
+_READABILITY_SENTENCE = 1.3
+_READABILITY_WORD = 60.1
+_READABILITY_LEVELS = ((70, "легко"), (50, "средне"), (30, "сложно"), (float('-inf'), "очень сложно"))
+
+MODEL_NOTE_HEADER = "Статистика текста посчитана автоматически, используй ее и не пересчитывай сам:\n"
+
+
+def compute(text: str) -> Dict[str, Any]:
+    """Статистика текста за один проход"""
+    histogram = np.zeros(MAX_SENTENCE_WORDS + 1, dtype=np.int64)
+    words = syllables = paragraphs = dialogue = 0
+    # Номер непустой строки: нумерация [§N] как в отчетах корректора
+    number = 0
+    chapters = []
+    chapter_words = 0
+    heading_seen = False
+
+    window = deque(maxlen=TEXTSTATS_REPEAT_WINDOW)
+    window_counts: Counter = Counter()
+    repeats: Counter = Counter()
+    repeat_places: Dict[str, tuple] = {}
+
+    for match in _LINE.finditer(text):
+        line = match.group().strip()
+        if not line:
+            continue
+        number += 1
+        if _HEADING.match(line):
+            # Текст до первого заголовка (название, эпиграф) относится к первой главе
+            if heading_seen and chapter_words:
+                chapters.append(chapter_words)
+                chapter_words = 0
+            heading_seen = True
+            continue
+
+        paragraphs += 1
+        if _DIALOGUE.match(line) or line.startswith('«'):
+            dialogue += 1
+
+        sentence_lengths = [len(_WORD.findall(sentence)) for sentence in _SENTENCE_END.split(line)]
+        lengths = np.minimum(np.array(sentence_lengths, dtype=np.int64), MAX_SENTENCE_WORDS)
+        histogram += np.bincount(lengths[lengths > 0], minlength=MAX_SENTENCE_WORDS + 1)
+
+        line_words = _WORD.findall(line)
+        words += len(line_words)
+        chapter_words += len(line_words)
+        syllables += len(_VOWELS.findall(line))
+
+        line_repeats: Counter = Counter()
+        for word in line_words:
+            if len(word) < _REPEAT_MIN_LENGTH:
+                continue
+            key = word.lower()[:_REPEAT_PREFIX]
+            if window_counts[key]:
+                line_repeats[key] += 1
+            if len(window) == window.maxlen:
+                window_counts[window[0]] -= 1
+            window.append(key)
+            window_counts[key] += 1
+        for key, count in line_repeats.items():
+            repeats[key] += count
+            # Абзац, где слово повторяется чаще всего
+            if count > repeat_places.get(key, (0, 0))[1]:
+                repeat_places[key] = (number, count)
+
+    if heading_seen and chapter_words:
+        chapters.append(chapter_words)
+
+    sentences = int(histogram.sum())
+    stats = {
+        'words': words,
+        'sentences': sentences,
+        'paragraphs': paragraphs,
+        'dialogue_share': dialogue / paragraphs if paragraphs else 0.0,
+        'chapters': chapters,
+        'repeats': [
+            (key, count, repeat_places[key][0]) for key, count in repeats.most_common(TEXTSTATS_TOP_REPEATS)
+        ],
+    }
+    if sentences:
+        cumulative = np.cumsum(histogram)
+        stats['sentence_median'] = int(np.searchsorted(cumulative, sentences * 0.5))
+        stats['sentence_p90'] = int(np.searchsorted(cumulative, sentences * 0.9))
+        stats['long_sentences'] = int(histogram[LONG_SENTENCE_WORDS + 1:].sum())
+    if sentences and words:
+        stats['readability'] = (
+            _READABILITY_BASE
+            - _READABILITY_SENTENCE * (words / sentences)
+            - _READABILITY_WORD * (syllables / words)
+        )
+    return stats
+
+
+def _readability_level(score: float) -> str:
+    for threshold, level in _READABILITY_LEVELS:
+        if score >= threshold:
+            return level
+
+
+def summary_lines(stats: Dict[str, Any]) -> list:
+    """Строки сводки, общие для автора и модели"""
+    lines = [f"слов {stats['words']:,}, предложений {stats['sentences']:,}, абзацев {stats['paragraphs']:,}"]
+    if stats['sentences']:
+        lines.append(
+            f"длина предложений в словах: медиана {stats['sentence_median']}, 90% не длиннее "
+            f"{stats['sentence_p90']}, длиннее {LONG_SENTENCE_WORDS}: {stats['long_sentences']}"
+        )
+    lines.append(f"диалоги: {stats['dialogue_share']:.0%} абзацев")
+    if stats['chapters']:
+        sizes = ", ".join(f"{size:,}" for size in stats['chapters'])
+        lines.append(f"главы: {len(stats['chapters'])}, слов в главах: {sizes}")
+    if 'readability' in stats:
+        lines.append(
+            f"удобочитаемость (Флеш-Оборнева): {stats['readability']:.0f} - "
+            f"{_readability_level(stats['readability'])}"
+        )
+    if stats['repeats']:
+        repeats = ", ".join(f"«{key}…» ×{count} (чаще всего в §{place})" for key, count, place in stats['repeats'])
+        lines.append(f"повторы слов рядом: {repeats}")
+    return lines
+
+
+def format_report(stats: Dict[str, Any]) -> str:
+    """Сводка для автора"""
+    lines = "\n".join(f"• {line}" for line in summary_lines(stats))
+    return f"{catalog.text('textstats_header')}\n\n{lines}"
+
+
+def model_note(stats: Dict[str, Any]) -> str:
+    """Сводка для модели перед инструкцией"""
+    lines = "\n".join(f"- {line}" for line in summary_lines(stats))
+    return f"{MODEL_NOTE_HEADER}{lines}\n\n"
+
+
+def enabled_for(role_key: str, text: str) -> bool:
+    role = catalog.current().roles.get(role_key)
+    return bool(role and role.get('textstats')) and len(text) >= TEXTSTATS_MIN_LENGTH